@@ -1,52 +1,51 @@
 # -*- coding: utf-8 -*-
 
-import csv
+import concurrent.futures
 import io
 import logging
 import os
 import threading
 import time
 
-import cxnstr
 import greenlet
-import pymysql
-import pymysql.constants.FIELD_TYPE as FT
 import pynvim
-import six
 
-import nvim_mysql.autocomplete
+# pymysql, cxnstr and nvim_mysql.autocomplete (which pulls in sqlparse) are
+# imported where they're first needed, so that sessions that never connect
+# to a server don't pay for loading them when the plugin host starts.
+import nvim_mysql.parallel
+import nvim_mysql.pool
+import nvim_mysql.querylog
+import nvim_mysql.results
+import nvim_mysql.schema
 import nvim_mysql.util
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-NUMERIC_TYPES = [
-    FT.DECIMAL,
-    FT.TINY,
-    FT.SHORT,
-    FT.LONG,
-    FT.FLOAT,
-    FT.DOUBLE,
-    FT.LONGLONG,
-    FT.INT24,
-    FT.NEWDECIMAL,
-]
-
-DATE_TYPES = [
-    FT.TIMESTAMP,
-    FT.DATE,
-    FT.TIME,
-    FT.DATETIME,
-    FT.YEAR,
-    FT.NEWDATE,
-]
-
 OPTION_DEFAULTS = {
     'aliases': None,
+    'aux_connections': 2,
     'auto_close_results': 0,
     'aux_window_pref': 'results',
+    'connect_timeout': 10,
+    'disk_results_threshold': 256,
+    'max_jobs': 4,
+    'parallel_connections': 4,
+    'parallel_reads': 0,
+    'persist_schema': 1,
+    'query_log': 1,
+    'query_log_size': 16,
+    'query_log_text': 0,
+    'results_cache_size': 64,
+    'results_history_memory': 256,
+    'results_history_size': 20,
+    'schema_cache_ttl': 300,
+    'schema_prefetch': 1,
+    'stream_results': 1,
     'use_spinner': 1,
+    'virtual_results_threshold': 10000,
 }
 
 KEYMAPS = {
@@ -67,185 +66,90 @@ KEYMAPS = {
     'MySQLShowResults table': {'buffers': ['results'], 'mode': 'n', 'key': '<leader>t'},
     'MySQLShowResults vertical': {'buffers': ['results'], 'mode': 'n', 'key': '<leader>G'},
     'MySQLFreezeResultsHeader': {'buffers': ['results'], 'mode': 'n', 'key': '<leader>f'},
+    'MySQLPreviousResults': {'buffers': ['results'], 'mode': 'n', 'key': '<leader>p'},
+    'MySQLNextResults': {'buffers': ['results'], 'mode': 'n', 'key': '<leader>n'},
 
     'MySQLTreeToggleDatabase': {'buffers': ['tree'], 'mode': 'n', 'key': '<space>'},
+    'MySQLTreeFilter': {'buffers': ['tree'], 'mode': 'n', 'key': '/'},
 }
 
 SPINNER_CHARS = u"⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
 
+# When streaming results, the first chunk is kept small so that something
+# shows up right away; later chunks are bigger to cut down on RPC calls.
+STREAM_FIRST_CHUNK_SIZE = 100
+STREAM_CHUNK_SIZE = 5000
+
+# Large result sets are written to the results buffer this many screenfuls
+# at a time.
+RESULTS_PAGE_SCREENS = 3
+
+# While running a sequence of queries, the worker sends their outcomes back
+# to the main loop at most this often (in seconds).
+DELIVERY_INTERVAL = 0.1
+
 
 class NvimMySQLError(Exception):
     pass
 
 
-def render_map_command(command_name, vim=None):
+# Expression that evaluates to the user's keymap overrides.
+USER_KEYMAPS_EXPR = "get(g:, 'nvim_mysql#keymaps', {})"
+
+
+def render_map_command(command_name, user_keymaps=None):
     """
     >>> render_map_command('MySQLKillQuery')
     'nnoremap <buffer> K :MySQLKillQuery<cr>'
+    >>> render_map_command('MySQLKillQuery', {'MySQLKillQuery': '<leader>k'})
+    'nnoremap <buffer> <leader>k :MySQLKillQuery<cr>'
     """
     keymap_data = KEYMAPS[command_name].copy()
-    if vim:
-        user_keymaps = vim.vars.get('nvim_mysql#keymaps')
-        if user_keymaps and command_name in user_keymaps:
-            keymap_data['key'] = user_keymaps[command_name]
+    if user_keymaps and command_name in user_keymaps:
+        keymap_data['key'] = user_keymaps[command_name]
     return "{mode}noremap <buffer> {key} :{command_name}<cr>".format(command_name=command_name, **keymap_data)
 
 
-def render_map_commands_for_buffer_type(buffer_type, vim=None):
-    return [render_map_command(c, vim) for c, k in KEYMAPS.items() if buffer_type in k['buffers']]
-
-
-def prepend_type_hints_to_header(header, types):
-    for i, t in enumerate(types):
-        if t in NUMERIC_TYPES:
-            header[i] = '#' + header[i]
-        elif t in DATE_TYPES:
-            header[i] = '@' + header[i]
-
-
-def display_value(v):
-    """Return the value to display for one particular cell/value."""
-    if v is None:
-        v = u'NULL'
-    elif isinstance(v, bytes):
-        try:
-            v = v.decode('utf-8')
-            v = ' '.join(v.splitlines())
-        except UnicodeDecodeError:
-            if six.PY3:
-                v = '0x' + v.hex()
-            else:
-                v = '0x' + v.encode('hex')
-    else:
-        v = six.text_type(v)
-        v = ' '.join(v.splitlines())
-    return v
+def render_map_commands_for_buffer_type(buffer_type, user_keymaps=None):
+    return [render_map_command(c, user_keymaps) for c, k in KEYMAPS.items() if buffer_type in k['buffers']]
 
 
-def results_to_table(header, rows, types=None):
-    """Format query result set as an ASCII table.
+def query_buffer_calls(buffer, user_keymaps=None):
+    """Return the API calls (see util.call_atomic) that set up buffer as a query buffer.
 
-    If a list of field types is provided (from cursor.description), type hints
-    will be added to the headers.
+    buffer may be a buffer number, or 0 for the current buffer. No buffer
+    has to be switched to.
 
-    Return a list of strings.
+    >>> for call in query_buffer_calls(3)[:2]:
+    ...     print(call)
+    ['nvim_buf_set_option', [3, 'completefunc', 'MySQLComplete']]
+    ['nvim_buf_set_keymap', [3, 'n', '<leader>x', ':MySQLExecQueryUnderCursor<cr>', {'noremap': True}]]
     """
-    header = header[:]
-    if types:
-        prepend_type_hints_to_header(header, types)
-
-    col_lengths = [max([len(display_value(r)) for r in col]) for col in zip(header, *rows)]
-
-    # Table elements.
-    horizontal_bar = '+' + '+'.join(['-' * (l + 2) for l in col_lengths]) + '+'
-    def table_row(row):
-        # Return a database row formatted as a table row.
-        return '|' + '|'.join(
-            [u' {:{}} '.format(display_value(v), l) for v, l in zip(row, col_lengths)]) + '|'
-
-    return [
-        horizontal_bar,
-        table_row(header),
-        horizontal_bar,
-    ] + [table_row(r) for r in rows] + [
-        horizontal_bar
-    ]
-
-
-def results_to_vertical(header, rows, types=None):
-    """Format query result set as a series of field: value lines.
-
-    Each row will span len(row) lines.
-
-    If a list of field types is provided (from cursor.description), type hints
-    will be added to the headers.
-
-    Return a list of strings.
-    """
-    header = header[:]
-    if types:
-        prepend_type_hints_to_header(header, types)
-
-    header_lengths = [len(h) for h in header]
-    max_header_length = max(header_lengths)
-    header_strs = ['{{:>{}}}'.format(max_header_length + 1).format(header[i]) for i in range(len(header))]
-
-    output = []
-    for i, row in enumerate(rows, 1):
-        if len(rows) > 1:
-            output.append('***** row {} *****'.format(i))
-
-        for j, v in enumerate(row):
-            output.append('{}: {}'.format(header_strs[j], display_value(v)))
-
-        if len(rows) > 1 and i < len(rows):
-            output.append('')
-
-    return output
-
-
-def results_to_csv(header, rows):
-    """Format query result set as a CSV file.
-
-    Note that CSV is a text format, so binary data that is not valid utf-8 will
-    cause an error.
-    """
-    # In Python 2, the csv module can't accept unicode, so we have to give it UTF-8.
-    # In Python 3, the csv module accepts unicode.
-    def output_value(v):
-        if six.PY3:
-            if isinstance(v, bytes):
-                return v.decode('utf-8')
-        else:
-            if isinstance(v, unicode):
-                return v.encode('utf-8')
-        return v
-
-    f = six.StringIO()
-    csv_out = csv.writer(f)
-    csv_out.writerow([output_value(v) for v in header])
-    for row in rows:
-        csv_out.writerow([output_value(v) for v in row])
-    return f.getvalue().splitlines()
-
-
-def format_results(results, format_='table', metadata=None):
-    if metadata is None:
-        metadata = {}
-
-    if results['type'] == 'read':
-        if format_ == 'table':
-            lines = results_to_table(results['header'], results['rows'], results['types'])
-            lines.extend(["", "{} row(s) in set, {} col(s)".format(results['count'], len(results['header']))])
-        elif format_ == 'csv':
-            lines = results_to_csv(results['header'], results['rows'])
-        elif format_ == 'raw_column':
-            lines = '\n'.join([str(r[0]) for r in results['rows']]).splitlines()
-        elif format_ == 'vertical':
-            lines = results_to_vertical(results['header'], results['rows'], results['types'])
-        else:
-            raise ValueError("Invalid results format '{}'".format(format_))
-    elif results['type'] == 'write':
-        lines = ["", "{} row(s) affected".format(results['count'])]
-    elif results['type'] == 'error':
-        lines = results['message'].splitlines()
-
-    if format_ == 'table':
-        duration = metadata.get('duration')
-        if duration is not None and results['type'] in ['read', 'write']:
-            lines[-1] += " ({:.2f} sec)".format(duration)
-
-        warnings = results.get('warnings')
-        if warnings:
-            lines.extend(['', '[warnings]:'])
-            for warning in warnings:
-                lines.append("({}) {}".format(warning[1], warning[2]))
-
-        query = metadata.get('query')
-        if query is not None:
-            lines.extend(['', '---', ''] + query.splitlines())
-
-    return lines
+    calls = [['nvim_buf_set_option', [buffer, 'completefunc', 'MySQLComplete']]]
+    for command_name, keymap_data in KEYMAPS.items():
+        if 'query' in keymap_data['buffers']:
+            key = (user_keymaps or {}).get(command_name, keymap_data['key'])
+            rhs = ":{}<cr>".format(command_name)
+            calls.append(['nvim_buf_set_keymap', [buffer, keymap_data['mode'], key, rhs, {'noremap': True}]])
+    return calls
+
+
+def query_results(query_result):
+    """Return the results to show for a single query that ran successfully."""
+    if not query_result['description']:
+        return {
+            'type': 'write',
+            'count': query_result['rowcount'],
+            'warnings': query_result['warnings'],
+            'timings': query_result['timings'],
+        }
+    return {
+        'type': 'read',
+        'data': query_result['data'],
+        'count': query_result['rowcount'],
+        'warnings': query_result['warnings'],
+        'timings': query_result['timings'],
+    }
 
 
 class MySQLTab(object):
@@ -263,63 +167,105 @@ class MySQLTab(object):
         self.conn = None
         self.connection_string = None
         self.server_name = None
+        self.aux_pool = None
+        self.query_log_path = None
         self.status = {
             'executing': False,
             'killing': False,
+            'connecting': False,
             'results_pending': False,
         }
+        self.status_flag = ''
+        self.jobs = {}  # {job id: Job}, for queries that are running
+        self.next_job_id = 1
+        # Jobs run on these long-lived worker threads; any more than
+        # max_jobs wait their turn.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.mysql.get_option('max_jobs'))
+        self.parallel_executor = None
+        self.closed = False
         self.results = None
+        self.next_results_id = 1
         self.query = None
         self.query_start = None
         self.query_end = None
         self.results_buffer = self._initialize_results_buffer()
         self.results_format = None
+        self.results_view = None
+        self.results_view_id = None  # id of the results that results_view is of
+        self.results_cache = nvim_mysql.results.ResultsViewCache(
+            self.mysql.get_option('results_cache_size') * 1024 * 1024)
+        self.history = nvim_mysql.results.ResultsHistory(
+            self.mysql.get_option('results_history_size'),
+            self.mysql.get_option('results_history_memory') * 1024 * 1024,
+            on_release=self.release_results)
+        self.streaming_job = None  # id of the job whose rows are being streamed
+        self.stream_col_lengths = None
+        self.streamed_count = 0
+        self.schema = nvim_mysql.schema.SchemaCache(self.mysql.get_option('schema_cache_ttl'))
+        self.temporary_tables = set()  # names of temporary tables created in this tab
         self.tree = Tree(self)
         self.tree_buffer = self._initialize_tree_buffer()
+        self.tree_fetching = False
+        self.tree_fetch_again = False
+        self.schema_prefetch = None  # pool of the schema prefetch that is running, if any
 
-    def _initialize_results_buffer(self):
-        cur_buf = self.vim.current.buffer
-
-        # Create
-        buf_name = "Results{}".format(self.autoid)
-        self.vim.command("badd {}".format(buf_name))
-
-        # Set up
-        results_buffer = list(self.vim.buffers)[-1]
-        self.vim.command("b! {}".format(results_buffer.number))
-        self.vim.command("setl buftype=nofile bufhidden=hide nowrap nonu noswapfile nostartofline")
-        self.vim.command("nnoremap <buffer> <S-Left> zH")
-        self.vim.command("nnoremap <buffer> <S-Right> zL")
-        # close window and go to previous
-        self.vim.command("nnoremap <buffer> <silent> q :let nr = winnr() <Bar> :wincmd p <Bar> :exe nr . \"wincmd c\"<CR>")
-        for map_command in render_map_commands_for_buffer_type('results', self.vim):
-            self.vim.command(map_command)
+    def _create_aux_buffer(self, buf_name, setup_commands, feature):
+        """Create a scratch buffer named buf_name and run setup_commands in it.
 
-        # Switch back
-        self.vim.command("b! {}".format(cur_buf.number))
+        setup_commands is a function that's given the user's keymap overrides
+        and whether the (autocommand event) feature exists, and returns the
+        commands to run. This takes two requests, however many commands
+        there are.
+        """
+        cur_buf, buf, user_keymaps, has_feature = nvim_mysql.util.call_atomic(self.vim, [
+            ['nvim_get_current_buf', []],
+            ['nvim_create_buf', [True, True]],
+            ['nvim_eval', [USER_KEYMAPS_EXPR]],
+            ['nvim_call_function', ['exists', [feature]]],
+        ])
+        nvim_mysql.util.call_atomic(self.vim, [['nvim_buf_set_name', [buf, buf_name]]] + [
+            ['nvim_command', [command]] for command in
+            ["b! {}".format(buf.number)] + setup_commands(user_keymaps, has_feature) + ["b! {}".format(cur_buf.number)]
+        ])
+        return buf
 
-        return results_buffer
+    def _initialize_results_buffer(self):
+        def setup_commands(user_keymaps, has_win_scrolled):
+            commands = [
+                "setl buftype=nofile bufhidden=hide nowrap nonu noswapfile nostartofline",
+                "nnoremap <buffer> <S-Left> zH",
+                "nnoremap <buffer> <S-Right> zL",
+                # close window and go to previous
+                "nnoremap <buffer> <silent> q :let nr = winnr() <Bar> :wincmd p <Bar> :exe nr . \"wincmd c\"<CR>",
+            ]
+            commands.extend(render_map_commands_for_buffer_type('results', user_keymaps))
+            # load more of a large result set when scrolling near the end
+            events = 'CursorMoved,WinScrolled' if has_win_scrolled else 'CursorMoved'
+            commands.extend([
+                "let b:nvim_mysql_more = 0",
+                "autocmd {} <buffer> if b:nvim_mysql_more && line('w$') + winheight(0) >= line('$') "
+                "| call MySQLLoadMoreResults(winheight(0)) | endif".format(events),
+            ])
+            return commands
+
+        return self._create_aux_buffer("Results{}".format(self.autoid), setup_commands, '##WinScrolled')
 
     def _initialize_tree_buffer(self):
-        cur_buf = self.vim.current.buffer
-
-        # Create
-        buf_name = "Tree{}".format(self.autoid)
-        self.vim.command("badd {}".format(buf_name))
-
-        # Set up
-        tree_buffer = list(self.vim.buffers)[-1]
-        self.vim.command("b! {}".format(tree_buffer.number))
-        self.vim.command("setl buftype=nofile bufhidden=hide nowrap nonu noswapfile")
-        self.vim.command("nnoremap <buffer> <silent> q :let nr = winnr() <Bar> :wincmd p <Bar> :exe nr . \"wincmd c\"<CR>")
-        for map_command in render_map_commands_for_buffer_type('tree', self.vim):
-            self.vim.command(map_command)
-        self.vim.command("syn match Directory /^[^ ].*/")
-
-        # Switch back
-        self.vim.command("b! {}".format(cur_buf.number))
-
-        return tree_buffer
+        def setup_commands(user_keymaps, has_cmdline_changed):
+            commands = [
+                "setl buftype=nofile bufhidden=hide nowrap nonu noswapfile",
+                "nnoremap <buffer> <silent> q :let nr = winnr() <Bar> :wincmd p <Bar> :exe nr . \"wincmd c\"<CR>",
+            ]
+            commands.extend(render_map_commands_for_buffer_type('tree', user_keymaps))
+            commands.append("syn match Directory /^[^ ].*/")
+            # filter the tree as the filter is typed (see MySQLTreeFilter)
+            if has_cmdline_changed:
+                commands.append(
+                    "autocmd CmdlineChanged <buffer> if getcmdtype() == '@' "
+                    "| call MySQLTreeFilterUpdate(getcmdline()) | endif")
+            return commands
+
+        return self._create_aux_buffer("Tree{}".format(self.autoid), setup_commands, '##CmdlineChanged')
 
     def set_connection(self, conn, connection_string, server_name):
         """Set this MySQL tab's database connection to conn."""
@@ -328,11 +274,131 @@ class MySQLTab(object):
         self.conn = conn
         self.connection_string = connection_string
         self.server_name = server_name
+        if self.aux_pool is not None:
+            self.aux_pool.close()
+        import cxnstr
+        import pymysql
+        db_params = cxnstr.to_dict(connection_string)
+        db_params.setdefault('connect_timeout', self.mysql.get_option('connect_timeout'))
+        # Jobs run on these as well as on the primary connection, so they
+        # must behave the same way (see MySQL.connect).
+        self.aux_pool = nvim_mysql.pool.ConnectionPool(
+            lambda: pymysql.connect(use_unicode=True, autocommit=True, **db_params),
+            self.mysql.get_option('aux_connections'))
+        self.schema.invalidate()
+        self.temporary_tables = set()
+        self.schema.default_database = conn.db.decode('utf-8') if isinstance(conn.db, bytes) else conn.db
         self.tabpage.vars['MySQLServer'] = server_name
 
+        # The tree is filled in once the databases have been fetched (see
+        # refresh_tree).
         self.tree = Tree(self)
-        self.tree.refresh_data()
-        self.tree_buffer[:] = self.tree.render()
+        self.tree_buffer[:] = []
+
+    def start_schema_prefetch(self, persist_path=None):
+        """Load the names of all databases, tables and columns in the background.
+
+        This uses an auxiliary connection, so the tab can be used as usual in
+        the meantime (and the connection is left in the pool for later use).
+
+        If persist_path is given, names saved there by a previous session are
+        loaded first (so they can be used right away), then revalidated
+        against the server and saved again if they have changed.
+
+        The tree is built from these names, refreshed as they arrive, rather
+        than fetching them itself (see refresh_tree).
+        """
+        aux_pool = self.aux_pool
+        self.schema_prefetch = aux_pool
+
+        def update_tree():
+            if self.aux_pool is aux_pool and not self.closed:
+                self.refresh_tree()
+
+        def progress():
+            self.vim.async_call(update_tree)
+
+        def done():
+            if self.schema_prefetch is aux_pool:
+                self.schema_prefetch = None
+                update_tree()
+
+        def prefetch():
+            try:
+                if persist_path is not None and self.schema.load(persist_path):
+                    progress()
+                with aux_pool.connection() as conn:
+                    if persist_path is not None:
+                        nvim_mysql.schema.revalidate(self.schema, conn, persist_path, progress)
+                    else:
+                        nvim_mysql.schema.prefetch(self.schema, conn, progress=progress)
+            except Exception:
+                logger.exception("schema prefetch failed")
+            self.vim.async_call(done)
+
+        t = threading.Thread(target=prefetch)
+        t.daemon = True
+        t.start()
+
+    def refresh_tree(self):
+        """Show the tree as of the schema cache right away.
+
+        If anything the tree needs isn't cached (or is stale), it is fetched
+        in the background, and the tree is shown again once it arrives. While
+        the schema is being prefetched, it's left to the prefetch, which
+        refreshes the tree as it goes, and again once it's done.
+        """
+        if self.tree.refresh_data() and self.schema_prefetch is None:
+            self.fetch_tree()
+        self.render_tree()
+
+    def fetch_tree(self):
+        """Fetch what the tree needs into the schema cache, in the background."""
+        if self.tree_fetching:
+            self.tree_fetch_again = True
+            return
+        self.tree_fetching = True
+        self.tree_fetch_again = False
+        aux_pool = self.aux_pool
+        tree = self.tree
+
+        def fetch():
+            try:
+                with aux_pool.connection() as conn:
+                    tree.fetch(conn.cursor)
+            except Exception:
+                logger.exception("could not fetch tree data")
+            self.vim.async_call(fetched)
+
+        def fetched():
+            self.tree_fetching = False
+            if tree is not self.tree:
+                # The tab reconnected while this was running; fetch for the
+                # new tree if it asked to in the meantime.
+                if self.tree_fetch_again:
+                    self.fetch_tree()
+                return
+            if self.tree.refresh_data() and self.tree_fetch_again:
+                self.fetch_tree()
+            self.render_tree()
+
+        t = threading.Thread(target=fetch)
+        t.daemon = True
+        t.start()
+
+    def filter_tree(self, text):
+        """Only show tables whose names contain text in the tree."""
+        self.tree.set_filter(text)
+        self.refresh_tree()
+
+    def render_tree(self):
+        """Write the tree to the tree buffer, changing only the lines that differ."""
+        lines = self.tree.render()
+        if self.tree.lines and lines and len(self.tree_buffer) == len(self.tree.lines):
+            nvim_mysql.util.update_lines(self.tree_buffer, self.tree.lines, lines)
+        else:
+            self.tree_buffer[:] = lines
+        self.tree.lines = lines
 
     def update_status(self, **kwargs):
         """Set one or more status flags for this tab.
@@ -353,15 +419,20 @@ class MySQLTab(object):
             status_flag = 'k'
         elif self.status['executing']:
             status_flag = 'e'
+        elif self.status['connecting']:
+            status_flag = 'c'
         elif self.status['results_pending']:
             status_flag = 'r'
         logger.debug("status flag: {}".format(status_flag))
+        self.status_flag = status_flag
         self.tabpage.vars['MySQLStatusFlag'] = status_flag
+        self.tabpage.vars['MySQLJobs'] = ' '.join(str(job_id) for job_id in sorted(self.jobs))
 
+        self.mysql.update_spinner()
         self.mysql.refresh_tabline()
 
     def execute_queries(self, queries, combine_results):
-        """Sequentially execute the given queries in this tab.
+        """Sequentially execute the given queries in this tab, as a new job.
 
         If there is an error, execution will stop and the error will be
         displayed.
@@ -371,95 +442,530 @@ class MySQLTab(object):
         these counts pertain only to "write" queries.) If
         combine_results is False, the results of the last query are
         shown.
-        """
-        # Ignore if a query is already running.
-        if self.status['executing']:
-            return
 
+        Jobs run on the tab's primary connection if it is free, and on a
+        connection from the auxiliary pool otherwise, so a long-running job
+        doesn't hold up others. The results of each job get their own entry
+        in the results history, in the order the jobs finish.
+        """
         gr = greenlet.getcurrent()
-        cursor = self.conn.cursor()
 
-        def query_done():
-            logger.debug("query_done called")
+        job = self.start_job(queries)
+        logger.debug("starting job {} on {} connection".format(job.id, 'primary' if job.primary else 'auxiliary'))
+
+        # Stream rows from an unbuffered cursor when we'll be displaying the
+        # rows of a single query (combined results only show counts). Only
+        # one job streams into the results buffer at a time; that's decided
+        # on the main thread, by stream_rows.
+        stream = not combine_results and bool(self.mysql.get_option('stream_results'))
+        # Rows that are kept are read from an unbuffered cursor whether or
+        # not they're streamed, so that big result sets can be moved to disk
+        # as they arrive (see fetch_rows) instead of being read into memory
+        # all at once by execute().
+        import pymysql.cursors
+        cursor_class = None if combine_results else pymysql.cursors.SSCursor
+        cursors = []
+
+        def get_cursor():
+            # Called from the worker thread, so that taking a connection from
+            # the pool (which may mean connecting) doesn't block.
+            if not cursors:
+                if job.conn is None:
+                    job.conn = job.pool.acquire()
+                cursors.append(job.conn.cursor(cursor_class))
+            return cursors[0]
+
+        # Auxiliary connections don't share the primary connection's
+        # session, so at least start them off in the same database.
+        database = None if job.primary else self.schema.default_database
+
+        def deliver(outcomes):
+            logger.debug("{} query outcome(s) delivered".format(len(outcomes)))
             gr.parent = greenlet.getcurrent()
-            gr.switch()
-
-        def run_query(query, result):
-            logger.debug("run_query called")
+            gr.switch(outcomes)
+
+        # Result sets bigger than this are moved to disk as they are fetched.
+        disk_threshold = self.mysql.get_option('disk_results_threshold') * 1024 * 1024
+
+        def fetch_rows(result):
+            # When streaming, only start displaying rows if there are more to
+            # come; small result sets are shown all at once as usual.
+            cursor = get_cursor()
+            data = result['data']
+            size = STREAM_FIRST_CHUNK_SIZE if stream else STREAM_CHUNK_SIZE
+            streaming = False
+            while True:
+                chunk = cursor.fetchmany(size)
+                start = len(data)
+                data.append_rows(chunk)
+                if not data.on_disk and data.nbytes() > disk_threshold:
+                    logger.debug("result set is over {} bytes, moving to disk".format(disk_threshold))
+                    data = result['data'] = data.to_disk()
+                if stream and chunk and (len(chunk) == size or streaming):
+                    streaming = True
+                    self.vim.async_call(self.stream_rows, job.id, data, start, len(data))
+                if len(chunk) < size:
+                    break
+                size = STREAM_CHUNK_SIZE
+
+        def run_query(query):
+            logger.debug("executing query: {}".format(query))
+            result = {'start': time.time()}
             try:
+                cursor = get_cursor()
+                start = time.time()
+                # Unbuffered cursors return as soon as the first packet of
+                # results arrives; buffered ones (used when results are
+                # combined) read every row.
                 cursor.execute(query)
+                first_byte = time.time()
                 result['description'] = cursor.description
-                result['rowcount'] = cursor.rowcount
-                result['rows'] = cursor.fetchall()
+                if cursor.description and not combine_results:
+                    header = [f[0] for f in cursor.description]
+                    types = [f[1] for f in cursor.description]
+                    result['data'] = nvim_mysql.results.ResultSet(header, types)
+                    fetch_rows(result)
+                    result['rowcount'] = len(result['data'])
+                else:
+                    result['rowcount'] = cursor.rowcount
+                    cursor.fetchall()
+                fetched = time.time()
 
                 cursor.execute("show warnings")
                 result['warnings'] = cursor.fetchall()
+                result['timings'] = {
+                    'first_byte': first_byte - start,
+                    'fetch': fetched - first_byte,
+                    'warnings': time.time() - fetched,
+                }
             except Exception as e:
                 result['error'] = "Error: " + repr(e)
             else:
                 result['error'] = None
+            result['end'] = time.time()
+            return result
+
+        def run_queries():
+            # Runs on the tab's executor. Outcomes are sent back to the main
+            # loop in batches rather than one statement at a time, and the
+            # last batch ends with None.
+            outcomes = []
+            last_delivery = time.time()
+            try:
+                if database is not None:
+                    get_cursor()
+                    job.conn.select_db(database)
+                for query in queries:
+                    if self.closed:
+                        break
+                    query_result = run_query(query)
+                    outcomes.append((query, query_result))
+                    if query_result['error']:
+                        break
+                    if time.time() - last_delivery >= DELIVERY_INTERVAL:
+                        self.vim.async_call(deliver, outcomes)
+                        outcomes = []
+                        last_delivery = time.time()
+            except Exception as e:
+                outcomes.append((None, {'error': "Error: " + repr(e)}))
+            finally:
+                outcomes.append(None)
+                self.vim.async_call(deliver, outcomes)
 
-            self.vim.async_call(query_done)
-
+        query_text = ''
         if combine_results:
-            self.query = ''
-            self.results = {'type': 'write', 'count': 0, 'warnings': []}
+            results = {'type': 'write', 'count': 0, 'warnings': [], 'timings': {}}
+
+        query_start = time.time()
+        self.executor.submit(run_queries)
+        outcomes = []
+        log_entries = []
+        while not outcomes or outcomes[-1] is not None:
+            outcomes = gr.parent.switch()
+            for query, query_result in filter(None, outcomes):
+                if query is not None:
+                    log_entries.append(self.query_log_entry(query, query_result))
+                    if combine_results:
+                        if query_text:
+                            query_text += '\n\n'
+                        query_text += query
+                    else:
+                        query_text = query
+
+                    if nvim_mysql.schema.is_ddl(query):
+                        self.schema.invalidate()
+                    elif nvim_mysql.schema.is_use(query) and not query_result['error'] and job.primary:
+                        self.schema.default_database = nvim_mysql.schema.used_database(query)
+                        self.schema.forget_unqualified()
+                    self.note_temporary_table(query, query_result)
+
+                if query_result['error']:
+                    # This is the last outcome; the worker stops at an error.
+                    results = {'type': 'error', 'message': query_result['error']}
+                elif combine_results:
+                    # for "write" queries, add to count
+                    if not query_result['description']:
+                        results['count'] += query_result['rowcount']
+                    results['warnings'].extend(query_result['warnings'])
+                    for stage, seconds in query_result['timings'].items():
+                        results['timings'][stage] = results['timings'].get(stage, 0) + seconds
+                else:
+                    results = query_results(query_result)
+
+        query_end = time.time()
+        for cursor in cursors:
+            cursor.close()
+        self.log_queries(log_entries)
+        if self.streaming_job == job.id:
+            self.streaming_job = None
+            self.stream_col_lengths = None
+            self.streamed_count = 0
+        if self.closed:
+            # The pool only closes connections that are idle or released
+            # later, so this one has to be given back.
+            self.finish_job(job, healthy=False)
+            return
 
-        self.update_status(executing=True)
-        self.query_start = time.time()
-        for query in queries:
-            if combine_results:
-                if self.query:
-                    self.query += '\n\n'
-                self.query += query
-            else:
-                self.query = query
+        results['id'] = self.next_results_id
+        self.next_results_id += 1
+        self.history.add({
+            'results': results,
+            'job': job.id,
+            'query': query_text,
+            'query_start': query_start,
+            'query_end': query_end,
+        })
+        self.set_current_results(self.history.current())
 
-            query_result = {}
+        self.finish_job(job, healthy=results['type'] != 'error')
 
-            logger.debug("executing query: {}".format(query))
-            threading.Thread(target=run_query, args=[query, query_result]).start()
-            gr.parent.switch()
+        # TODO: Differentiate results pending from error pending?
+        self.update_status(results_pending=True)
+
+        self.vim.command('MySQLShowResults table {}'.format(self.autoid))
+
+    def execute_queries_in_parallel(self, queries):
+        """Execute the given queries in this tab, running independent reads in parallel.
+
+        Queries are split into batches by nvim_mysql.parallel.plan. The reads
+        in a parallel batch are spread over up to parallel_connections
+        auxiliary connections; everything else runs in order on the job's
+        own connection. Each batch finishes before the next one starts.
+
+        Unlike execute_queries, the results of every query get their own
+        entry in the results history, in the order of the queries, and the
+        last one is shown. Execution stops at the first error.
+        """
+        gr = greenlet.getcurrent()
+
+        job = self.start_job(queries)
+        logger.debug("starting job {} with {} queries in parallel mode".format(job.id, len(queries)))
+
+        if self.parallel_executor is None:
+            self.parallel_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.mysql.get_option('parallel_connections'))
+        disk_threshold = self.mysql.get_option('disk_results_threshold') * 1024 * 1024
+        # See execute_queries.
+        database = [None if job.primary else self.schema.default_database]
+
+        def query_done():
+            logger.debug("query_done called")
+            gr.parent = greenlet.getcurrent()
+            gr.switch()
+
+        def run_batch(batch, outcomes):
+            batch_queries = [queries[i] for i in batch.indexes]
+            try:
+                if batch.parallel:
+                    outcomes.extend(nvim_mysql.parallel.run_parallel(
+                        batch_queries, self.aux_pool, self.parallel_executor, disk_threshold,
+                        self.schema.default_database, job.aux_conns))
+                else:
+                    if job.conn is None:
+                        job.conn = job.pool.acquire()
+                    for query in batch_queries:
+                        outcomes.append(nvim_mysql.parallel.run_query(job.conn, query, disk_threshold, database[0]))
+                        database[0] = None
+            except Exception as e:
+                outcomes.append({'error': "Error: " + repr(e), 'start': time.time(), 'end': time.time()})
+
+            self.vim.async_call(query_done)
 
-            # Query is done.
-            if query_result['error']:
-                self.results = {'type': 'error', 'message': query_result['error']}
+        entries = []
+        log_entries = []
+        for batch in nvim_mysql.parallel.plan(queries, self.temporary_tables):
+            if self.closed:
                 break
+            outcomes = []
+            self.executor.submit(run_batch, batch, outcomes)
+            gr.parent.switch()
 
-            if combine_results:
-                # for "write" queries, add to count
-                if not query_result['description']:
-                    self.results['count'] += query_result['rowcount']
-                self.results['warnings'].extend(query_result['warnings'])
-            else:
-                if not query_result['description']:
-                    self.results = {
-                        'type': 'write',
-                        'count': query_result['rowcount'],
-                        'warnings': query_result['warnings'],
-                    }
+            # Batch is done.
+            for i, query_result in zip(batch.indexes, outcomes):
+                query = queries[i]
+                if nvim_mysql.schema.is_ddl(query):
+                    self.schema.invalidate()
+                elif nvim_mysql.schema.is_use(query) and not query_result['error'] and job.primary:
+                    self.schema.default_database = nvim_mysql.schema.used_database(query)
+                    self.schema.forget_unqualified()
+                self.note_temporary_table(query, query_result)
+
+                if query_result['error']:
+                    results = {'type': 'error', 'message': query_result['error']}
                 else:
-                    header = [f[0] for f in query_result['description']]
-                    types = [f[1] for f in query_result['description']]
-                    rows = query_result['rows']
-                    self.results = {
-                        'type': 'read',
-                        'header': header,
-                        'types': types,
-                        'rows': rows,
-                        'count': query_result['rowcount'],
-                        'warnings': query_result['warnings'],
-                    }
-
-        self.query_end = time.time()
-        cursor.close()
-        self.update_status(executing=False, killing=False)
+                    results = query_results(query_result)
+                log_entries.append(self.query_log_entry(query, query_result))
+                entries.append({
+                    'results': results,
+                    'job': job.id,
+                    'query': query,
+                    'query_start': query_result['start'],
+                    'query_end': query_result['end'],
+                })
+                if query_result['error']:
+                    break
+            if entries and entries[-1]['results']['type'] == 'error':
+                break
+
+        self.log_queries(log_entries)
+        if self.closed:
+            # See execute_queries.
+            self.finish_job(job, healthy=False)
+            return
+
+        for entry in entries:
+            entry['results']['id'] = self.next_results_id
+            self.next_results_id += 1
+            self.history.add(entry)
+        self.set_current_results(self.history.current())
+
+        self.finish_job(job, healthy=entries[-1]['results']['type'] != 'error')
 
-        # TODO: Differentiate results pending from error pending?
         self.update_status(results_pending=True)
 
         self.vim.command('MySQLShowResults table {}'.format(self.autoid))
 
+    def note_temporary_table(self, query, query_result):
+        """Remember the name of the temporary table query created, if it did.
+
+        Reads of these are never run in parallel (see nvim_mysql.parallel.plan).
+        """
+        table = nvim_mysql.parallel.temporary_table(query)
+        if table is not None and not query_result['error']:
+            self.temporary_tables.add(table)
+
+    def query_log_entry(self, query, query_result):
+        """Return the query log entry for query, given its outcome."""
+        return nvim_mysql.querylog.entry(
+            query_result['start'], self.autoid, query, query_result['end'] - query_result['start'],
+            query_result.get('rowcount'), query_result['error'], bool(self.mysql.get_option('query_log_text')))
+
+    def log_queries(self, entries):
+        """Append entries to this tab's query log, if it has one."""
+        if self.query_log_path is None or not entries:
+            return
+        try:
+            nvim_mysql.querylog.append(
+                self.query_log_path, entries, self.mysql.get_option('query_log_size') * 1024 * 1024)
+        except (IOError, OSError) as e:
+            logger.warning("could not write to query log {}: {!r}".format(self.query_log_path, e))
+
+    def show_query_stats(self):
+        """Show a summary of the query log, grouped by normalized query, as results."""
+        if self.query_log_path is None:
+            raise NvimMySQLError("The query log is disabled (see g:nvim_mysql#query_log)")
+
+        start = time.time()
+        summaries = nvim_mysql.querylog.stats(nvim_mysql.querylog.read(self.query_log_path))
+        def ms(seconds):
+            return round(seconds * 1000, 1)
+
+        FT = nvim_mysql.results.FT
+        data = nvim_mysql.results.ResultSet.from_rows(
+            ['count', 'errors', 'p50 (ms)', 'p95 (ms)', 'max (ms)', 'total (ms)', 'digest', 'query'],
+            [(s['count'], s['errors'], ms(s['p50']), ms(s['p95']), ms(s['max']), ms(s['total']),
+              s['digest'], s['query']) for s in summaries],
+            [FT.LONGLONG, FT.LONGLONG, FT.DOUBLE, FT.DOUBLE, FT.DOUBLE, FT.DOUBLE, FT.VAR_STRING, FT.VAR_STRING])
+
+        results = {
+            'type': 'read',
+            'data': data,
+            'count': len(data),
+            'warnings': [],
+            'id': self.next_results_id,
+        }
+        self.next_results_id += 1
+        self.history.add({
+            'results': results,
+            'job': None,
+            'query': 'MySQLQueryStats',
+            'query_start': start,
+            'query_end': time.time(),
+        })
+        self.set_current_results(self.history.current())
+        self.update_status(results_pending=True)
+        self.vim.command('MySQLShowResults table')
+
+    def start_job(self, queries):
+        """Register a new job that runs queries, on the primary connection if it is free."""
+        if self.primary_busy():
+            job = Job(self.next_job_id, None, self.aux_pool)
+        else:
+            job = Job(self.next_job_id, self.conn)
+        job.changes_session = any(nvim_mysql.parallel.changes_session(q) for q in queries)
+        self.next_job_id += 1
+        self.jobs[job.id] = job
+        self.update_status(executing=True)
+        return job
+
+    def finish_job(self, job, healthy=True):
+        del self.jobs[job.id]
+        if job.pool is not None and job.conn is not None:
+            # A pooled connection whose session the job changed (its default
+            # database, locks, an open transaction, etc.) isn't reused, so
+            # that nothing else inherits that state.
+            job.pool.release(job.conn, healthy and not job.changes_session)
+        if self.closed:
+            return
+        self.update_status(
+            executing=bool(self.jobs),
+            killing=any(j.killing for j in self.jobs.values()))
+
+    def primary_busy(self):
+        """Return whether a job is running on the primary connection."""
+        return any(job.primary for job in self.jobs.values())
+
+    def set_current_results(self, entry):
+        """Make the given history entry the one shown in the results buffer."""
+        self.results = entry['results']
+        self.query = entry['query']
+        self.query_start = entry['query_start']
+        self.query_end = entry['query_end']
+        self.results_format = None
+
+    def stream_rows(self, job_id, data, start, stop):
+        """Display rows [start, stop) of a result set that job job_id is still fetching.
+
+        The first chunk replaces the contents of the results buffer (and
+        opens the results window, if we are in this tab); subsequent chunks
+        are appended. Column widths are fixed by the first chunk, so the
+        table is redrawn properly once the query is done.
+
+        Only one job streams at a time: a job's first chunk claims the
+        results buffer if no other job has, and chunks from any other job
+        are dropped (its results are shown in full once it's done).
+        """
+        if start == 0 and self.streaming_job in (None, job_id):
+            self.streaming_job = job_id
+            self.stream_col_lengths = None
+            self.streamed_count = 0
+        if self.streaming_job != job_id:
+            return
+
+        # Once we've shown more than a large result set's first page would
+        # hold, stop; the rest will be paged in when the query is done.
+        if self.streamed_count > self.mysql.get_option('virtual_results_threshold'):
+            return
+        self.streamed_count += stop - start
+
+        rows = data.display_rows(start, stop)
+        if self.stream_col_lengths is None:
+            col_lengths = self.stream_col_lengths = nvim_mysql.results.table_col_lengths(data)
+            lines = nvim_mysql.results.table_head(data, col_lengths)
+            lines.extend([nvim_mysql.results.table_row(r, col_lengths) for r in rows])
+            self.results_buffer[:] = lines
+            self.results_buffer.vars['nvim_mysql_more'] = 0
+            self.results_view = None
+            self.results_format = None
+
+            if self.vim.current.tabpage == self.tabpage:
+                self.open_results_window()
+                self.vim.command("normal gg0")
+                self.vim.command('wincmd p')
+        else:
+            col_lengths = self.stream_col_lengths
+            self.results_buffer.append([nvim_mysql.results.table_row(r, col_lengths) for r in rows])
+
+    def render_results(self, format_, metadata):
+        """Write the current results to the results buffer in the given format.
+
+        Must be called with the results window as the current window.
+
+        Result sets with more rows than the virtual_results_threshold option
+        are only formatted and written a few screenfuls at a time; more is
+        loaded as the user scrolls (see load_more_results).
+
+        Formatted output is cached per result set and format, so switching
+        back to a format that has already been shown is cheap.
+        """
+        key = (self.results['id'], format_)
+        view = self.results_cache.get(key)
+        cached = view is not None
+        if not cached:
+            format_start = time.time()
+            view = nvim_mysql.results.ResultsView(
+                nvim_mysql.results.iter_format_results(self.results, format_, metadata))
+            virtual = (
+                self.results['type'] == 'read' and
+                self.results['count'] > self.mysql.get_option('virtual_results_threshold'))
+            view.take(self.results_page_size() if virtual else None)
+            format_end = time.time()
+            self.results_cache.put(key, view)
+        else:
+            logger.debug("using cached {} view of results {}".format(format_, self.results['id']))
+
+        self.results_view = view
+        self.results_view_id = self.results['id']
+        self.results_buffer[:] = view.lines
+        write_end = time.time()
+        self.results_buffer.vars['nvim_mysql_more'] = int(not view.exhausted)
+        self.results_format = format_
+
+        timings = metadata.get('timings')
+        if not cached and timings is not None:
+            # Formatting and writing can only be timed once they're done, so
+            # the footer's timing line (if it has been written yet) is
+            # updated afterwards.
+            timings['format'] = format_end - format_start
+            timings['write'] = write_end - format_end
+            timings['bytes'] = sum(len(line.encode('utf-8')) + 1 for line in view.lines)
+            line = nvim_mysql.results.format_timings(timings)
+            logger.debug("results {} ({}): {}".format(self.results['id'], format_, line))
+            index = metadata.get('timings_line')
+            if index is not None and index < len(view.lines):
+                view.lines[index] = line
+                self.results_buffer[index] = line
+
+    def release_results(self, entry):
+        """Let go of anything derived from the results of a history entry.
+
+        Called by the history before the results are spilled or dropped (at
+        which point their data may be closed).
+        """
+        results_id = entry['results']['id']
+        self.results_cache.discard(results_id)
+        if self.results_view is not None and self.results_view_id == results_id:
+            # The results buffer keeps what it has, but no more is loaded.
+            self.results_view = None
+            self.results_buffer.vars['nvim_mysql_more'] = 0
+
+    def load_more_results(self, window_height=None):
+        """Append the next page of a large result set to the results buffer."""
+        view = self.results_view
+        if view is None or view.exhausted:
+            return
+        lines = view.take(self.results_page_size(window_height))
+        if lines:
+            self.results_buffer.append(lines)
+            self.results_cache.evict()
+        if view.exhausted:
+            self.results_buffer.vars['nvim_mysql_more'] = 0
+
+    def results_page_size(self, window_height=None):
+        if window_height is None:
+            window_height = self.vim.current.window.height
+        return max(window_height, 1) * RESULTS_PAGE_SCREENS
+
     def execute_query(self, query):
         """Execute the given query in this tab.
 
@@ -468,22 +974,33 @@ class MySQLTab(object):
         self.execute_queries([query], False)
 
     def complete(self, findstart, base):
-        create_new_conn = self.status['executing']
-        if create_new_conn:
-            logger.debug("query is executing, so creating new connection for autocomplete")
-            db_params = cxnstr.to_dict(self.connection_string)
-            conn = pymysql.connect(use_unicode=True, **db_params)
-        else:
-            logger.debug("using existing connection for autocomplete")
-            conn = self.conn
-
-        result = nvim_mysql.autocomplete.complete(findstart, base, self.vim, conn.cursor())
+        # Names usually come from the schema cache; only take a connection
+        # if we actually have to ask the server for something.
+        aux_conns = []
+
+        def get_cursor():
+            if self.primary_busy():
+                if not aux_conns:
+                    logger.debug("query is executing, so using auxiliary connection for autocomplete")
+                    aux_conns.append(self.aux_pool.acquire())
+                return aux_conns[0].cursor()
+            else:
+                logger.debug("using existing connection for autocomplete")
+                return self.conn.cursor()
 
-        if create_new_conn:
-            logger.debug("closing autocomplete connection")
-            conn.close()
+        import nvim_mysql.autocomplete
+        try:
+            return nvim_mysql.autocomplete.complete(findstart, base, self.vim, self.schema, get_cursor)
+        finally:
+            for conn in aux_conns:
+                self.aux_pool.release(conn)
 
-        return result
+    def table_exists(self, table):
+        """Return whether table exists, without waiting for a running query."""
+        if not self.primary_busy():
+            return nvim_mysql.util.table_exists(self.conn, table)
+        with self.aux_pool.connection() as conn:
+            return nvim_mysql.util.table_exists(conn, table)
 
     def get_aux_window(self, target):
         target_buffer = self.results_buffer if target == 'results' else self.tree_buffer
@@ -541,10 +1058,19 @@ class MySQLTab(object):
         self.open_aux_window('tree')
 
     def close(self):
+        # Jobs stop after the statement they're running; the workers
+        # themselves go away once they're done.
+        self.closed = True
+        self.executor.shutdown(wait=False)
+        if self.parallel_executor is not None:
+            self.parallel_executor.shutdown(wait=False)
         try:
             self.conn.close()
         except:
             pass
+        if self.aux_pool is not None:
+            self.aux_pool.close()
+        self.history.clear()
         self.vim.command("bd! {}".format(self.results_buffer.number))
         self.vim.command("bd! {}".format(self.tree_buffer.number))
 
@@ -555,15 +1081,24 @@ class MySQL(object):
     def __init__(self, vim):
         self.vim = vim
         self.tabs = {}
+        self.connecting = set()  # tabpages that are connecting to a server
         self.initialized = False
+        self.tabline_refresh_pending = False
+        self.spinner_char = None
+        self.spinner_active = threading.Event()
         logger.debug("plugin loaded by host")
 
     def get_option(self, name):
         return self.vim.vars.get('nvim_mysql#{}'.format(name), OPTION_DEFAULTS[name])
 
-    @pynvim.command('MySQLConnect', nargs=1, sync=True)
+    @pynvim.command('MySQLConnect', nargs=1, sync=False)
     def connect(self, args):
-        """Use the given connection_string to connect the current tabpage to a MySQL server."""
+        """Use the given connection_string to connect the current tabpage to a MySQL server.
+
+        Connecting happens in the background (giving up after the
+        connect_timeout option's number of seconds), so Neovim stays usable
+        in the meantime; the tab shows a 'c' status flag until it's done.
+        """
         target = args[0]
         aliases = self.get_option('aliases')
         if aliases is not None and target in aliases:
@@ -573,30 +1108,94 @@ class MySQL(object):
         else:
             connection_string = target
             server_name = None
+        import cxnstr
         db_params = cxnstr.to_dict(connection_string)
+        db_params.setdefault('connect_timeout', self.get_option('connect_timeout'))
         if server_name is None:
             server_name = db_params['host']
+
+        tabpage = self.vim.current.tabpage
+        if tabpage in self.connecting:
+            raise NvimMySQLError("This tab is already connecting to a server")
+
+        if not self.initialized:
+            self._initialize()
+
+        # Show that we're connecting. Tabs that aren't MySQL-connected yet
+        # don't get a MySQLTab (and buffers) unless the connection succeeds.
+        tab = self.tabs.get(tabpage)
+        if tab is not None:
+            tab.update_status(connecting=True)
+        else:
+            tabpage.vars['MySQLServer'] = server_name
+            tabpage.vars['MySQLStatusFlag'] = 'c'
+            self.refresh_tabline()
+        self.connecting.add(tabpage)
+        self.update_spinner()
+
+        gr = greenlet.getcurrent()
+        outcome = {}
+
+        def connected():
+            gr.parent = greenlet.getcurrent()
+            gr.switch()
+
+        def connect():
+            try:
+                import pymysql
+                conn = pymysql.connect(use_unicode=True, **db_params)
+                conn.autocommit(True)
+                outcome['conn'] = conn
+            except Exception as e:
+                outcome['error'] = e
+            self.vim.async_call(connected)
+
         logger.debug("connecting to {}".format(connection_string))
-        conn = pymysql.connect(use_unicode=True, **db_params)
-        conn.autocommit(True)
+        threading.Thread(target=connect).start()
+        gr.parent.switch()
+        self.connecting.discard(tabpage)
+        self.update_spinner()
+
+        tab = self.tabs.get(tabpage)
+        if 'error' in outcome:
+            logger.debug("connection failed: {!r}".format(outcome['error']))
+            if tab is not None:
+                tab.update_status(connecting=False)
+            elif tabpage.valid:
+                del tabpage.vars['MySQLServer']
+                del tabpage.vars['MySQLStatusFlag']
+                self.refresh_tabline()
+            raise NvimMySQLError("Could not connect to {}: {}".format(server_name, outcome['error']))
         logger.debug("connection succeeded")
 
-        tabpage = self.vim.current.tabpage
-        if tabpage in self.tabs:
+        if not tabpage.valid:
+            logger.debug("tab was closed while connecting")
+            outcome['conn'].close()
+            return
+
+        if tab is not None:
             logger.debug("this tab is already MySQL-connected, will replace connection")
-            tab = self.tabs[tabpage]
         else:
             logger.debug("this tab is not MySQL-connected, will initialize")
             tab = self.tabs[tabpage] = MySQLTab(self, self.vim, tabpage)
-        tab.set_connection(conn, connection_string, server_name)
-
-        if self.vim.current.buffer.name == '' and 'current_syntax' not in self.vim.current.buffer.vars:
-            self.vim.command('set ft=mysql')
-
-        if not self.initialized:
-            self._initialize()
+        tab.set_connection(outcome['conn'], connection_string, server_name)
+        if self.get_option('schema_prefetch'):
+            persist_path = None
+            if self.get_option('persist_schema'):
+                persist_path = nvim_mysql.schema.persist_path(self.vim.funcs.stdpath('cache'), db_params)
+            tab.start_schema_prefetch(persist_path)
+        else:
+            tab.schema_prefetch = None
+        tab.refresh_tree()
+        if self.get_option('query_log'):
+            tab.query_log_path = nvim_mysql.querylog.log_path(self.vim.funcs.stdpath('cache'), db_params)
+        else:
+            tab.query_log_path = None
+        tab.update_status(connecting=False)
 
-        self.refresh_tabline()
+        if tabpage == self.vim.current.tabpage:
+            if self.vim.current.buffer.name == '' and 'current_syntax' not in self.vim.current.buffer.vars:
+                self.vim.command('set ft=mysql')
 
     @pynvim.command('MySQLExecQueryUnderCursor', sync=False)
     def exec_query_under_cursor(self):
@@ -624,7 +1223,8 @@ class MySQL(object):
     def exec_queries_in_range(self, range):
         """Execute the queries in the visual selection.
 
-        Results of individual queries are not shown.
+        Results of individual queries are not shown, unless the parallel_reads
+        option is set (see MySQLTab.execute_queries_in_parallel).
 
         This command assumes that all queries are separated by at least one
         blank line.
@@ -637,7 +1237,10 @@ class MySQL(object):
             raise NvimMySQLError("This is not a MySQL-connected tabpage")
 
         queries = nvim_mysql.util.get_queries_in_range(self.vim.current.buffer, range[0] - 1, range[1] - 1)
-        current_tab.execute_queries(queries, len(queries) > 1)
+        if len(queries) > 1 and self.get_option('parallel_reads'):
+            current_tab.execute_queries_in_parallel(queries)
+        else:
+            current_tab.execute_queries(queries, len(queries) > 1)
 
     def _run_query_on_table_under_cursor(self, query_fmt):
         """Run a query on the table under the cursor."""
@@ -667,7 +1270,7 @@ class MySQL(object):
             )
             table = nvim_mysql.util.word_to_table(word)
 
-        if nvim_mysql.util.table_exists(current_tab.conn, table):
+        if current_tab.table_exists(table):
             query = query_fmt.format(table)
             current_tab.execute_query(query)
         else:
@@ -703,12 +1306,34 @@ class MySQL(object):
         """Select count(*) from the table under the cursor."""
         self._run_query_on_table_under_cursor("select count(*) from {}")
 
-    @pynvim.command('MySQLKillQuery', sync=True)
-    def kill_query(self):
-        """Kill the query currently executing in the current tabpage.
+    @pynvim.command('MySQLQueryStats', sync=True)
+    def query_stats(self):
+        """Show how long the queries run on this tab's server have taken.
+
+        Queries in the query log that differ only in their literal values are
+        grouped together, and the groups that have taken the most time in
+        total are shown first, in the results window.
+        """
+        if not self.initialized:
+            raise NvimMySQLError("Use MySQLConnect to connect to a database first")
+
+        current_tab = self.tabs.get(self.vim.current.tabpage, None)
+        if current_tab is None:
+            raise NvimMySQLError("This is not a MySQL-connected tabpage")
+
+        current_tab.show_query_stats()
+
+    @pynvim.command('MySQLKillQuery', nargs='?', sync=True)
+    def kill_query(self, args):
+        """Kill a job (query) that is executing in the current tabpage.
+
+        :MySQLKillQuery <job>
+
+        If no job ID is given, the most recently started job is killed. Job
+        IDs of running jobs are shown in the tabline.
 
-        This command creates an additional connection to the server to
-        kill the query.
+        This command uses an auxiliary connection to the server to kill the
+        query.
         """
         if not self.initialized:
             raise NvimMySQLError("Use MySQLConnect to connect to a database first")
@@ -718,20 +1343,29 @@ class MySQL(object):
             raise NvimMySQLError("This is not a MySQL-connected tabpage")
 
         # If there's no running query, ignore.
-        if not current_tab.status['executing']:
+        if not current_tab.jobs:
             raise NvimMySQLError("No query is currently running in this tab")
 
+        if args:
+            job = current_tab.jobs.get(int(args[0]))
+            if job is None:
+                raise NvimMySQLError("No job {} is running in this tab".format(args[0]))
+        else:
+            job = current_tab.jobs[max(current_tab.jobs)]
+
+        job_conns = job.connections()
+        if not job_conns:
+            raise NvimMySQLError("Job {} hasn't started running yet".format(job.id))
+
+        job.killing = True
         current_tab.update_status(killing=True)
-        query_id = current_tab.conn.thread_id()
-        logger.debug("thread id: {}".format(query_id))
+        query_ids = [c.thread_id() for c in job_conns]
+        logger.debug("killing job {}, thread ids: {}".format(job.id, query_ids))
 
-        db_params = cxnstr.to_dict(current_tab.connection_string)
-        conn = pymysql.connect(use_unicode=True, **db_params)
-        try:
+        with current_tab.aux_pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("kill query {}".format(query_id))
-        finally:
-            conn.close()
+            for query_id in query_ids:
+                cursor.execute("kill query {}".format(query_id))
 
         logger.debug("done killing query")
 
@@ -789,6 +1423,13 @@ class MySQL(object):
         if tab_autoid is not None and tab_autoid != current_tab.autoid:
             return
 
+        # While rows are being streamed in, the buffer belongs to the stream,
+        # and whatever finished in the meantime is shown after it.
+        if current_tab.streaming_job is not None:
+            if tab_autoid is None:
+                current_tab.open_results_window()
+            return
+
         current_tab.open_results_window()
 
         if current_tab.query and (current_tab.status['results_pending'] or format_ != current_tab.results_format):
@@ -796,8 +1437,9 @@ class MySQL(object):
                 'query': current_tab.query,
                 'duration': current_tab.query_end - current_tab.query_start,
             }
-            current_tab.results_buffer[:] = format_results(current_tab.results, format_, metadata)
-            current_tab.results_format = format_
+            if current_tab.results.get('timings'):
+                metadata['timings'] = dict(current_tab.results['timings'], rows=current_tab.results['count'])
+            current_tab.render_results(format_, metadata)
             self.vim.command("normal gg0")
 
         current_tab.update_status(results_pending=False)
@@ -806,6 +1448,51 @@ class MySQL(object):
         if tab_autoid is not None:
             self.vim.command('wincmd p')
 
+    @pynvim.function('MySQLLoadMoreResults', sync=True)
+    def load_more_results(self, args):
+        """Load the next page of a large result set into the results buffer.
+
+        Called automatically when scrolling near the end of what has been
+        loaded so far.
+        """
+        if not self.initialized:
+            return
+
+        current_tab = self.tabs.get(self.vim.current.tabpage, None)
+        if current_tab is None:
+            return
+
+        window_height = args[0] if args else None
+        current_tab.load_more_results(window_height)
+
+    @pynvim.command('MySQLPreviousResults', sync=True)
+    def previous_results(self):
+        """Show the results of the previous query run in this tab."""
+        self._step_through_history(-1)
+
+    @pynvim.command('MySQLNextResults', sync=True)
+    def next_results(self):
+        """Show the results of the next query run in this tab."""
+        self._step_through_history(1)
+
+    def _step_through_history(self, step):
+        if not self.initialized:
+            raise NvimMySQLError("Use MySQLConnect to connect to a database first")
+
+        current_tab = self.tabs.get(self.vim.current.tabpage, None)
+        if current_tab is None:
+            raise NvimMySQLError("This is not a MySQL-connected tabpage")
+
+        history = current_tab.history
+        entry = history.back() if step < 0 else history.forward()
+        if entry is None:
+            raise NvimMySQLError("No {} results".format('earlier' if step < 0 else 'later'))
+
+        format_ = current_tab.results_format or 'table'
+        current_tab.set_current_results(entry)
+        self.vim.command('MySQLShowResults {}'.format(format_))
+        self.vim.command('echo "results {} of {}"'.format(history.position + 1, len(history)))
+
     @pynvim.command('MySQLFreezeResultsHeader', sync=True)
     def freeze_results_header(self):
         if not self.initialized:
@@ -818,7 +1505,12 @@ class MySQL(object):
         if current_tab.results_buffer != self.vim.current.buffer:
             raise NvimMySQLError("This command can only be run in results buffer")
 
-        self.vim.feedkeys("""gg^:=winheight('%')-4spL3jH^:se scbk:se scb:se sbo=horj""")
+        self.vim.feedkeys("""gg^:=winheight('%')-4
+sp
+L3jH^:se scb
+k:se scb
+:se sbo=hor
+j""")
 
     @pynvim.command('MySQLShowTree', sync=True)
     def show_tree(self):
@@ -831,9 +1523,7 @@ class MySQL(object):
             raise NvimMySQLError("This is not a MySQL-connected tabpage")
 
         current_tab.open_tree_window()
-
-        current_tab.tree.refresh_data()
-        current_tab.tree_buffer[:] = current_tab.tree.render()
+        current_tab.refresh_tree()
 
     @pynvim.command('MySQLTreeToggleDatabase', sync=True)
     def tree_toggle_database(self):
@@ -857,10 +1547,43 @@ class MySQL(object):
         else:
             current_tab.tree.open(database)
 
-        current_tab.tree.refresh_data()
-        current_tab.tree_buffer[:] = current_tab.tree.render()
+        current_tab.refresh_tree()
         self.vim.current.window.cursor = [row + 1, 0]
 
+    @pynvim.command('MySQLTreeFilter', nargs='?', sync=True)
+    def tree_filter(self, args):
+        """Only show tables whose names contain the given text in the tree.
+
+        :MySQLTreeFilter <text>
+
+        If no text is given, prompt for it, filtering the tree as it is typed.
+        An empty filter shows all tables again.
+        """
+        if not self.initialized:
+            raise NvimMySQLError("Use MySQLConnect to connect to a database first")
+
+        current_tab = self.tabs.get(self.vim.current.tabpage, None)
+        if current_tab is None:
+            raise NvimMySQLError("This is not a MySQL-connected tabpage")
+
+        if args:
+            text = args[0]
+        else:
+            text = self.vim.funcs.input('Filter tables: ', current_tab.tree.filter)
+        current_tab.filter_tree(text)
+
+    @pynvim.function('MySQLTreeFilterUpdate', sync=False)
+    def tree_filter_update(self, args):
+        if not self.initialized:
+            return
+
+        current_tab = self.tabs.get(self.vim.current.tabpage, None)
+        if current_tab is None:
+            return
+
+        current_tab.filter_tree(args[0])
+        self.vim.command('redraw')
+
     @pynvim.function('MySQLComplete', sync=True)
     def complete(self, args):
         findstart, base = args
@@ -888,6 +1611,7 @@ class MySQL(object):
                 logger.debug("tab w/ handle {} is not longer open. closing.".format(nvim_tab.handle))
                 mysql_tab.close()
                 del self.tabs[nvim_tab]
+        self.update_spinner()
 
     @pynvim.function('MySQLAutoCloseAuxWindows', sync=True)
     def auto_close_aux_windows(self, args):
@@ -912,31 +1636,43 @@ class MySQL(object):
 
     @pynvim.function('MySQLInitializeQueryBuffer', sync=True)
     def initialize_query_buffer(self, args):
-        self.vim.command('setlocal completefunc=MySQLComplete')
-        for map_command in render_map_commands_for_buffer_type('query', self.vim):
-            self.vim.command(map_command)
+        # The FileType autocommand passes the user's keymaps along, to save
+        # asking for them.
+        user_keymaps = args[0] if args else self.vim.eval(USER_KEYMAPS_EXPR)
+        nvim_mysql.util.call_atomic(self.vim, query_buffer_calls(0, user_keymaps))
 
     def _initialize(self):
         logger.debug("initializing plugin")
 
         self.initialized = True
         tabline_file = os.path.join(os.path.dirname(__file__), 'tabline.vim')
-        self.vim.command('source {}'.format(tabline_file))
 
-        # Initialize all existing SQL buffers
-        cur_buf = self.vim.current.buffer
-        for buffer in self.vim.buffers:
-            if buffer.options.get('filetype') in ['sql', 'mysql']:
-                self.vim.command("buffer! {}".format(buffer.number))
-                self.vim.command("call MySQLInitializeQueryBuffer()")
-        self.vim.command("buffer! {}".format(cur_buf.number))
+        user_keymaps, query_buffers, has_redrawtabline = nvim_mysql.util.call_atomic(self.vim, [
+            ['nvim_eval', [USER_KEYMAPS_EXPR]],
+            ['nvim_eval', ["filter(range(1, bufnr('$')), \"index(['sql', 'mysql'], getbufvar(v:val, '&filetype')) >= 0\")"]],
+            ['nvim_call_function', ['exists', [':redrawtabline']]],
+        ])
 
+        # The tabline is set up once; after that it is only redrawn.
+        if has_redrawtabline:
+            self.redraw_tabline_command = 'redrawtabline'
+        else:
+            self.redraw_tabline_command = 'let &tabline = &tabline'
+
+        calls = [['nvim_command', ['source {}'.format(tabline_file)]]]
+        # Initialize all existing SQL buffers (without switching to them)
+        for buffer in query_buffers:
+            calls.extend(query_buffer_calls(buffer, user_keymaps))
         # Set up autocommands
-        self.vim.command('autocmd TabClosed * call MySQLCleanupTabs()')
-        self.vim.command('autocmd WinEnter * call MySQLAutoCloseAuxWindows()')
-        self.vim.command('autocmd FileType sql,mysql call MySQLInitializeQueryBuffer()')
+        calls.extend(['nvim_command', [command]] for command in [
+            'autocmd TabClosed * call MySQLCleanupTabs()',
+            'autocmd WinEnter * call MySQLAutoCloseAuxWindows()',
+            'autocmd FileType sql,mysql call MySQLInitializeQueryBuffer({})'.format(USER_KEYMAPS_EXPR),
+        ])
+        calls.append(['nvim_set_var', ['nvim_mysql#spinner_char', SPINNER_CHARS[0]]])
+        calls.append(['nvim_command', ['set showtabline=2 tabline=%!MySQLTabLine()']])
+        nvim_mysql.util.call_atomic(self.vim, calls)
 
-        self.refresh_tabline()
         if self.get_option('use_spinner'):
             self.start_spinner()
 
@@ -944,14 +1680,43 @@ class MySQL(object):
 
 
     def refresh_tabline(self, spinner_char=None):
+        """Redraw the tabline.
+
+        The redraw happens once the current handler is done, so that several
+        status changes in a row only cause one redraw.
+        """
         if spinner_char:
-            self.vim.vars['nvim_mysql#spinner_char'] = spinner_char
-        self.vim.command('set showtabline=2 tabline=%!MySQLTabLine()')
+            self.spinner_char = spinner_char
+        if not self.tabline_refresh_pending:
+            self.tabline_refresh_pending = True
+            self.vim.async_call(self._redraw_tabline)
+
+    def _redraw_tabline(self):
+        self.tabline_refresh_pending = False
+        if not self.initialized:
+            return
+        if self.spinner_char:
+            self.vim.vars['nvim_mysql#spinner_char'] = self.spinner_char
+            self.spinner_char = None
+        self.vim.command(self.redraw_tabline_command)
+
+    def update_spinner(self):
+        """Make the spinner spin if (and only if) any tab is executing a query or connecting.
+
+        Those are the statuses that the tabline shows the spinner for (while
+        a query is being killed, it shows 'k' instead).
+        """
+        connecting = any(tabpage not in self.tabs for tabpage in self.connecting)
+        if connecting or any(t.status_flag in ('e', 'c') for t in self.tabs.values()):
+            self.spinner_active.set()
+        else:
+            self.spinner_active.clear()
 
     def start_spinner(self):
         def spin():
             i = 0
             while True:
+                self.spinner_active.wait()
                 i = i % len(SPINNER_CHARS)
                 self.vim.async_call(self.refresh_tabline, SPINNER_CHARS[i])
                 time.sleep(.1)
@@ -961,46 +1726,131 @@ class MySQL(object):
         t.start()
 
 
+class Job(object):
+    """A query (or sequence of queries) running in a MySQLTab.
+
+    pool is the pool that conn is taken from (once the job starts running;
+    until then conn is None), or None if conn is the tab's primary
+    connection.
+    """
+    def __init__(self, job_id, conn, pool=None):
+        self.id = job_id
+        self.conn = conn
+        self.pool = pool
+        self.aux_conns = set()  # connections running parts of the job in parallel
+        self.killing = False
+        self.changes_session = False  # whether the job's queries change the state of its session
+
+    @property
+    def primary(self):
+        return self.pool is None
+
+    def connections(self):
+        """Return the connections that the job is running queries on."""
+        conns = list(self.aux_conns)
+        if self.conn is not None:
+            conns.append(self.conn)
+        return conns
+
+
 class Tree(object):
-    """Internal representation of tree view."""
+    """Internal representation of tree view.
+
+    The tables of each database are kept in a sorted index, along with
+    their names in lower case for filtering (see set_filter).
+    """
     def __init__(self, tab):
         self.tab = tab
-        self.data = {}  # {db: {expanded: bool, objects: [str]}}
+        self.databases = []
+        self.index = {}  # {db: [(lower-case table name, table name)]}
+        self._indexed = {}  # {db: list of names from the schema cache that index[db] was built from}
+        self.expanded = set()
+        self.filter = ''
+        self.matches = None  # like index, but only matching tables (if filtering)
+        self.lines = []  # as last written to the tree buffer
 
     def refresh_data(self):
-        cursor = self.tab.conn.cursor()
-        cursor.execute("show databases")
-        databases = [r[0] for r in cursor.fetchall()]
-
-        # Remove databases that are no longer listed
-        for database in self.data:
-            if database not in databases:
-                del self.data[database]
-
-        # Add new databases
-        for database in databases:
-            if database not in self.data:
-                self.data[database] = {'expanded': False, 'objects': []}
-
-        # Update objects for expanded databases
-        for database in self.data:
-            if self.data[database]['expanded']:
-                cursor.execute("show tables from {}".format(database))
-                tables = [r[0] for r in cursor.fetchall()]
-                self.data[database]['objects'] = tables
+        """Update the tree from the schema cache, without asking the server.
+
+        Return whether anything the tree needs is missing from the cache
+        (see fetch).
+        """
+        missing = False
+        databases = self.tab.schema.get(('databases',))
+        if databases is None:
+            missing = True
+        else:
+            self.databases = sorted(databases)
+
+        changed = False
+        for database in self.databases:
+            tables = self.tab.schema.get(('tables', database))
+            if tables is None:
+                # Only needed for databases that are showing.
+                if database in self.expanded or self.filter:
+                    missing = True
+            elif tables is not self._indexed.get(database):
+                self.index[database] = sorted((t.lower(), t) for t in tables)
+                self._indexed[database] = tables
+                changed = True
+        for database in list(self.index):
+            if database not in self.databases:
+                del self.index[database]
+                del self._indexed[database]
+                changed = True
+
+        if changed and self.filter:
+            self.matches = None
+            self.set_filter(self.filter)
+        return missing
+
+    def fetch(self, get_cursor):
+        """Fetch everything the tree needs into the schema cache.
+
+        This may query the server, so it is run in the background.
+        """
+        nvim_mysql.schema.load_catalog(self.tab.schema, get_cursor)
+
+    def set_filter(self, text):
+        """Only show tables whose names contain text (ignoring case).
+
+        If text extends the current filter, only the tables that matched it
+        are searched again.
+        """
+        text = text.lower()
+        if not text:
+            self.matches = None
+        else:
+            if self.matches is not None and text.startswith(self.filter):
+                source = self.matches
+            else:
+                source = self.index
+            self.matches = {}
+            for database, tables in source.items():
+                matching = [t for t in tables if text in t[0]]
+                if matching:
+                    self.matches[database] = matching
+        self.filter = text
 
     def open(self, database):
-        self.data[database]['expanded'] = True
+        self.expanded.add(database)
 
     def close(self, database):
-        self.data[database]['expanded'] = False
+        self.expanded.discard(database)
 
     def render(self):
-        s = ''
-        for database in sorted(self.data):
-            s += database
-            s += u' ▾' if self.data[database]['expanded'] else u' ▸'
-            s += '\n'
-            if self.data[database]['expanded']:
-                s += '  ' + '\n  '.join(self.data[database]['objects']) + '\n'
-        return s.splitlines()
+        lines = []
+        for database in self.databases:
+            if self.matches is not None:
+                # Databases with matching tables are shown expanded.
+                tables = self.matches.get(database)
+                if not tables:
+                    continue
+                expanded = True
+            else:
+                expanded = database in self.expanded
+                tables = self.index.get(database, [])
+            lines.append(database + (u' ▾' if expanded else u' ▸'))
+            if expanded:
+                lines.extend(['  ' + name for _, name in tables])
+        return lines
@@ -1,11 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import functools
 import logging
 import re
 
-import pymysql
-import sqlparse
-
+# sqlparse (and pymysql) are imported where they're used: most completions
+# are answered by the regular expression fast path, without parsing.
 import nvim_mysql.util
 
 
@@ -16,6 +16,26 @@ _SENTINEL = 'NVIM_MYSQL_SENTINEL'
 
 QUOTING_EXEMPT_IDENTIFIER = re.compile(r'^[A-Za-z0-9_]+$')
 
+# Used by the fast path in _get_namespace_for_autocomplete_simple.
+LITERAL_OR_COMMENT = re.compile(
+    r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+QUALIFIER_BEFORE_SENTINEL = re.compile(r'(?<![\w.$@])([A-Za-z0-9_$]+)\.[A-Za-z0-9_$]*' + _SENTINEL)
+STATEMENT_KEYWORD = re.compile(r'\b(select|insert|update|delete|replace|union)\b', re.IGNORECASE)
+# The tables of a FROM (or UPDATE) clause, up to the first ON, WHERE, etc.
+# Commas only separate tables in here; elsewhere they separate select list
+# items, whose aliases have nothing to do with tables.
+TABLE_CLAUSE = re.compile(
+    r'\b(?:from|update)\b.*?(?=\b(?:where|on|using|set|group|having|order|limit|union|into|for|lock|window)\b|$)',
+    re.IGNORECASE | re.DOTALL)
+_TABLE_ALIAS = (
+    r'\s*([A-Za-z0-9_$]+(?:\.[A-Za-z0-9_$]+)?)\s+(?:as\s+)?'
+    r'(?!(?:join|inner|left|right|outer|cross|natural|straight_join|where|on|using|set)\b)([A-Za-z0-9_$]+)\b')
+TABLE_BINDING = re.compile(r'(?:\bfrom|\bjoin|\bupdate|,)' + _TABLE_ALIAS, re.IGNORECASE)
+JOIN_BINDING = re.compile(r'\bjoin' + _TABLE_ALIAS, re.IGNORECASE)
+
+# How many resolved namespaces to remember (see _get_namespace_for_autocomplete).
+NAMESPACE_CACHE_SIZE = 64
+
 
 def _findstart(line_segment):
     """Find start of text to autocomplete.
@@ -39,7 +59,54 @@ def _findstart(line_segment):
         return -1
 
 
-def _get_namespace_for_autocomplete_qualified(query, row, col):
+def _insert_sentinel(query, row, col):
+    """Mark where we are autocompleting.
+
+    >>> _insert_sentinel("select s.\\nfrom student s", 0, 9)
+    'select s.NVIM_MYSQL_SENTINEL\\nfrom student s'
+    """
+    lines = query.splitlines()
+    lines[row] = lines[row][:col] + _SENTINEL + lines[row][col:]
+    return '\n'.join(lines)
+
+
+def _get_namespace_for_autocomplete_simple(query):
+    """Resolve the qualifier before the sentinel without parsing the query.
+
+    This only handles the common case of a single statement with no
+    subqueries or unions, where the qualifier is either an alias bound in
+    the query or a database or table name. Return None whenever the query
+    is not that simple, so that the parser can be used instead.
+
+    >>> _get_namespace_for_autocomplete_simple(
+    ...     "select s.NVIM_MYSQL_SENTINEL from school.student s where s.name = 'a.b'")
+    'school.student'
+    >>> _get_namespace_for_autocomplete_simple("select * from school.stuNVIM_MYSQL_SENTINEL")
+    'school'
+    >>> _get_namespace_for_autocomplete_simple(
+    ...     "select s.NVIM_MYSQL_SENTINEL from student s where x in (select 1)") is None
+    True
+    >>> _get_namespace_for_autocomplete_simple("select 's.NVIM_MYSQL_SENTINEL' from student s") is None
+    True
+    >>> _get_namespace_for_autocomplete_simple("select id, name from student s where s.NVIM_MYSQL_SENTINEL")
+    'student'
+    """
+    query = LITERAL_OR_COMMENT.sub(' ', query)
+    match = QUALIFIER_BEFORE_SENTINEL.search(query)
+    if match is None or len(STATEMENT_KEYWORD.findall(query)) > 1:
+        return None
+    qualifier = match.group(1)
+    bindings = dict(
+        (alias, table) for clause in TABLE_CLAUSE.finditer(query)
+        for table, alias in TABLE_BINDING.findall(clause.group(0)))
+    # Joins after an ON or USING clause aren't part of the leading clause.
+    bindings.update((alias, table) for table, alias in JOIN_BINDING.findall(query) if alias not in bindings)
+    return bindings.get(qualifier, qualifier)
+
+
+def _get_namespace_for_autocomplete_qualified(tree):
+    import sqlparse
+
     class _TraversalContext(object):
         def __init__(self):
             self.scopes = [{'bindings': {}, 'level': 0}]
@@ -128,42 +195,28 @@ def _get_namespace_for_autocomplete_qualified(query, row, col):
             for t in token.tokens:
                 _traverse(t, ctx)
 
-    # Insert sentinel to mark where we are autocompleting.
-    lines = query.splitlines()
-    lines[row] = lines[row][:col] + _SENTINEL + lines[row][col:]
-    query = '\n'.join(lines)
-
-    # Parse query and traverse.
-    tree = sqlparse.parse(query)[0]
     ctx = _TraversalContext()
     _traverse(tree, ctx)
     ctx.close_all_scopes()
     return ctx.rv
 
 
-def _get_first_table_in_query(query):
-    """Return the first table name found in query.
+def _get_first_table(tree):
+    import sqlparse
 
-    >>> _get_first_table_in_query("select from x.a where y = 12")
-    'x.a'
-    >>> _get_first_table_in_query("update abc set def = ghi")
-    'abc'
-    >>> _get_first_table_in_query("delete from a.bc where f = 6")
-    'a.bc'
-    >>> _get_first_table_in_query("alter table ab.cde modify q int(11)")
-    'ab.cde'
-    """
     TABLE_INTRODUCERS = [
         (sqlparse.tokens.Keyword, 'FROM'),
         (sqlparse.tokens.DML, 'UPDATE'),
         (sqlparse.tokens.DDL, 'ALTER'),
     ]
-    tree = sqlparse.parse(query)[0]
     found_introducer = False
     for t in tree.tokens:
         if any((t.ttype, t.value.upper()) == ti for ti in TABLE_INTRODUCERS):
             found_introducer = True
         elif found_introducer and isinstance(t, sqlparse.sql.Identifier):
+            if _SENTINEL in str(t):
+                # This is what is being completed, not a table.
+                continue
             if t.get_parent_name() is not None:
                 return t.get_parent_name() + '.' + t.get_real_name()
             else:
@@ -171,18 +224,44 @@ def _get_first_table_in_query(query):
     return None
 
 
-def _get_namespace_for_autocomplete_unqualified(query, row, col):
-    return _get_first_table_in_query(query)
+def _get_first_table_in_query(query):
+    """Return the first table name found in query.
+
+    >>> _get_first_table_in_query("select from x.a where y = 12")
+    'x.a'
+    >>> _get_first_table_in_query("update abc set def = ghi")
+    'abc'
+    >>> _get_first_table_in_query("delete from a.bc where f = 6")
+    'a.bc'
+    >>> _get_first_table_in_query("alter table ab.cde modify q int(11)")
+    'ab.cde'
+    """
+    import sqlparse
+
+    return _get_first_table(sqlparse.parse(query)[0])
 
 
+@functools.lru_cache(maxsize=NAMESPACE_CACHE_SIZE)
 def _get_namespace_for_autocomplete(query, row, col):
-    """Get the namespace (database or table) that contains the autocomplete candidates."""
-    return (
-        _get_namespace_for_autocomplete_qualified(query, row, col) or
-        _get_namespace_for_autocomplete_unqualified(query, row, col))
+    """Get the namespace (database or table) that contains the autocomplete candidates.
 
+    Results are memoized, since completion is requested over and over for
+    the same query and cursor position while the popup menu is open.
+    """
+    query = _insert_sentinel(query, row, col)
+    namespace = _get_namespace_for_autocomplete_simple(query)
+    if namespace is not None:
+        return namespace
+
+    # Both passes share a single parse of the query. sqlparse is only
+    # imported once the fast path has failed.
+    import sqlparse
 
-def _complete(line_segment, base, vim, cursor):
+    tree = sqlparse.parse(query)[0]
+    return _get_namespace_for_autocomplete_qualified(tree) or _get_first_table(tree)
+
+
+def _complete(line_segment, base, vim, schema, get_cursor):
     logger.debug('autocomplete: base: "{}"'.format(base))
     logger.debug('autocomplete: line segment is "{}"'.format(line_segment))
 
@@ -193,23 +272,22 @@ def _complete(line_segment, base, vim, cursor):
     namespace = _get_namespace_for_autocomplete(query, row_in_query, col)
     logger.debug('autocomplete: namespace is "{}"'.format(namespace))
 
-    cursor.execute("show databases")
-    databases = [r[0] for r in cursor.fetchall()]
+    databases = schema.databases(get_cursor)
     if namespace in databases:
         # Assume table
         logger.debug("autocomplete: assuming we're completing a TABLE")
-        cursor.execute("show tables from `{}`".format(namespace))
-        words = [r[0] for r in cursor.fetchall() if r[0].lower().startswith(base.lower())]
+        names = schema.tables(get_cursor, namespace)
     else:
         # Assume column
         logger.debug("autocomplete: assuming we're completing a COLUMN")
+        import pymysql
+
         try:
-            cursor.execute("describe {}".format(namespace))
+            names = schema.columns(get_cursor, namespace)
         except pymysql.err.DatabaseError:
             vim.err_write("Unknown database or table: {}\n".format(namespace))
-            words = []
-        else:
-            words = [r[0] for r in cursor.fetchall() if r[0].lower().startswith(base.lower())]
+            names = []
+    words = [w for w in names if w.lower().startswith(base.lower())]
 
     # Wrap each suggestion in backticks if necessary.
     words = ['`{}`'.format(w) if not QUOTING_EXEMPT_IDENTIFIER.match(w) else w for w in words]
@@ -217,10 +295,15 @@ def _complete(line_segment, base, vim, cursor):
     return [{'word': w, 'icase': 1} for w in words]
 
 
-def complete(findstart, base, vim, cursor):
+def complete(findstart, base, vim, schema, get_cursor):
+    """Completion function.
+
+    Names are looked up in schema (a SchemaCache). get_cursor is called to
+    get a cursor only if something has to be fetched from the server.
+    """
     col = vim.current.window.cursor[1]
     line_segment = vim.current.line[:col]
     if findstart:
         return _findstart(line_segment)
     else:
-        return _complete(line_segment, base, vim, cursor)
+        return _complete(line_segment, base, vim, schema, get_cursor)
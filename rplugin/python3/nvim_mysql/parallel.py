@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import re
+import time
+
+import nvim_mysql.results
+import nvim_mysql.schema
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+READ_STATEMENT = re.compile(r'^\s*\(?\s*(select|show|describe|desc|explain|with)\b', re.IGNORECASE)
+# Reads that take locks, write somewhere, or touch user variables or other
+# state of the session (such as the last insert ID) aren't safe to move to
+# another connection.
+NOT_INDEPENDENT = re.compile(
+    r'\binto\b|\bfor\s+update\b|\block\s+in\s+share\s+mode\b|\bfor\s+share\b|@|'
+    r'\b(last_insert_id|found_rows|row_count|connection_id|get_lock|release_lock|release_all_locks|'
+    r'is_free_lock|is_used_lock|database|schema)\s*\(|'
+    # SHOW STATUS and SHOW VARIABLES show the session's values unless GLOBAL
+    # is given.
+    r'^\s*show\s+(warnings|errors|count|profiles?|session|local|status|variables)\b',
+    re.IGNORECASE)
+SESSION_STATEMENT = re.compile(
+    r'^\s*(use|set|begin|start\s+transaction|commit|rollback|savepoint|release|xa|'
+    r'lock|unlock|create\s+temporary|drop\s+temporary|prepare|execute|deallocate|handler)\b',
+    re.IGNORECASE)
+
+CREATE_TEMPORARY_TABLE = re.compile(
+    r'^\s*create\s+temporary\s+table\s+(?:if\s+not\s+exists\s+)?`?(?:[^`\s.]+`?\.`?)?([^`\s.(]+)', re.IGNORECASE)
+
+# Rows are read this many at a time, so that a big result set can be moved
+# to disk before all of it is in memory.
+FETCH_CHUNK_SIZE = 5000
+
+Batch = collections.namedtuple('Batch', ['parallel', 'indexes'])
+
+
+def _strip_leading_comments(query):
+    return nvim_mysql.schema.LEADING_COMMENTS.sub('', query, count=1)
+
+
+def is_independent_read(query, temporary_tables=()):
+    """Return whether query only reads, and can be run on any connection.
+
+    Temporary tables only exist in the session that created them, so reads
+    that mention any of temporary_tables aren't independent either.
+
+    >>> is_independent_read("-- health check\\nselect count(*) from orders")
+    True
+    >>> is_independent_read("show processlist")
+    True
+    >>> is_independent_read("select * from orders for update")
+    False
+    >>> is_independent_read("select @total := count(*) from orders")
+    False
+    >>> is_independent_read("update orders set paid = 1")
+    False
+    >>> is_independent_read("select last_insert_id()"), is_independent_read("SELECT FOUND_ROWS ()")
+    (False, False)
+    >>> is_independent_read("select * from scratch", {'scratch'})
+    False
+    >>> [is_independent_read(q) for q in [
+    ...     "show warnings", "show session status", "show variables like 'sql_mode'", "select database()"]]
+    [False, False, False, False]
+    >>> is_independent_read("show global status"), is_independent_read("show databases")
+    (True, True)
+    """
+    query = _strip_leading_comments(query)
+    if not READ_STATEMENT.match(query) or NOT_INDEPENDENT.search(query):
+        return False
+    return not any(
+        re.search(r'(?<![\w$]){}(?![\w$])'.format(re.escape(table)), query, re.IGNORECASE)
+        for table in temporary_tables)
+
+
+def temporary_table(query):
+    """Return the name of the table query creates, if it creates a temporary one.
+
+    >>> temporary_table("CREATE TEMPORARY TABLE IF NOT EXISTS `db`.`scratch` (id int)")
+    'scratch'
+    >>> temporary_table("create table scratch (id int)") is None
+    True
+    """
+    match = CREATE_TEMPORARY_TABLE.match(_strip_leading_comments(query))
+    return match.group(1) if match else None
+
+
+def is_session_statement(query):
+    """Return whether query changes (or depends on) the state of its session.
+
+    >>> is_session_statement("SET sql_mode = ''")
+    True
+    >>> is_session_statement("start transaction")
+    True
+    >>> is_session_statement("settle_up()")
+    False
+    """
+    return bool(SESSION_STATEMENT.match(_strip_leading_comments(query)))
+
+
+def changes_session(query):
+    """Return whether query leaves state behind in its session.
+
+    That is, whether it's a session statement (see is_session_statement),
+    or takes a named lock.
+
+    >>> changes_session("use shop"), changes_session("select get_lock('x', 10)")
+    (True, True)
+    >>> changes_session("select * from orders")
+    False
+    """
+    return is_session_statement(query) or bool(re.search(r'\bget_lock\s*\(', query, re.IGNORECASE))
+
+
+def plan(queries, temporary_tables=()):
+    """Split queries into batches to run one after another.
+
+    Runs of independent reads are put in batches that can be run in
+    parallel; everything else is run sequentially, on its own. Once a
+    statement that changes session state has been seen, every later
+    statement is run sequentially too (on the same connection), since it
+    may depend on that state. Reads of temporary_tables (those created
+    earlier in the session; see is_independent_read) are run sequentially
+    as well.
+
+    >>> for batch in plan(["select 1", "select 2", "update t set a = 1", "select 3", "use db", "select 4"]):
+    ...     print(batch)
+    Batch(parallel=True, indexes=[0, 1])
+    Batch(parallel=False, indexes=[2])
+    Batch(parallel=True, indexes=[3])
+    Batch(parallel=False, indexes=[4])
+    Batch(parallel=False, indexes=[5])
+    >>> for batch in plan(["insert into t values (1)", "select last_insert_id()", "select 5"]):
+    ...     print(batch)
+    Batch(parallel=False, indexes=[0])
+    Batch(parallel=False, indexes=[1])
+    Batch(parallel=True, indexes=[2])
+    """
+    batches = []
+    session_changed = False
+    for i, query in enumerate(queries):
+        session_changed = session_changed or is_session_statement(query)
+        if not session_changed and is_independent_read(query, temporary_tables):
+            if batches and batches[-1].parallel:
+                batches[-1].indexes.append(i)
+            else:
+                batches.append(Batch(True, [i]))
+        else:
+            batches.append(Batch(False, [i]))
+    return batches
+
+
+def run_query(conn, query, disk_threshold, database=None):
+    """Run query on conn and return a dict describing its outcome.
+
+    The dict has the keys 'description', 'data' (a ResultSet, for queries
+    that return rows), 'rowcount', 'warnings', 'timings' (how long each
+    stage took; see nvim_mysql.results.format_timings) and 'error' (None if
+    the query succeeded), as well as 'start' and 'end' times.
+    """
+    import pymysql.cursors
+    result = {'description': None, 'data': None, 'start': time.time()}
+    cursor = conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        if database is not None:
+            conn.select_db(database)
+        start = time.time()
+        cursor.execute(query)
+        first_byte = time.time()
+        result['description'] = cursor.description
+        if cursor.description:
+            data = nvim_mysql.results.ResultSet(
+                [f[0] for f in cursor.description], [f[1] for f in cursor.description])
+            while True:
+                chunk = cursor.fetchmany(FETCH_CHUNK_SIZE)
+                data.append_rows(chunk)
+                if not data.on_disk and data.nbytes() > disk_threshold:
+                    data = data.to_disk()
+                if len(chunk) < FETCH_CHUNK_SIZE:
+                    break
+            result['data'] = data
+            result['rowcount'] = len(data)
+        else:
+            result['rowcount'] = cursor.rowcount
+        fetched = time.time()
+
+        cursor.execute("show warnings")
+        result['warnings'] = cursor.fetchall()
+        result['timings'] = {
+            'first_byte': first_byte - start,
+            'fetch': fetched - first_byte,
+            'warnings': time.time() - fetched,
+        }
+    except Exception as e:
+        result['error'] = "Error: " + repr(e)
+    else:
+        result['error'] = None
+    finally:
+        cursor.close()
+    result['end'] = time.time()
+    return result
+
+
+def run_parallel(queries, pool, executor, disk_threshold, database=None, in_flight=None):
+    """Run queries at the same time on executor, each on a connection from pool.
+
+    At most as many connections are used as the executor has workers.
+
+    Return their outcomes (see run_query), in the same order as queries.
+    Connections are added to the in_flight set (if given) while they're
+    running a query, so that they can be killed. Connections whose query
+    failed are closed rather than reused, since the failure may have left
+    them in a bad state.
+    """
+    def run(query):
+        conn = pool.acquire()
+        result = {'error': "Error: query did not complete"}
+        if in_flight is not None:
+            in_flight.add(conn)
+        try:
+            result = run_query(conn, query, disk_threshold, database)
+            return result
+        finally:
+            if in_flight is not None:
+                in_flight.discard(conn)
+            pool.release(conn, healthy=result['error'] is None)
+
+    logger.debug("running {} queries in parallel".format(len(queries)))
+    return list(executor.map(run, queries))
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Idle connections that have been used more recently than this (in seconds)
+# are handed out without pinging them first.
+PING_AFTER = 5
+
+
+class ConnectionPool(object):
+    """Pool of auxiliary connections to one server.
+
+    These are the side connections used for autocompletion, killing queries
+    and metadata lookups while a tab's primary connection is busy, so that
+    they don't have to pay for a new connection (and handshake) every time.
+
+    Connections are only opened when asked for and none are idle (connect is
+    called to open one). Returned connections are kept for reuse, up to
+    max_idle of them; any more are closed. Idle connections are pinged
+    before they're handed out again, and dropped if they've gone away.
+
+    >>> class Connection(object):
+    ...     count = 0
+    ...     def __init__(self):
+    ...         Connection.count += 1
+    ...     def close(self):
+    ...         print('closed')
+    >>> pool = ConnectionPool(Connection, max_idle=1)
+    >>> with pool.connection() as a, pool.connection() as b:
+    ...     pass
+    closed
+    >>> with pool.connection() as c:
+    ...     pass
+    >>> c is b, Connection.count
+    (True, 2)
+    >>> pool.close()
+    closed
+    """
+    def __init__(self, connect, max_idle, ping_after=PING_AFTER):
+        self.connect = connect
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = []  # [(time released, connection)]
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        """Return a connection, reusing an idle one if there is a healthy one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                released, conn = self._idle.pop()
+            if time.time() - released < self.ping_after:
+                return conn
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except Exception:
+                logger.debug("dropping dead auxiliary connection")
+                self._close(conn)
+
+        logger.debug("opening auxiliary connection")
+        return self.connect()
+
+    def release(self, conn, healthy=True):
+        """Give back a connection that was returned by acquire.
+
+        Pass healthy=False if the connection may be in a bad state (e.g. a
+        query failed partway through reading results), so that it is closed
+        rather than reused.
+        """
+        with self._lock:
+            if healthy and not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append((time.time(), conn))
+                return
+        self._close(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager that acquires a connection and then releases it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, healthy=False)
+            raise
+        self.release(conn)
+
+    def close(self):
+        """Close all idle connections, and any that are released from now on."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for _, conn in idle:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+# Literals (and comments) are what make otherwise identical statements
+# differ. Quoted identifiers are matched first so they are left alone.
+TOKEN = re.compile(r"""
+    (?P<ident>`(?:[^`]|``)*`)
+  | (?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+  | (?P<comment>/\*.*?\*/|(?:--\s|\#)[^\n]*)
+  | (?P<number>\b(?:0x[0-9a-f]+|\d+(?:\.\d+)?(?:e[-+]?\d+)?)\b)
+""", re.IGNORECASE | re.DOTALL | re.VERBOSE)
+WHITESPACE = re.compile(r'\s+')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+REPEATED_LISTS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+# The exception type and MySQL error code at the start of an error message.
+ERROR_CODE = re.compile(r'^Error: (\w+(?:\(\d+)?)')
+
+
+def normalize(query):
+    """Return query with literals replaced by placeholders.
+
+    Statements that differ only in their literal values (or comments,
+    whitespace and case) normalize to the same text.
+
+    >>> normalize("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x' -- hi")
+    'select * from t where id in (...) and name = ?'
+    >>> normalize("insert into `T1` values (1, 'a'), (2, 'b');")
+    'insert into `t1` values (...)'
+    """
+    def replace(match):
+        if match.group('ident'):
+            return match.group('ident')
+        if match.group('comment'):
+            return ' '
+        return '?'
+
+    query = TOKEN.sub(replace, query)
+    query = WHITESPACE.sub(' ', query).strip().rstrip(';').strip().lower()
+    query = PLACEHOLDER_LIST.sub('(...)', query)
+    return REPEATED_LISTS.sub('(...)', query)
+
+
+def digest(normalized):
+    """Return a short identifier for a normalized query.
+
+    >>> digest(normalize("select 1")) == digest(normalize("SELECT  2"))
+    True
+    """
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def log_path(cache_dir, db_params):
+    """Return the file that queries run on the given server are logged to.
+
+    The file is named after the server, user and database only, so that
+    the password doesn't end up (hashed) in it.
+
+    >>> log_path('/cache', {'host': 'db1', 'user': 'me', 'passwd': 'secret'})
+    '/cache/nvim-mysql/log/2d89f07edd712bfc2fb1d1c0.jsonl'
+    >>> log_path('/cache', {'host': 'db1', 'user': 'me', 'passwd': 'other'})
+    '/cache/nvim-mysql/log/2d89f07edd712bfc2fb1d1c0.jsonl'
+    """
+    key = [db_params.get(k) for k in ('host', 'port', 'user', 'db')]
+    name = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:24]
+    return os.path.join(cache_dir, 'nvim-mysql', 'log', name + '.jsonl')
+
+
+def error_code(error):
+    """Return the type and code of an error, without its (possibly sensitive) message.
+
+    >>> error_code('Error: IntegrityError(1062, "Duplicate entry \\'ann@example.com\\' for key \\'email\\'")')
+    'Error: IntegrityError(1062)'
+    >>> error_code("Error: InterfaceError(0, '')"), error_code("Error: RuntimeError('oops')")
+    ('Error: InterfaceError(0)', 'Error: RuntimeError')
+    """
+    match = ERROR_CODE.match(error)
+    if match is None:
+        return 'Error'
+    code = match.group(1)
+    return 'Error: ' + (code + ')' if '(' in code else code)
+
+
+def entry(timestamp, tab, query, duration, rows, error, full_text=False):
+    """Return the log entry for one statement.
+
+    Queries can contain passwords and personal data in their literal values
+    (as can error messages), so unless full_text is true only the
+    normalized query and the type and code of the error are kept.
+    """
+    normalized = normalize(query)
+    e = {
+        'timestamp': round(timestamp, 3),
+        'tab': tab,
+        'normalized': normalized,
+        'digest': digest(normalized),
+        'duration': round(duration, 6),
+        'rows': rows,
+        'error': error if full_text or not error else error_code(error),
+    }
+    if full_text:
+        e['query'] = query
+    return e
+
+
+def append(path, entries, max_size=None):
+    """Append entries to the log at path, one JSON object per line.
+
+    Once the log is bigger than max_size bytes, it is moved aside (replacing
+    the one moved aside before it) and a new one is started.
+
+    The log (and its directory, if it has to be created) can only be read by
+    the user.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o700)
+    if max_size is not None and os.path.exists(path) and os.path.getsize(path) > max_size:
+        os.replace(path, path + '.1')
+        logger.debug("rotated query log {}".format(path))
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    with os.fdopen(fd, 'a') as f:
+        for e in entries:
+            f.write(json.dumps(e) + '\n')
+
+
+def read(path):
+    """Yield the entries in the log at path (and the one moved aside), oldest first.
+
+    Lines that can't be parsed (e.g. one cut short by a crash) are skipped.
+    """
+    for p in [path + '.1', path]:
+        try:
+            f = open(p)
+        except (IOError, OSError):
+            continue
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def percentile(values, p):
+    """Return the p-th percentile of sorted values (nearest rank).
+
+    >>> percentile([1, 2, 3, 4], 50), percentile([1, 2, 3, 4], 95), percentile([7], 50)
+    (2, 4, 7)
+    """
+    rank = -(-len(values) * p // 100)  # ceil
+    return values[max(int(rank), 1) - 1]
+
+
+def stats(entries):
+    """Group entries by digest, and return a summary of each group.
+
+    Summaries are dicts with the digest, a (normalized) query, the number of
+    times it ran and how many of those failed, and its p50, p95, max and
+    total duration. The groups that took the most time in total come first.
+
+    >>> rows = stats([
+    ...     entry(0, 1, "select 1", 0.5, 1, None),
+    ...     entry(0, 1, "select 2", 1.5, 1, None),
+    ...     entry(0, 1, "drop table x", 0.1, 0, "Error: ..."),
+    ... ])
+    >>> [(r['query'], r['count'], r['errors'], r['p50'], r['max'], r['total']) for r in rows]
+    [('select ?', 2, 0, 0.5, 1.5, 2.0), ('drop table x', 1, 1, 0.1, 0.1, 0.1)]
+    """
+    groups = collections.OrderedDict()
+    for e in entries:
+        group = groups.setdefault(e['digest'], {'query': e['normalized'], 'durations': [], 'errors': 0})
+        group['durations'].append(e['duration'])
+        if e['error']:
+            group['errors'] += 1
+
+    summaries = []
+    for d, group in groups.items():
+        durations = sorted(group['durations'])
+        summaries.append({
+            'digest': d,
+            'query': group['query'],
+            'count': len(durations),
+            'errors': group['errors'],
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'max': durations[-1],
+            'total': sum(durations),
+        })
+    summaries.sort(key=lambda s: s['total'], reverse=True)
+    return summaries
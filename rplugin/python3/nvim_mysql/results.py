@@ -0,0 +1,837 @@
+# -*- coding: utf-8 -*-
+
+import array
+import collections
+import io
+import itertools
+import logging
+import mmap
+import os
+import pickle
+import re
+import struct
+import tempfile
+import threading
+import weakref
+import zlib
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class FT(object):
+    """The MySQL column type codes that matter here.
+
+    These are the values of pymysql.constants.FIELD_TYPE, copied so that
+    pymysql needn't be imported just to format results.
+    """
+    DECIMAL = 0
+    TINY = 1
+    SHORT = 2
+    LONG = 3
+    FLOAT = 4
+    DOUBLE = 5
+    TIMESTAMP = 7
+    LONGLONG = 8
+    INT24 = 9
+    DATE = 10
+    TIME = 11
+    DATETIME = 12
+    YEAR = 13
+    NEWDATE = 14
+    NEWDECIMAL = 246
+    BLOB = 252
+    VAR_STRING = 253
+
+
+NUMERIC_TYPES = [
+    FT.DECIMAL,
+    FT.TINY,
+    FT.SHORT,
+    FT.LONG,
+    FT.FLOAT,
+    FT.DOUBLE,
+    FT.LONGLONG,
+    FT.INT24,
+    FT.NEWDECIMAL,
+]
+
+DATE_TYPES = [
+    FT.TIMESTAMP,
+    FT.DATE,
+    FT.TIME,
+    FT.DATETIME,
+    FT.YEAR,
+    FT.NEWDATE,
+]
+
+# Rough per-object overhead of a Python str, for memory accounting.
+STR_OVERHEAD = 50
+
+# Everything str.splitlines() splits on.
+LINE_BREAK = re.compile(u'[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+def prepend_type_hints_to_header(header, types):
+    for i, t in enumerate(types):
+        if t in NUMERIC_TYPES:
+            header[i] = '#' + header[i]
+        elif t in DATE_TYPES:
+            header[i] = '@' + header[i]
+
+
+def text_value(v):
+    """Return the full text of a (non-NULL) value.
+
+    Unlike display_value, line breaks are preserved.
+
+    >>> text_value(b'a\\nb')
+    'a\\nb'
+    >>> text_value(b'\\xff')
+    '0xff'
+    """
+    if isinstance(v, bytes):
+        try:
+            return v.decode('utf-8')
+        except UnicodeDecodeError:
+            return '0x' + v.hex()
+    return str(v)
+
+
+def display_value(v):
+    """Return the value to display for one particular cell/value."""
+    if v is None:
+        return u'NULL'
+    v = text_value(v)
+    if LINE_BREAK.search(v):
+        v = ' '.join(v.splitlines())
+    return v
+
+
+class ResultSet(object):
+    """Columnar store for the rows of a result set.
+
+    Every cell is converted to its display string exactly once, as rows are
+    added. The display strings are what all of the output formats are built
+    from, and the maximum display width of each column is kept up to date,
+    so formatting never has to rescan the original values.
+
+    The few cells whose full text differs from their display string (NULLs
+    and values with line breaks) have their text kept on the side for the
+    formats that need it (csv, raw_column).
+
+    Big result sets can be moved to disk with to_disk.
+
+    >>> rs = ResultSet(['id', 'name'], [FT.LONG, FT.VAR_STRING])
+    >>> rs.append_rows([(1, 'ann'), (20, None), (3, 'b\\nc')])
+    >>> len(rs), rs.widths
+    (3, [2, 4])
+    >>> rs.display_row(2)
+    ['3', 'b c']
+    >>> rs.text_row(1), rs.text_row(2)
+    (['20', None], ['3', 'b\\nc'])
+    """
+    on_disk = False
+
+    def __init__(self, header, types=None):
+        self.header = list(header)
+        self.types = list(types) if types else None
+        self.columns = [[] for _ in self.header]
+        self.widths = [0 for _ in self.header]
+        self.text = {}  # {row index: {col index: text}}
+        self.count = 0
+        self.size = 0  # total length of display strings
+
+    @classmethod
+    def from_rows(cls, header, rows, types=None):
+        result_set = cls(header, types)
+        result_set.append_rows(rows)
+        return result_set
+
+    def __len__(self):
+        return self.count
+
+    def append_rows(self, rows):
+        """Add rows (sequences of raw values, e.g. from a cursor)."""
+        columns = self.columns
+        widths = self.widths
+        size = 0
+        i = self.count
+        for row in rows:
+            for j, v in enumerate(row):
+                if v is None:
+                    s = u'NULL'
+                    self.text.setdefault(i, {})[j] = None
+                else:
+                    s = v if type(v) is str else text_value(v)
+                    if LINE_BREAK.search(s):
+                        self.text.setdefault(i, {})[j] = s
+                        s = ' '.join(s.splitlines())
+                columns[j].append(s)
+                n = len(s)
+                size += n
+                if n > widths[j]:
+                    widths[j] = n
+            i += 1
+        self.count = i
+        self.size += size
+
+    def nbytes(self):
+        """Return a rough estimate of the memory used by the stored strings."""
+        # Each cell costs a str object plus a pointer in its column list.
+        return self.size + (STR_OVERHEAD + 8) * self.count * len(self.header)
+
+    def display_row(self, i):
+        return [c[i] for c in self.columns]
+
+    def display_rows(self, start=0, stop=None):
+        """Iterate over rows of display strings."""
+        if start == 0 and stop is None:
+            return zip(*self.columns)
+        return zip(*[c[start:stop] for c in self.columns])
+
+    def text_row(self, i):
+        """Return the full text of each cell in row i (None for NULL)."""
+        row = self.display_row(i)
+        for j, t in self.text.get(i, {}).items():
+            row[j] = t
+        return row
+
+    def text_rows(self, start=0, stop=None):
+        for i in range(start, self.count if stop is None else min(stop, self.count)):
+            yield self.text_row(i)
+
+    def hinted_header(self):
+        """Return the header with type hints prepended to the field names."""
+        header = self.header[:]
+        if self.types:
+            prepend_type_hints_to_header(header, self.types)
+        return header
+
+    def to_disk(self):
+        """Return a DiskResultSet with the same rows."""
+        result_set = DiskResultSet(self.header, self.types)
+        result_set.append_text_rows(self.text_rows())
+        return result_set
+
+    def close(self):
+        pass
+
+
+class DiskResultSet(object):
+    """Result set whose rows are kept in a temporary file instead of in memory.
+
+    Has the same interface as ResultSet. Each row is written as a sequence of
+    cells, each cell being its full text in utf-8 prefixed by its length as
+    a 4-byte little-endian integer (0xffffffff for NULL). Only the offset of
+    each row is kept in memory; rows are read back through mmap, so any row
+    can be fetched without reading the others.
+
+    Display strings are derived from the stored text when rows are read.
+    Column widths are kept up to date as rows are added, as in ResultSet.
+
+    >>> rs = DiskResultSet(['id', 'name'])
+    >>> rs.append_rows([(1, 'ann'), (20, None), (3, u'b\\nç')])
+    >>> len(rs), rs.widths
+    (3, [2, 4])
+    >>> rs.display_row(2), rs.text_row(2)
+    (['3', 'b ç'], ['3', 'b\\nç'])
+    >>> list(rs.display_rows(1))
+    [['20', 'NULL'], ['3', 'b ç']]
+    >>> rs.close()
+    """
+    on_disk = True
+
+    NULL_LENGTH = 0xffffffff
+    CELL_LENGTH = struct.Struct('<I')
+
+    def __init__(self, header, types=None):
+        self.header = list(header)
+        self.types = list(types) if types else None
+        self.widths = [0 for _ in self.header]
+        self.count = 0
+        self.size = 0
+        self.offsets = array.array('Q')
+        fd, self.path = tempfile.mkstemp(prefix='nvim-mysql-', suffix='.rows')
+        logger.debug("storing result set in {}".format(self.path))
+        self._file = os.fdopen(fd, 'wb')
+        self._file_size = 0
+        self._map = None
+        self._map_size = 0
+        # Rows may be appended (by the thread fetching them) while others are
+        # being read (by the main thread).
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def __len__(self):
+        return self.count
+
+    def append_rows(self, rows):
+        """Add rows (sequences of raw values, e.g. from a cursor)."""
+        self.append_text_rows(
+            [None if v is None else (v if type(v) is str else text_value(v)) for v in row]
+            for row in rows)
+
+    def append_text_rows(self, rows):
+        """Add rows whose values have already been converted by text_value."""
+        pack = self.CELL_LENGTH.pack
+        widths = self.widths
+        chunks = []
+        offset = self._file_size
+        offsets = []
+        size = 0
+        for row in rows:
+            offsets.append(offset)
+            for j, t in enumerate(row):
+                if t is None:
+                    chunks.append(pack(self.NULL_LENGTH))
+                    offset += 4
+                    n = 4
+                else:
+                    b = t.encode('utf-8', 'surrogatepass')
+                    chunks.append(pack(len(b)))
+                    chunks.append(b)
+                    offset += 4 + len(b)
+                    n = len(t)
+                    if LINE_BREAK.search(t):
+                        n = len(' '.join(t.splitlines()))
+                size += n
+                if n > widths[j]:
+                    widths[j] = n
+        with self._lock:
+            self._file.write(b''.join(chunks))
+            self._file_size = offset
+            self.offsets.extend(offsets)
+            self.count += len(offsets)
+            self.size += size
+
+    def nbytes(self):
+        """Return a rough estimate of the memory used (just the row index)."""
+        return self.offsets.itemsize * len(self.offsets)
+
+    def _buffer(self, end):
+        """Return a memory map of the file that covers at least [0, end)."""
+        if end > self._map_size:
+            with self._lock:
+                self._file.flush()
+                if self._map is not None:
+                    self._map.close()
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._map_size = len(self._map)
+        return self._map
+
+    def text_row(self, i):
+        """Return the full text of each cell in row i (None for NULL)."""
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < self.count else self._file_size
+        buf = self._buffer(end)
+        unpack_from = self.CELL_LENGTH.unpack_from
+        row = []
+        pos = start
+        for _ in self.header:
+            n, = unpack_from(buf, pos)
+            pos += 4
+            if n == self.NULL_LENGTH:
+                row.append(None)
+            else:
+                row.append(buf[pos:pos + n].decode('utf-8', 'surrogatepass'))
+                pos += n
+        return row
+
+    def text_rows(self, start=0, stop=None):
+        for i in range(start, self.count if stop is None else min(stop, self.count)):
+            yield self.text_row(i)
+
+    def display_row(self, i):
+        return [_display_text(t) for t in self.text_row(i)]
+
+    def display_rows(self, start=0, stop=None):
+        """Iterate over rows of display strings."""
+        for row in self.text_rows(start, stop):
+            yield [_display_text(t) for t in row]
+
+    def hinted_header(self):
+        """Return the header with type hints prepended to the field names."""
+        header = self.header[:]
+        if self.types:
+            prepend_type_hints_to_header(header, self.types)
+        return header
+
+    def close(self):
+        """Delete the underlying file."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.close()
+        self._finalizer()
+
+
+def _display_text(t):
+    # display_value for a value that has already been through text_value.
+    if t is None:
+        return u'NULL'
+    if LINE_BREAK.search(t):
+        return ' '.join(t.splitlines())
+    return t
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def table_col_lengths(result_set):
+    """Return the width of each column of the ASCII table for result_set."""
+    return [max(len(h), w) for h, w in zip(result_set.hinted_header(), result_set.widths)]
+
+
+def table_horizontal_bar(col_lengths):
+    return '+' + '+'.join(['-' * (l + 2) for l in col_lengths]) + '+'
+
+
+def table_row(row, col_lengths):
+    """Return a row of display strings formatted as an ASCII table row.
+
+    Values wider than their column are not truncated.
+
+    >>> table_row(['1', 'NULL', 'abc'], [3, 4, 1])
+    '| 1   | NULL | abc |'
+    """
+    return '| ' + ' | '.join([v.ljust(l) for v, l in zip(row, col_lengths)]) + ' |'
+
+
+def table_head(result_set, col_lengths):
+    horizontal_bar = table_horizontal_bar(col_lengths)
+    return [
+        horizontal_bar,
+        table_row(result_set.hinted_header(), col_lengths),
+        horizontal_bar,
+    ]
+
+
+def iter_table(result_set):
+    """Yield the lines of result_set formatted as an ASCII table."""
+    col_lengths = table_col_lengths(result_set)
+    for line in table_head(result_set, col_lengths):
+        yield line
+    for row in result_set.display_rows():
+        yield table_row(row, col_lengths)
+    yield table_horizontal_bar(col_lengths)
+
+
+def iter_vertical(result_set):
+    """Yield the lines of result_set formatted as a series of field: value lines."""
+    header = result_set.hinted_header()
+    max_header_length = max(len(h) for h in header)
+    header_strs = ['{{:>{}}}: '.format(max_header_length + 1).format(h) for h in header]
+
+    n = len(result_set)
+    for i, row in enumerate(result_set.display_rows(), 1):
+        if n > 1:
+            yield '***** row {} *****'.format(i)
+
+        for h, v in zip(header_strs, row):
+            yield h + v
+
+        if n > 1 and i < n:
+            yield ''
+
+
+def iter_csv(result_set):
+    """Yield the lines of result_set formatted as a CSV file."""
+    import csv
+
+    f = io.StringIO()
+    csv_out = csv.writer(f)
+
+    def csv_lines(row):
+        f.seek(0)
+        f.truncate()
+        csv_out.writerow(row)
+        return f.getvalue().splitlines()
+
+    for line in csv_lines(result_set.header):
+        yield line
+    for row in result_set.text_rows():
+        for line in csv_lines(row):
+            yield line
+
+
+def iter_raw_column(result_set):
+    """Yield the full text of the first column of each row."""
+    for row in result_set.text_rows():
+        v = u'NULL' if row[0] is None else row[0]
+        for line in v.splitlines() or ['']:
+            yield line
+
+
+def results_to_table(header, rows, types=None):
+    """Format query result set as an ASCII table.
+
+    If a list of field types is provided (from cursor.description), type hints
+    will be added to the headers.
+
+    Return a list of strings.
+    """
+    return list(iter_table(ResultSet.from_rows(header, rows, types)))
+
+
+def results_to_vertical(header, rows, types=None):
+    """Format query result set as a series of field: value lines.
+
+    Each row will span len(row) lines.
+
+    If a list of field types is provided (from cursor.description), type hints
+    will be added to the headers.
+
+    Return a list of strings.
+    """
+    return list(iter_vertical(ResultSet.from_rows(header, rows, types)))
+
+
+def results_to_csv(header, rows):
+    """Format query result set as a CSV file.
+
+    Binary data that is not valid utf-8 is shown in hex, as in the other
+    formats.
+    """
+    return list(iter_csv(ResultSet.from_rows(header, rows)))
+
+
+def format_results(results, format_='table', metadata=None):
+    """Format results for display in the results buffer.
+
+    Return a list of strings.
+    """
+    return list(iter_format_results(results, format_, metadata))
+
+
+def iter_format_results(results, format_='table', metadata=None):
+    """Like format_results, but yield lines one at a time.
+
+    Nothing is formatted until the first line is requested.
+
+    If metadata has 'timings' (see format_timings), the table format shows
+    them under the summary line; the index of that line is stored in
+    metadata['timings_line'], so that it can be updated later.
+
+    >>> results = {'type': 'write', 'count': 3, 'warnings': []}
+    >>> list(iter_format_results(results, 'table', {'duration': 0.5}))
+    ['', '3 row(s) affected (0.50 sec)']
+    >>> metadata = {'timings': {'first_byte': 0.25}}
+    >>> list(iter_format_results(results, 'table', metadata)), metadata['timings_line']
+    (['', '3 row(s) affected', 'first byte 0.250s'], 2)
+    """
+    if metadata is None:
+        metadata = {}
+
+    # The last line of the result itself, if any, which gets the duration.
+    summary = None
+    summary_line = None  # index of the summary line
+    if results['type'] == 'read':
+        data = results['data']
+        if format_ == 'table':
+            lines = iter_table(data)
+            summary = "{} row(s) in set, {} col(s)".format(results['count'], len(data.header))
+            # head (3 lines), one line per row, bottom bar, blank line
+            summary_line = len(data) + 5
+        elif format_ == 'csv':
+            lines = iter_csv(data)
+        elif format_ == 'raw_column':
+            lines = iter_raw_column(data)
+        elif format_ == 'vertical':
+            lines = iter_vertical(data)
+        else:
+            raise ValueError("Invalid results format '{}'".format(format_))
+        for line in lines:
+            yield line
+        if summary is not None:
+            yield ""
+    elif results['type'] == 'write':
+        yield ""
+        summary = "{} row(s) affected".format(results['count'])
+        summary_line = 1
+    elif results['type'] == 'error':
+        for line in results['message'].splitlines():
+            yield line
+
+    if summary is not None:
+        duration = metadata.get('duration')
+        if format_ == 'table' and duration is not None:
+            summary += " ({:.2f} sec)".format(duration)
+        yield summary
+
+        timings = metadata.get('timings')
+        if format_ == 'table' and timings:
+            metadata['timings_line'] = summary_line + 1
+            yield format_timings(timings)
+
+    if format_ == 'table':
+        warnings = results.get('warnings')
+        if warnings:
+            yield ''
+            yield '[warnings]:'
+            for warning in warnings:
+                yield "({}) {}".format(warning[1], warning[2])
+
+        query = metadata.get('query')
+        if query is not None:
+            for line in ['', '---', ''] + query.splitlines():
+                yield line
+
+
+# Stages of getting a result set to the screen, in order, with their labels.
+TIMING_STAGES = [
+    ('first_byte', 'first byte'),
+    ('fetch', 'fetch'),
+    ('warnings', 'warnings'),
+    ('format', 'format'),
+    ('write', 'write'),
+]
+
+
+def format_size(n):
+    """Return a number of bytes in human-readable form.
+
+    >>> format_size(512), format_size(46694), format_size(3 * 1024 ** 3)
+    ('512 B', '45.6 KiB', '3072.0 MiB')
+    """
+    if n < 1024:
+        return '{} B'.format(n)
+    if n < 1024 ** 2:
+        return '{:.1f} KiB'.format(n / 1024)
+    return '{:.1f} MiB'.format(n / 1024 ** 2)
+
+
+def format_timings(timings):
+    """Return a line describing how long each stage of getting results took.
+
+    timings has the durations (in seconds) of whichever of TIMING_STAGES
+    are known, and optionally 'rows' and 'bytes' (written to the buffer).
+
+    >>> format_timings({'first_byte': 0.1204, 'fetch': 0.3, 'warnings': 0.002, 'rows': 1000, 'bytes': 46694})
+    'first byte 0.120s, fetch 0.300s, warnings 0.002s; 1000 row(s), 45.6 KiB written'
+    """
+    line = ', '.join(
+        '{} {:.3f}s'.format(label, timings[stage]) for stage, label in TIMING_STAGES if stage in timings)
+    counts = []
+    if 'rows' in timings:
+        counts.append('{} row(s)'.format(timings['rows']))
+    if 'bytes' in timings:
+        counts.append('{} written'.format(format_size(timings['bytes'])))
+    if counts:
+        line += '; ' + ', '.join(counts)
+    return line
+
+
+class ResultsView(object):
+    """Formatted results that are written to the results buffer on demand.
+
+    Lines are only pulled from the underlying iterable as they are needed
+    (i.e., as the user scrolls down), so that the cost of displaying a huge
+    result set is proportional to how much of it is actually looked at. The
+    lines taken so far are kept, so that the view can be redisplayed without
+    formatting anything again.
+
+    >>> view = ResultsView(str(i) for i in range(5))
+    >>> view.take(3)
+    ['0', '1', '2']
+    >>> view.exhausted
+    False
+    >>> view.take(3)
+    ['3', '4']
+    >>> view.exhausted, view.lines
+    (True, ['0', '1', '2', '3', '4'])
+    """
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self.lines = []
+        self.size = 0
+        self.exhausted = False
+
+    def take(self, n=None):
+        """Return up to n more lines, or all remaining lines if n is None."""
+        lines = list(itertools.islice(self._lines, n))
+        self.lines.extend(lines)
+        self.size += sum(len(l) for l in lines) + STR_OVERHEAD * len(lines)
+        if n is None or len(lines) < n:
+            self.exhausted = True
+        return lines
+
+
+class ResultsViewCache(object):
+    """LRU cache of ResultsViews, keyed by (results id, format).
+
+    Once the total size of the cached views exceeds max_size (in bytes), the
+    least recently used views are dropped. The most recently used view is
+    always kept, however big it is.
+
+    >>> cache = ResultsViewCache(max_size=250)
+    >>> for key in ['a', 'b', 'c']:
+    ...     view = ResultsView(['x' * 50])
+    ...     _ = view.take()
+    ...     cache.put(key, view)
+    >>> cache.get('a') is None, cache.get('b') is None, cache.get('c') is None
+    (True, False, False)
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.views = collections.OrderedDict()
+
+    def get(self, key):
+        view = self.views.get(key)
+        if view is not None:
+            self.views.move_to_end(key)
+        return view
+
+    def put(self, key, view):
+        self.views[key] = view
+        self.views.move_to_end(key)
+        self.evict()
+
+    def evict(self):
+        """Drop views until we are within budget.
+
+        Call this when a cached view has grown.
+        """
+        total = sum(v.size for v in self.views.values())
+        while total > self.max_size and len(self.views) > 1:
+            _, view = self.views.popitem(last=False)
+            total -= view.size
+
+    def discard(self, results_id):
+        """Drop all views of the given results."""
+        for key in [k for k in self.views if k[0] == results_id]:
+            del self.views[key]
+
+    def clear(self):
+        self.views.clear()
+
+
+class ResultsHistory(object):
+    """The most recent results shown in a tab, oldest first.
+
+    Each entry is a dict with at least a 'results' key. At most max_entries
+    entries are kept. When the results held in memory take up more than
+    max_size bytes, the oldest ones are pickled, compressed and spilled to a
+    temporary file, to be loaded again if they are revisited. The current
+    entry is always kept in memory.
+
+    If given, on_release is called with each entry that is spilled or
+    dropped, before that happens, so that anything derived from its results
+    can be released too.
+
+    >>> history = ResultsHistory(max_entries=2, max_size=0)
+    >>> for i in range(3):
+    ...     history.add({'results': {'type': 'write', 'count': i}})
+    >>> len(history), history.position
+    (2, 1)
+    >>> history.entries[0]['results'] is None
+    True
+    >>> history.back()['results']['count']
+    1
+    >>> history.back() is None
+    True
+    >>> history.forward()['results']['count']
+    2
+    >>> history.clear()
+    """
+    def __init__(self, max_entries, max_size, on_release=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.on_release = on_release
+        self.entries = []
+        self.position = -1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        """Add a new entry at the end of the history and make it current."""
+        self.entries.append(entry)
+        while len(self.entries) > max(self.max_entries, 1):
+            self._discard(self.entries.pop(0))
+        self.position = len(self.entries) - 1
+        self._enforce_budget()
+
+    def current(self):
+        if self.position < 0:
+            return None
+        return self._load(self.entries[self.position])
+
+    def back(self):
+        """Move to the previous entry and return it (None if there is none)."""
+        if self.position <= 0:
+            return None
+        self.position -= 1
+        return self.current()
+
+    def forward(self):
+        """Move to the next entry and return it (None if there is none)."""
+        if self.position >= len(self.entries) - 1:
+            return None
+        self.position += 1
+        return self.current()
+
+    def clear(self):
+        for entry in self.entries:
+            self._discard(entry)
+        self.entries = []
+        self.position = -1
+
+    def _load(self, entry):
+        if entry['results'] is None:
+            logger.debug("loading spilled results from {}".format(entry['spill_path']))
+            with open(entry['spill_path'], 'rb') as f:
+                entry['results'] = pickle.loads(zlib.decompress(f.read()))
+            os.remove(entry['spill_path'])
+            entry['spill_path'] = None
+            self._enforce_budget()
+        return entry
+
+    def _spill(self, entry):
+        if self.on_release is not None:
+            self.on_release(entry)
+        fd, path = tempfile.mkstemp(prefix='nvim-mysql-', suffix='.results')
+        logger.debug("spilling results to {}".format(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(entry['results'], pickle.HIGHEST_PROTOCOL), 1))
+        entry['results'] = None
+        entry['spill_path'] = path
+
+    def _discard(self, entry):
+        if entry['results'] is not None:
+            if self.on_release is not None:
+                self.on_release(entry)
+            if entry['results']['type'] == 'read':
+                entry['results']['data'].close()
+        if entry.get('spill_path'):
+            try:
+                os.remove(entry['spill_path'])
+            except OSError:
+                pass
+
+    def _enforce_budget(self):
+        # Results that are already on disk don't need spilling.
+        in_memory = [
+            (i, results_size(e['results'])) for i, e in enumerate(self.entries)
+            if e['results'] is not None and not (
+                e['results']['type'] == 'read' and e['results']['data'].on_disk)]
+        total = sum(size for _, size in in_memory)
+        for i, size in in_memory:
+            if total <= self.max_size:
+                break
+            if i != self.position:
+                self._spill(self.entries[i])
+                total -= size
+
+
+def results_size(results):
+    """Return a rough estimate of the memory used by a results dict."""
+    if results['type'] == 'read':
+        return results['data'].nbytes()
+    return len(results.get('message', '')) + STR_OVERHEAD
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+DDL_STATEMENT = re.compile(r'^\s*(create|alter|drop|rename)\b', re.IGNORECASE)
+USE_STATEMENT = re.compile(r'^\s*use\b', re.IGNORECASE)
+USE_DATABASE = re.compile(r'^\s*use\s+`?([^`;\s]+)`?', re.IGNORECASE)
+LEADING_COMMENTS = re.compile(r'^(\s*(--[^\n]*\n|#[^\n]*\n|/\*.*?\*/))*', re.DOTALL)
+
+# How many databases to fetch tables and columns for at a time when
+# prefetching.
+PREFETCH_BATCH_SIZE = 50
+
+# Bump this when the format of persisted schema files changes.
+PERSIST_VERSION = 1
+
+
+def _strip_leading_comments(query):
+    return LEADING_COMMENTS.sub('', query, count=1)
+
+
+def is_ddl(query):
+    """Return whether query may change the schema.
+
+    >>> is_ddl("alter table x add column y int")
+    True
+    >>> is_ddl("-- add a table\\nCREATE TABLE x (y int)")
+    True
+    >>> is_ddl("select * from created")
+    False
+    """
+    return bool(DDL_STATEMENT.match(_strip_leading_comments(query)))
+
+
+def is_use(query):
+    """Return whether query changes the default database.
+
+    >>> is_use("use school")
+    True
+    >>> is_use("select * from used")
+    False
+    """
+    return bool(USE_STATEMENT.match(_strip_leading_comments(query)))
+
+
+def used_database(query):
+    """Return the database a USE statement switches to.
+
+    >>> used_database("use `school`;")
+    'school'
+    """
+    match = USE_DATABASE.match(_strip_leading_comments(query))
+    return match.group(1) if match else None
+
+
+class SchemaCache(object):
+    """Cache of database, table and column names for one connection.
+
+    Names are fetched from the server the first time they are asked for and
+    kept for ttl seconds. Lookups take a get_cursor callable, which is only
+    called (to get a cursor to run the lookup query on) on a cache miss.
+
+    Call invalidate after running a statement that may change the schema.
+
+    Columns of tables that aren't qualified with a database are looked for
+    under default_database first (so that prefetched columns can be found),
+    then fetched with a plain describe.
+
+    The whole cache can be saved to and loaded from a file (see save and
+    load), along with a marker that tells whether the server's schema has
+    changed since (see catalog_marker).
+
+    >>> class Cursor(object):
+    ...     def execute(self, query):
+    ...         print(query)
+    ...     def fetchall(self):
+    ...         return [('a',), ('b',)]
+    >>> cache = SchemaCache(ttl=60)
+    >>> cache.databases(Cursor)
+    show databases
+    ['a', 'b']
+    >>> cache.databases(Cursor)
+    ['a', 'b']
+    >>> cache.invalidate()
+    >>> cache.tables(Cursor, 'a')
+    show tables from `a`
+    ['a', 'b']
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.default_database = None
+        self.marker = None
+        self._entries = {}  # {key: (time fetched, names)}
+        self._lock = threading.Lock()
+        # Incremented on invalidation, so that names fetched in the
+        # background from before an invalidation can be thrown away.
+        self.generation = 0
+
+    def get(self, key):
+        """Return the cached names for key, or None if there are none (or they are stale)."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def store(self, key, names, generation=None):
+        """Cache names under key.
+
+        If generation is given, names are only stored if the cache hasn't been
+        invalidated since generation was read.
+        """
+        with self._lock:
+            if generation is None or generation == self.generation:
+                self._entries[key] = (time.time(), names)
+
+    def _lookup(self, key, get_cursor, query):
+        names = self.get(key)
+        if names is not None:
+            return names
+
+        logger.debug("schema cache miss: {}".format(key))
+        generation = self.generation
+        cursor = get_cursor()
+        cursor.execute(query)
+        names = [r[0] for r in cursor.fetchall()]
+        self.store(key, names, generation)
+        return names
+
+    def databases(self, get_cursor):
+        return self._lookup(('databases',), get_cursor, "show databases")
+
+    def tables(self, get_cursor, database):
+        return self._lookup(('tables', database), get_cursor, "show tables from `{}`".format(database))
+
+    def columns(self, get_cursor, table):
+        """Return the columns of table, which may be qualified with a database.
+
+        Raises pymysql.err.DatabaseError if there is no such table.
+        """
+        if '.' not in table and self.default_database is not None:
+            names = self.get(('columns', self.default_database + '.' + table))
+            if names is not None:
+                return names
+        return self._lookup(('columns', table), get_cursor, "describe {}".format(table))
+
+    def invalidate(self):
+        """Forget everything."""
+        logger.debug("invalidating schema cache")
+        with self._lock:
+            self._entries.clear()
+            self.marker = None
+            self.generation += 1
+
+    def set_marker(self, marker, generation=None):
+        """Record the catalog marker that the cached names correspond to."""
+        with self._lock:
+            if generation is None or generation == self.generation:
+                self.marker = marker
+
+    def save(self, path):
+        """Write the cache (and its marker) to path, as JSON.
+
+        Like the query log, the file (and its directory, if it has to be
+        created) can only be read by the user.
+        """
+        with self._lock:
+            data = {
+                'version': PERSIST_VERSION,
+                'marker': self.marker,
+                'entries': [[list(key), names] for key, (_, names) in self._entries.items()],
+            }
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, mode=0o700)
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        logger.debug("saved schema cache to {}".format(path))
+
+    def load(self, path):
+        """Load a cache written by save, if there is one.
+
+        Return whether anything was loaded.
+        """
+        generation = self.generation
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get('version') != PERSIST_VERSION:
+            return False
+        for key, names in data['entries']:
+            self.store(tuple(key), names, generation)
+        self.set_marker(data['marker'], generation)
+        logger.debug("loaded schema cache from {}".format(path))
+        return True
+
+    def forget_unqualified(self):
+        """Forget the columns of tables that were not qualified with a database.
+
+        Call this when the default database changes.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == 'columns' and '.' not in key[1]:
+                    del self._entries[key]
+
+
+def prefetch(schema, conn, batch_size=PREFETCH_BATCH_SIZE, progress=None):
+    """Fill schema with the names of all databases, tables and columns.
+
+    The catalog is read from information_schema: one query for the list of
+    databases, then one query for tables and one for columns per batch of
+    batch_size databases, so that servers with a huge number of tables
+    don't produce huge result sets. progress (if given) is called after
+    each batch has been stored.
+
+    This is meant to be run in the background, on a connection of its own.
+    """
+    generation = schema.generation
+    cursor = conn.cursor()
+
+    cursor.execute("select SCHEMA_NAME from information_schema.SCHEMATA order by SCHEMA_NAME")
+    databases = [r[0] for r in cursor.fetchall()]
+    schema.store(('databases',), databases, generation)
+
+    for i in range(0, len(databases), batch_size):
+        batch = databases[i:i + batch_size]
+
+        tables = collections.OrderedDict((database, []) for database in batch)
+        cursor.execute(
+            "select TABLE_SCHEMA, TABLE_NAME from information_schema.TABLES "
+            "where TABLE_SCHEMA in %s order by TABLE_SCHEMA, TABLE_NAME", [batch])
+        for database, table in cursor.fetchall():
+            tables.setdefault(database, []).append(table)
+
+        columns = collections.OrderedDict()
+        cursor.execute(
+            "select TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME from information_schema.COLUMNS "
+            "where TABLE_SCHEMA in %s order by TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION", [batch])
+        for database, table, column in cursor.fetchall():
+            columns.setdefault(database + '.' + table, []).append(column)
+
+        for database, names in tables.items():
+            schema.store(('tables', database), names, generation)
+        for table, names in columns.items():
+            schema.store(('columns', table), names, generation)
+        if progress is not None:
+            progress()
+
+    logger.debug("prefetched schema of {} databases".format(len(databases)))
+
+
+def load_catalog(schema, get_cursor):
+    """Fill schema with the names of all databases and their tables, in one query.
+
+    >>> class Cursor(object):
+    ...     def execute(self, query):
+    ...         pass
+    ...     def fetchall(self):
+    ...         return [('empty', None), ('shop', 'item'), ('shop', 'order')]
+    >>> cache = SchemaCache(ttl=60)
+    >>> load_catalog(cache, Cursor)
+    >>> cache.get(('databases',)), cache.get(('tables', 'empty')), cache.get(('tables', 'shop'))
+    (['empty', 'shop'], [], ['item', 'order'])
+    """
+    generation = schema.generation
+    cursor = get_cursor()
+    cursor.execute(
+        "select s.SCHEMA_NAME, t.TABLE_NAME from information_schema.SCHEMATA s "
+        "left join information_schema.TABLES t on t.TABLE_SCHEMA = s.SCHEMA_NAME "
+        "order by s.SCHEMA_NAME, t.TABLE_NAME")
+    tables = collections.OrderedDict()
+    for database, table in cursor.fetchall():
+        names = tables.setdefault(database, [])
+        if table is not None:
+            names.append(table)
+
+    schema.store(('databases',), list(tables), generation)
+    for database, names in tables.items():
+        schema.store(('tables', database), names, generation)
+    logger.debug("loaded catalog of {} databases".format(len(tables)))
+
+
+def catalog_marker(conn):
+    """Return a cheap fingerprint of the server's schema.
+
+    If this hasn't changed, the names of databases and tables (and, most
+    likely, columns) haven't either. Only things that change with DDL are
+    used (UPDATE_TIME changes with every write to a table).
+    """
+    cursor = conn.cursor()
+    cursor.execute("select count(*), max(CREATE_TIME) from information_schema.TABLES")
+    return [str(v) for v in cursor.fetchone()]
+
+
+def persist_path(cache_dir, db_params):
+    """Return the file that the schema of the given server is saved to.
+
+    The file is named after the server, user and database only, so that
+    the password doesn't end up (hashed) in it.
+
+    >>> persist_path('/cache', {'host': 'db1', 'user': 'me', 'passwd': 'secret'})
+    '/cache/nvim-mysql/schema/2d89f07edd712bfc2fb1d1c0.json'
+    >>> persist_path('/cache', {'host': 'db1', 'user': 'me', 'passwd': 'other'})
+    '/cache/nvim-mysql/schema/2d89f07edd712bfc2fb1d1c0.json'
+    """
+    key = [db_params.get(k) for k in ('host', 'port', 'user', 'db')]
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()[:24]
+    return os.path.join(cache_dir, 'nvim-mysql', 'schema', digest + '.json')
+
+
+def revalidate(schema, conn, path, progress=None):
+    """Make sure that schema (as loaded from path) is up to date, and save it.
+
+    If the catalog marker matches the one that was saved, nothing else is
+    fetched. Otherwise the whole schema is prefetched again (see prefetch
+    for progress).
+    """
+    marker = catalog_marker(conn)
+    if schema.marker is not None and schema.marker == marker:
+        logger.debug("persisted schema cache is up to date")
+        return
+    generation = schema.generation
+    prefetch(schema, conn, progress=progress)
+    schema.set_marker(marker, generation)
+    schema.save(path)
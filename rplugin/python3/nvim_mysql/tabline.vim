@@ -45,11 +45,15 @@ function MySQLTabLabel(n)
   let status_flag = gettabvar(a:n, "MySQLStatusFlag")
   if server != ""
     let name .= " (" . server
-    if status_flag == "e"
+    if status_flag == "e" || status_flag == "c"
         if g:nvim_mysql#use_spinner
             let status_flag = g:nvim_mysql#spinner_char
         endif
     endif
+    let jobs = gettabvar(a:n, "MySQLJobs")
+    if jobs != ""
+      let status_flag .= " " . jobs
+    endif
     if status_flag != ""
       let name .= " [" . status_flag . "]"
     endif
@@ -1,8 +1,52 @@
 # -*- coding: utf-8 -*-
 
+import difflib
 import itertools
 import re
 
+import pynvim.api
+
+# Lines around the cursor are read from the buffer in windows of this many
+# lines at first, doubling each time up to LINE_WINDOW_MAX, so that only
+# about as much as the paragraph under the cursor is fetched (over RPC),
+# however long the buffer is.
+LINE_WINDOW_MIN = 32
+LINE_WINDOW_MAX = 4096
+
+
+def _iter_lines_before(buffer, row):
+    """Yield the lines of buffer before row, nearest first.
+
+    >>> list(_iter_lines_before(['a', 'b', 'c'], 2))
+    ['b', 'a']
+    """
+    size = LINE_WINDOW_MIN
+    stop = row
+    while stop > 0:
+        start = max(stop - size, 0)
+        for line in reversed(buffer[start:stop]):
+            yield line
+        stop = start
+        size = min(size * 2, LINE_WINDOW_MAX)
+
+
+def _iter_lines_from(buffer, row):
+    """Yield the lines of buffer from row on.
+
+    >>> list(_iter_lines_from(['a', 'b', 'c'], 1))
+    ['b', 'c']
+    """
+    size = LINE_WINDOW_MIN
+    start = row
+    while True:
+        lines = buffer[start:start + size]
+        for line in lines:
+            yield line
+        if len(lines) < size:
+            return
+        start += size
+        size = min(size * 2, LINE_WINDOW_MAX)
+
 
 def get_query_under_cursor(buffer, row, col):
     r"""Return (query, row_in_query).
@@ -30,8 +74,8 @@ def get_query_under_cursor(buffer, row, col):
     if buffer[row].strip() == '':
         return (None, 0)
     else:
-        before = list(reversed(list(itertools.takewhile(bool, reversed(buffer[:row])))))
-        after = list(itertools.takewhile(bool, buffer[row:]))
+        before = list(reversed(list(itertools.takewhile(bool, _iter_lines_before(buffer, row)))))
+        after = list(itertools.takewhile(bool, _iter_lines_from(buffer, row)))
         return '\n'.join(before + after), len(before)
 
 
@@ -57,11 +101,11 @@ def get_queries_in_range(buffer, start_row, end_row):
     []
     """
     if buffer[start_row].strip():
-        before = list(reversed(list(itertools.takewhile(bool, reversed(buffer[:start_row])))))
+        before = list(reversed(list(itertools.takewhile(bool, _iter_lines_before(buffer, start_row)))))
     else:
         before = []
     if buffer[end_row].strip():
-        after = list(itertools.takewhile(bool, buffer[end_row:]))
+        after = list(itertools.takewhile(bool, _iter_lines_from(buffer, end_row)))
     else:
         after = []
 
@@ -125,7 +169,7 @@ def get_parent_database_in_tree(buffer, row):
     >>> get_parent_database_in_tree(buf, 3)
     ('c', False, 3)
     """
-    for i, line in enumerate(reversed(buffer[:row + 1])):
+    for i, line in enumerate(_iter_lines_before(buffer, row + 1)):
         if line.endswith(u'▾'):
             return (line[:-1].strip(), True, row - i)
         elif line.endswith(u'▸'):
@@ -185,3 +229,42 @@ def table_exists(conn, table):
         cursor.execute("show tables")
     tables = {r[0] for r in cursor.fetchall()}
     return t.table in tables
+
+
+def update_lines(buffer, old, new):
+    """Change the lines of buffer from old to new, writing only the ranges that differ.
+
+    >>> buf = ['db1 ▸', 'db2 ▾', '  t1', 'db3 ▸']
+    >>> update_lines(buf, list(buf), ['db1 ▾', '  a', '  b', 'db2 ▾', '  t1', 'db3 ▸'])
+    >>> buf
+    ['db1 ▾', '  a', '  b', 'db2 ▾', '  t1', 'db3 ▸']
+    """
+    opcodes = difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+    # Work backwards, so that earlier ranges don't shift.
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+        if tag != 'equal':
+            buffer[i1:i2] = new[j1:j2]
+
+
+def call_atomic(vim, calls):
+    """Make the given API calls in a single request, and return their results.
+
+    calls is a list of [method name, [args]] pairs, as taken by
+    nvim_call_atomic. If one of them fails, the ones after it aren't made,
+    and NvimError is raised.
+
+    >>> class Api(object):
+    ...     def call_atomic(self, calls):
+    ...         print(len(calls), 'calls')
+    ...         return [[None, 7], None]
+    >>> class Vim(object):
+    ...     api = Api()
+    >>> call_atomic(Vim(), [['nvim_command', ['setl nowrap']], ['nvim_create_buf', [True, True]]])
+    2 calls
+    [None, 7]
+    """
+    results, error = vim.api.call_atomic(calls)
+    if error is not None:
+        index, _, message = error
+        raise pynvim.api.NvimError("{} (in {}: {})".format(message, calls[index][0], calls[index][1]))
+    return results
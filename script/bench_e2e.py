@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark the plugin end to end, with no Neovim and no MySQL server.
+
+Runs the plugin against the fake Neovim and fake MySQL server in
+test/harness.py and reports, for each stage, the time taken, the requests
+made to Neovim (and their size in bytes on the wire) and the calls Neovim
+made to the plugin:
+
+    connect      MySQLConnect, until the tree is shown
+    execute      MySQLExecQueryUnderCursor on a select of --rows rows
+    format       MySQLShowResults in each of the other formats, then table
+    tree         MySQLShowTree and MySQLTreeToggleDatabase, open and close
+    complete     MySQLComplete of a table's columns
+
+    python script/bench_e2e.py --rows 100000 --latency 0.005
+"""
+
+import argparse
+import json
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, '..', 'rplugin', 'python3'), os.path.join(HERE, '..', 'test')]
+
+from harness import FakeServer, Harness, generate_schema  # noqa: E402
+
+
+def run(rows, latency, databases, tables):
+    """Run every stage once, and return the list of stages (see Harness.stage)."""
+    server = FakeServer(schema=generate_schema(databases, tables), rows=rows, latency=latency)
+    with Harness(server) as h:
+        with h.stage('connect'):
+            h.command('MySQLConnect mysql://localhost/db0', until=h.tree_loaded)
+
+        h.set_query('select * from t0')
+        with h.stage('execute'):
+            h.command('MySQLExecQueryUnderCursor')
+
+        for format_ in ['csv', 'vertical', 'raw_column', 'table']:
+            with h.stage('format ' + format_):
+                h.command('MySQLShowResults ' + format_)
+
+        with h.stage('tree show'):
+            h.command('MySQLShowTree')
+        h.set_cursor(1)
+        with h.stage('tree open'):
+            h.command('MySQLTreeToggleDatabase')
+        with h.stage('tree close'):
+            h.command('MySQLTreeToggleDatabase')
+
+        h.command('MySQLShowTree')
+        h.nvim.command('wincmd p')
+        h.set_query('select * from db0.t0 t where t.')
+        with h.stage('complete'):
+            h.call_function('MySQLComplete', 1, '')
+            h.call_function('MySQLComplete', 0, '')
+
+        print(h.report())
+        return h.stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000, help="rows returned by the executed query")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds the server takes per statement")
+    parser.add_argument('--databases', type=int, default=20, help="databases on the server")
+    parser.add_argument('--tables', type=int, default=50, help="tables per database")
+    parser.add_argument('--json', metavar='PATH', help="also write the stages to PATH, as JSON")
+    args = parser.parse_args()
+
+    stages = run(args.rows, args.latency, args.databases, args.tables)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'stages': stages}, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Benchmark the result set formatters.
+
+Synthetic result sets of mixed types (DECIMAL, DATETIME, long TEXT with the
+odd line break, non-UTF-8 BLOBs and a mostly-NULL column) are generated for
+each size, and for each one this times:
+
+    display_value  converting every cell to its display string
+    load           building a ResultSet from the rows
+    table, vertical, csv, raw_column
+                   format_results on the loaded ResultSet
+
+reporting rows per second and the peak memory allocated while running
+(measured with tracemalloc, in a separate run so as not to slow down the
+timed one). Results can be saved as a baseline and compared against later:
+
+    git checkout master && python script/bench_results.py --save master
+    git checkout my-branch && python script/bench_results.py --compare master
+"""
+
+import argparse
+import datetime
+import decimal
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rplugin', 'python3'))
+
+from nvim_mysql.results import FT, ResultSet, display_value, format_results  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+SIZES = [10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6]
+BENCHMARKS = ['display_value', 'load', 'table', 'vertical', 'csv', 'raw_column']
+
+HEADER = ['id', 'amount', 'created', 'note', 'payload', 'deleted_at']
+TYPES = [FT.LONG, FT.NEWDECIMAL, FT.DATETIME, FT.VAR_STRING, FT.BLOB, FT.DATETIME]
+
+# Comparisons flag benchmarks whose throughput dropped by more than this.
+DEFAULT_THRESHOLD = 0.10
+
+
+def generate_rows(n, seed=0):
+    """Return n rows of synthetic mixed-type data (the same ones for the same seed)."""
+    rng = random.Random(seed)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'ünïcode', 'x' * 40]
+    start = datetime.datetime(2020, 1, 1)
+    rows = []
+    for i in range(n):
+        note = ' '.join(rng.choice(words) for _ in range(rng.randint(5, 40)))
+        if i % 50 == 0:
+            note = note.replace(' ', '\n', 2)
+        rows.append((
+            i,
+            decimal.Decimal(rng.randint(-10 ** 8, 10 ** 8)).scaleb(-2),
+            start + datetime.timedelta(seconds=rng.randint(0, 10 ** 8)),
+            note,
+            bytes(rng.getrandbits(8) for _ in range(16)) if i % 3 else b'\xff\xfe' + b'x' * 14,
+            None if i % 10 else start,
+        ))
+    return rows
+
+
+def _benchmark(name, rows):
+    """Return a function that runs benchmark name on rows."""
+    if name == 'display_value':
+        return lambda: [display_value(v) for row in rows for v in row]
+    if name == 'load':
+        return lambda: ResultSet.from_rows(HEADER, rows, TYPES)
+    results = {
+        'type': 'read',
+        'data': ResultSet.from_rows(HEADER, rows, TYPES),
+        'count': len(rows),
+        'warnings': [],
+    }
+    return lambda: format_results(results, name)
+
+
+def measure(func, repeat):
+    """Return the best time (in seconds) of repeat runs of func, and its peak allocation (in bytes)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run(sizes, benchmarks, repeat, out=sys.stdout):
+    """Run the given benchmarks for each size, and return the results by "name/size"."""
+    results = {}
+    for size in sizes:
+        rows = generate_rows(size)
+        for name in benchmarks:
+            seconds, peak = measure(_benchmark(name, rows), repeat)
+            key = '{}/{}'.format(name, size)
+            results[key] = {
+                'seconds': seconds,
+                'rows_per_second': size / seconds if seconds else float('inf'),
+                'peak_bytes': peak,
+            }
+            out.write("{:<24} {:>12,.0f} rows/s {:>10.1f} MiB peak\n".format(
+                key, results[key]['rows_per_second'], peak / 2 ** 20))
+            out.flush()
+    return results
+
+
+def compare(results, baseline, threshold, out=sys.stdout):
+    """Print how results compare to baseline, and return the keys that regressed."""
+    regressed = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        speed = result['rows_per_second'] / base['rows_per_second']
+        memory = result['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+        flag = ''
+        if speed < 1 - threshold:
+            flag = '  <-- slower'
+            regressed.append(key)
+        out.write("{:<24} speed x{:.2f}  memory x{:.2f}{}\n".format(key, speed, memory, flag))
+    return regressed
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, name + '.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="numbers of rows to benchmark")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS, help="benchmarks to run")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per benchmark (the best is kept)")
+    parser.add_argument('--save', metavar='NAME', help="save the results as baseline NAME")
+    parser.add_argument('--compare', metavar='NAME', help="compare the results against baseline NAME")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="fraction of throughput that may be lost before a comparison fails")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.only, args.repeat)
+
+    if args.save:
+        path = baseline_path(args.save)
+        if not os.path.isdir(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        with open(path, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=1, sort_keys=True)
+        print("saved baseline to {}".format(path))
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        print("compared to {} (Python {}):".format(args.compare, baseline['python']))
+        if compare(results, baseline['results'], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
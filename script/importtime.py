@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Measure how long the plugin host takes to import nvim_mysql.
+
+Runs `python -X importtime -c "import nvim_mysql"` in a fresh interpreter
+and prints the slowest imports (cumulative, in milliseconds). Exits with
+status 1 if any module that should only be imported on first use (see
+LAZY_MODULES) was imported, so that it can be used as a regression check:
+
+    python script/importtime.py [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rplugin', 'python3')
+
+# Only needed once a tab connects (or completes), so importing nvim_mysql
+# mustn't import them.
+LAZY_MODULES = ['cxnstr', 'csv', 'nvim_mysql.autocomplete', 'pymysql', 'six', 'sqlparse']
+
+
+def measure():
+    """Import nvim_mysql in a new interpreter and return [(cumulative us, module)]."""
+    env = dict(os.environ, PYTHONPATH=PLUGIN_DIR)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import nvim_mysql'],
+        env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    imports = []
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), module.strip()))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=15, help="how many of the slowest imports to show")
+    args = parser.parse_args()
+
+    imports = measure()
+    total = next(us for us, module in imports if module == 'nvim_mysql')
+    print("import nvim_mysql: {:.1f} ms".format(total / 1000))
+    for us, module in sorted(imports, reverse=True)[:args.top]:
+        print("{:>9.1f} ms  {}".format(us / 1000, module))
+
+    eager = sorted({module for _, module in imports if module in LAZY_MODULES})
+    if eager:
+        print("imported eagerly: {}".format(', '.join(eager)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
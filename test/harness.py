@@ -0,0 +1,1055 @@
+"""Headless harness for running the plugin end to end.
+
+The MySQL plugin class is run against FakeNvim, an in-process stand-in for
+the Neovim API, and FakeServer, a scriptable stand-in for a MySQL server
+(patched in as pymysql.connect). Neither a Neovim nor a MySQL server is
+needed.
+
+Every request the plugin makes to Neovim goes through FakeNvim.request,
+which counts it and the bytes it would take on the wire (both ways, encoded
+with msgpack as pynvim does), so that round trips can be measured as well
+as time:
+
+    with Harness(FakeServer(rows=1000)) as h:
+        with h.stage('connect'):
+            h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        h.set_query('select * from shop.orders')
+        with h.stage('execute'):
+            h.command('MySQLExecQueryUnderCursor')
+        print(h.report())
+
+Handlers run in greenlets, and callbacks posted with vim.async_call are run
+in greenlets of their own on the harness's (main) greenlet, as they are by
+pynvim's event loop.
+"""
+
+import collections
+import contextlib
+import datetime
+import decimal
+import itertools
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest.mock
+
+import greenlet
+import msgpack
+import pymysql
+import pymysql.constants.FIELD_TYPE as FT
+from pynvim.api import NvimError
+
+import nvim_mysql
+
+
+# Column types of generated tables, by column position.
+COLUMN_TYPES = [FT.LONG, FT.VAR_STRING, FT.NEWDECIMAL, FT.DATETIME, FT.BLOB, FT.VAR_STRING]
+
+DEFAULT_SCHEMA = {
+    'shop': {
+        'customers': ['id', 'name', 'balance', 'created', 'avatar', 'notes'],
+        'items': ['id', 'title', 'price', 'added'],
+        'orders': ['id', 'reference', 'amount', 'placed', 'receipt', 'comment'],
+    },
+    'analytics': {
+        'events': ['id', 'kind', 'value', 'at'],
+        'sessions': ['id', 'agent'],
+    },
+}
+
+
+def generate_schema(databases, tables, columns=6):
+    """Return a schema (as taken by FakeServer) of the given size.
+
+    >>> schema = generate_schema(2, 3)
+    >>> sorted(schema), sorted(schema['db0']), schema['db0']['t0'][:2]
+    (['db0', 'db1'], ['t0', 't1', 't2'], ['c0', 'c1'])
+    """
+    return {
+        'db{}'.format(d): {
+            't{}'.format(t): ['c{}'.format(c) for c in range(columns)]
+            for t in range(tables)
+        }
+        for d in range(databases)
+    }
+
+
+def _generate_value(type_code, column, i):
+    start = datetime.datetime(2020, 1, 1)
+    if type_code == FT.LONG:
+        return i
+    if type_code == FT.NEWDECIMAL:
+        return decimal.Decimal(i * 7919 % 10 ** 7).scaleb(-2)
+    if type_code == FT.DATETIME:
+        return start + datetime.timedelta(minutes=i)
+    if type_code == FT.BLOB:
+        return bytes([i % 256, 0xff, 0xfe])
+    if column == 5:
+        # mostly NULL, with the odd line break
+        return None if i % 10 else 'note {}\nsecond line'.format(i)
+    return 'value {}'.format(i)
+
+
+class FakeServer(object):
+    """A MySQL server that answers the queries the plugin asks.
+
+    schema is {database: {table: [column names]}}. Selecting from a table
+    returns rows generated on the fly (rows of them, or rows[table] if rows
+    is a dict keyed by 'database.table'), of mixed types. Other statements
+    (writes, DDL) affect one row and change nothing. Each statement takes
+    latency seconds, and connecting takes connect_latency seconds.
+
+    All statements run are recorded in queries.
+    """
+    def __init__(self, schema=None, rows=100, latency=0.0, connect_latency=0.0):
+        self.schema = schema if schema is not None else DEFAULT_SCHEMA
+        self.rows = rows
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.queries = []
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._thread_ids = itertools.count(1)
+
+    def connect(self, **params):
+        time.sleep(self.connect_latency)
+        with self._lock:
+            self.connections += 1
+        return FakeConnection(self, next(self._thread_ids), params)
+
+    def row_count(self, database, table):
+        if isinstance(self.rows, dict):
+            return self.rows.get('{}.{}'.format(database, table), 0)
+        return self.rows
+
+    def _table(self, name, default_database):
+        name = name.replace('`', '')
+        database, _, table = name.rpartition('.')
+        database = database or default_database
+        if table not in self.schema.get(database, {}):
+            raise pymysql.err.ProgrammingError(1146, "Table '{}.{}' doesn't exist".format(database, table))
+        return database, table
+
+    def execute(self, conn, query, args=None):
+        """Run query on conn, and return (description, rows, rowcount).
+
+        rows may be an iterator, so that big result sets are generated as
+        they are fetched.
+        """
+        with self._lock:
+            self.queries.append(query)
+        time.sleep(self.latency)
+        q = ' '.join(query.split())
+        lower = q.lower()
+
+        def names(column, values):
+            return [(column, FT.VAR_STRING)], [(v,) for v in values]
+
+        if lower == 'show warnings':
+            return [('Level', FT.VAR_STRING), ('Code', FT.LONG), ('Message', FT.VAR_STRING)], [], 0
+        if lower.startswith('kill query'):
+            return None, [], 0
+        if lower.startswith('use '):
+            conn.db = q[4:].strip('`; ')
+            return None, [], 0
+        if lower == 'show databases':
+            return names('Database', sorted(self.schema)) + (len(self.schema),)
+        match = re.match(r'show tables(?: from `?(\w+)`?)?$', lower)
+        if match:
+            database = match.group(1) or conn.db
+            tables = sorted(self.schema.get(database, {}))
+            return names('Tables_in_{}'.format(database), tables) + (len(tables),)
+        match = re.match(r'(?:describe|desc) (\S+)$', q, re.IGNORECASE)
+        if match:
+            database, table = self._table(match.group(1), conn.db)
+            columns = self.schema[database][table]
+            description = [(c, FT.VAR_STRING) for c in ['Field', 'Type', 'Null', 'Key', 'Default', 'Extra']]
+            return description, [(c, 'int', 'YES', '', None, '') for c in columns], len(columns)
+        if 'information_schema' in lower:
+            return self._catalog(lower, args)
+        if lower.startswith('select') or lower.startswith('show'):
+            return self._select(conn, q)
+        return None, [], 1
+
+    def _catalog(self, lower, args):
+        if 'left join' in lower:
+            rows = []
+            for database in sorted(self.schema):
+                tables = sorted(self.schema[database]) or [None]
+                rows.extend((database, table) for table in tables)
+            return [('SCHEMA_NAME', FT.VAR_STRING), ('TABLE_NAME', FT.VAR_STRING)], rows, len(rows)
+        if 'count(*), max(create_time)' in lower:
+            count = sum(len(tables) for tables in self.schema.values())
+            return [('count', FT.LONGLONG), ('created', FT.DATETIME)], [(count, None)], 1
+        if 'from information_schema.schemata' in lower:
+            databases = sorted(self.schema)
+            return [('SCHEMA_NAME', FT.VAR_STRING)], [(d,) for d in databases], len(databases)
+        batch = args[0] if args else sorted(self.schema)
+        rows = []
+        for database in sorted(batch):
+            for table in sorted(self.schema.get(database, {})):
+                if 'information_schema.columns' in lower:
+                    rows.extend((database, table, column) for column in self.schema[database][table])
+                else:
+                    rows.append((database, table))
+        return [('x', FT.VAR_STRING)] * len(rows[0]) if rows else [], rows, len(rows)
+
+    def _select(self, conn, q):
+        match = re.search(r'\bfrom\s+(`?\w+`?(?:\.`?\w+`?)?)', q, re.IGNORECASE)
+        if match is None:
+            # e.g. select 1
+            return [('1', FT.LONGLONG)], [(1,)], 1
+        database, table = self._table(match.group(1), conn.db)
+        count = self.row_count(database, table)
+        if re.match(r'select count\(\*\)', q, re.IGNORECASE):
+            return [('count(*)', FT.LONGLONG)], [(count,)], 1
+        limit = re.search(r'\blimit\s+(\d+)', q, re.IGNORECASE)
+        if limit:
+            count = min(count, int(limit.group(1)))
+        columns = self.schema[database][table]
+        types = [COLUMN_TYPES[i % len(COLUMN_TYPES)] for i in range(len(columns))]
+        rows = (
+            tuple(_generate_value(t, c % len(COLUMN_TYPES), i) for c, t in enumerate(types))
+            for i in range(count))
+        return list(zip(columns, types)), rows, count
+
+
+class FakeConnection(object):
+    """Just enough of a pymysql connection."""
+    def __init__(self, server, thread_id, params):
+        self.server = server
+        self.params = params
+        self.db = params.get('db')
+        self.autocommit_mode = bool(params.get('autocommit', False))
+        self.open = True
+        self._thread_id = thread_id
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def select_db(self, db):
+        self.db = db
+
+    def autocommit(self, value):
+        self.autocommit_mode = bool(value)
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def thread_id(self):
+        return self._thread_id
+
+    def close(self):
+        self.open = False
+
+
+class FakeCursor(object):
+    """Just enough of a pymysql cursor (buffered and unbuffered alike)."""
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = iter(())
+
+    def execute(self, query, args=None):
+        if not self.conn.open:
+            raise pymysql.err.InterfaceError(0, '')
+        description, rows, self.rowcount = self.conn.server.execute(self.conn, query, args)
+        self.description = None if description is None else tuple(
+            (name, type_code, None, None, None, None, True) for name, type_code in description)
+        self._rows = iter(rows)
+        return self.rowcount
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self._rows, size))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        self._rows = iter(())
+
+
+class Remote(object):
+    """A handle to a Neovim object; every attribute access is a request, as with pynvim."""
+    code = None
+    prefix = None
+
+    def __init__(self, nvim, handle):
+        self._nvim = nvim
+        self.handle = handle
+
+    def request(self, name, *args):
+        return self._nvim.request('{}_{}'.format(self.prefix, name), self, *args)
+
+    @property
+    def vars(self):
+        return RemoteMap(self, 'get_var', 'set_var', 'del_var')
+
+    @property
+    def valid(self):
+        return self.request('is_valid')
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.handle == other.handle
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.code, self.handle))
+
+    def __repr__(self):
+        return '<{} {}>'.format(type(self).__name__, self.handle)
+
+
+class RemoteMap(object):
+    def __init__(self, remote, get_method, set_method, del_method):
+        self._remote = remote
+        self._methods = (get_method, set_method, del_method)
+
+    def _request(self, i, *args):
+        if isinstance(self._remote, FakeNvim):
+            return self._remote.request('nvim_' + self._methods[i], *args)
+        return self._remote.request(self._methods[i], *args)
+
+    def __getitem__(self, key):
+        try:
+            return self._request(0, key)
+        except NvimError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._request(1, key, value)
+
+    def __delitem__(self, key):
+        try:
+            self._request(2, key)
+        except NvimError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def _adjust_index(index, default):
+    if index is None:
+        return default
+    return index - 1 if index < 0 else index
+
+
+class Buffer(Remote):
+    code = 0
+    prefix = 'nvim_buf'
+
+    @property
+    def number(self):
+        return self.handle
+
+    @property
+    def name(self):
+        return self.request('get_name')
+
+    @property
+    def options(self):
+        return RemoteMap(self, 'get_option', 'set_option', None)
+
+    def __len__(self):
+        return self.request('line_count')
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.request('get_lines', _adjust_index(index.start, 0), _adjust_index(index.stop, -1), False)
+        return self.request('get_lines', _adjust_index(index, 0), _adjust_index(index, 0) + 1, True)[0]
+
+    def __setitem__(self, index, lines):
+        if isinstance(index, slice):
+            self.request('set_lines', _adjust_index(index.start, 0), _adjust_index(index.stop, -1), False, lines)
+        else:
+            self.request('set_lines', index, index + 1, True, [lines])
+
+    def append(self, lines, index=-1):
+        if isinstance(lines, str):
+            lines = [lines]
+        self.request('set_lines', index, index, True, lines)
+
+
+class Window(Remote):
+    code = 1
+    prefix = 'nvim_win'
+
+    buffer = property(lambda self: self.request('get_buf'))
+    height = property(lambda self: self.request('get_height'))
+    width = property(lambda self: self.request('get_width'))
+    number = property(lambda self: self.request('get_number'))
+    tabpage = property(lambda self: self.request('get_tabpage'))
+
+    @property
+    def cursor(self):
+        return tuple(self.request('get_cursor'))
+
+    @cursor.setter
+    def cursor(self, position):
+        self.request('set_cursor', list(position))
+
+
+class Tabpage(Remote):
+    code = 2
+    prefix = 'nvim_tabpage'
+
+    windows = property(lambda self: self.request('list_wins'))
+    number = property(lambda self: self.request('get_number'))
+
+
+class Current(object):
+    def __init__(self, nvim):
+        self._nvim = nvim
+
+    buffer = property(lambda self: self._nvim.request('nvim_get_current_buf'))
+    window = property(lambda self: self._nvim.request('nvim_get_current_win'))
+    tabpage = property(lambda self: self._nvim.request('nvim_get_current_tabpage'))
+
+    @property
+    def line(self):
+        return self._nvim.request('nvim_get_current_line')
+
+    @line.setter
+    def line(self, line):
+        self._nvim.request('nvim_set_current_line', line)
+
+
+class Funcs(object):
+    def __init__(self, nvim):
+        self._nvim = nvim
+
+    def __getattr__(self, name):
+        return lambda *args: self._nvim.request('nvim_call_function', name, list(args))
+
+
+class Api(object):
+    def __init__(self, nvim):
+        self._nvim = nvim
+
+    def __getattr__(self, name):
+        return lambda *args: self._nvim.request('nvim_' + name, *args)
+
+
+class Stats(object):
+    """Requests made to Neovim (and the bytes they took), and requests made by Neovim."""
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.methods = collections.Counter()
+        self.plugin_calls = 0  # commands and functions that Neovim called in the plugin
+
+    def snapshot(self):
+        return self.requests, self.bytes, self.plugin_calls
+
+
+class FakeNvim(object):
+    """The parts of the Neovim API that the plugin uses, in process.
+
+    The state of buffers, windows and tabpages is kept here; Buffer, Window
+    and Tabpage objects are just handles, as in pynvim. Ex commands that
+    open, switch and close windows and buffers are understood; commands
+    defined by the plugin are dispatched to it; anything else is recorded
+    in commands and otherwise ignored.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.plugin = None
+        self.stats = Stats()
+        self.commands = []  # ex commands that were run (other than the plugin's own)
+        self.errors = []  # messages written with err_write
+        self.inputs = []  # answers for input(), in order
+        self.calls = queue.Queue()  # callbacks posted with async_call
+        self.current = Current(self)
+        self.funcs = Funcs(self)
+        self.api = Api(self)
+        self._vars = {}
+        self._ids = itertools.count(1)
+        self._msgids = itertools.count(1)
+        self._buffers = {}
+        self._windows = {}
+        self._tabpages = {}
+        self._tab_order = []
+        tabpage = self._new_tabpage()
+        self._current_tab = tabpage
+        self._new_window(tabpage, self._new_buffer())
+
+    # Handles and state
+
+    def _new_buffer(self, name=''):
+        handle = next(self._ids)
+        self._buffers[handle] = {'lines': [''], 'name': name, 'vars': {}, 'options': {'filetype': ''}, 'keymaps': {}}
+        return handle
+
+    def _new_tabpage(self):
+        handle = next(self._ids)
+        self._tabpages[handle] = {'windows': [], 'vars': {}, 'current': None, 'previous': None}
+        self._tab_order.append(handle)
+        return handle
+
+    def _new_window(self, tabpage, buffer, below=True):
+        handle = next(self._ids)
+        self._windows[handle] = {'buffer': buffer, 'cursor': [1, 0], 'height': 40, 'width': 160, 'tab': tabpage}
+        tab = self._tabpages[tabpage]
+        current = tab['current']
+        if current is None:
+            tab['windows'].append(handle)
+        else:
+            # Splits halve the window they're made from.
+            self._windows[current]['height'] //= 2
+            i = tab['windows'].index(current)
+            tab['windows'].insert(i + 1 if below else i, handle)
+        self._set_current_window(handle)
+        return handle
+
+    def _set_current_window(self, window):
+        tab = self._tabpages[self._windows[window]['tab']]
+        if tab['current'] != window:
+            tab['previous'], tab['current'] = tab['current'], window
+
+    def _close_window(self, window):
+        tab_handle = self._windows[window]['tab']
+        tab = self._tabpages[tab_handle]
+        tab['windows'].remove(window)
+        del self._windows[window]
+        if not tab['windows']:
+            del self._tabpages[tab_handle]
+            self._tab_order.remove(tab_handle)
+            self._current_tab = self._tab_order[-1]
+            self.dispatch('function:MySQLCleanupTabs', [[]])
+            return
+        if tab['current'] == window:
+            previous = tab['previous'] if tab['previous'] in tab['windows'] else tab['windows'][0]
+            tab['current'] = previous
+        if tab['previous'] not in tab['windows']:
+            tab['previous'] = None
+
+    @property
+    def _current_window(self):
+        return self._tabpages[self._current_tab]['current']
+
+    @property
+    def _current_buffer(self):
+        return self._windows[self._current_window]['buffer']
+
+    def _wrap(self, value):
+        """Turn handles in a result into remote objects."""
+        if isinstance(value, tuple) and len(value) == 2 and value[0] in (Buffer, Window, Tabpage):
+            return value[0](self, value[1])
+        if isinstance(value, list):
+            return [self._wrap(v) for v in value]
+        return value
+
+    @staticmethod
+    def _handle(value):
+        return value.handle if isinstance(value, Remote) else value
+
+    # Requests
+
+    @staticmethod
+    def _encode(value):
+        def default(obj):
+            if isinstance(obj, Remote):
+                return msgpack.ExtType(obj.code, msgpack.packb(obj.handle))
+            if isinstance(obj, tuple):
+                return list(obj)
+            raise TypeError(repr(obj))
+        return msgpack.packb(value, default=default, use_bin_type=True)
+
+    def request(self, method, *args):
+        """Make a request, counting it and its size (as sent and received by pynvim)."""
+        msgid = next(self._msgids)
+        self.stats.requests += 1
+        self.stats.methods[method] += 1
+        self.stats.bytes += len(self._encode([0, msgid, method, list(args)]))
+        try:
+            result = self._wrap(self._call(method, args))
+        except NvimError as e:
+            self.stats.bytes += len(self._encode([1, msgid, [0, str(e)], None]))
+            raise
+        self.stats.bytes += len(self._encode([1, msgid, None, result]))
+        return result
+
+    def _call(self, method, args):
+        args = [self._handle(a) for a in args]
+        handler = getattr(self, '_api_' + method[len('nvim_'):], None)
+        if handler is None:
+            raise NotImplementedError("FakeNvim does not implement {}".format(method))
+        return handler(*args)
+
+    def command(self, command):
+        return self.request('nvim_command', command)
+
+    def eval(self, expr):
+        return self.request('nvim_eval', expr)
+
+    def feedkeys(self, keys, options='', escape_csi=True):
+        return self.request('nvim_feedkeys', keys, options, escape_csi)
+
+    def err_write(self, message):
+        return self.request('nvim_err_write', message)
+
+    def async_call(self, fn, *args):
+        # Not a request: pynvim wakes up its own event loop.
+        self.calls.put((fn, args))
+
+    @property
+    def vars(self):
+        return RemoteMap(self, 'get_var', 'set_var', 'del_var')
+
+    @property
+    def buffers(self):
+        return self.request('nvim_list_bufs')
+
+    @property
+    def tabpages(self):
+        return self.request('nvim_list_tabpages')
+
+    # API methods
+
+    def _api_call_atomic(self, calls):
+        results = []
+        for i, (method, args) in enumerate(calls):
+            try:
+                results.append(self._call(method, args))
+            except NvimError as e:
+                return [results, [i, 0, str(e)]]
+        return [results, None]
+
+    def _api_command(self, command):
+        self._run_command(command.strip())
+
+    def _api_eval(self, expr):
+        if expr == nvim_mysql.USER_KEYMAPS_EXPR:
+            return self._vars.get('nvim_mysql#keymaps', {})
+        if expr.startswith('filter(range(1, bufnr('):
+            return [h for h, b in sorted(self._buffers.items()) if b['options']['filetype'] in ('sql', 'mysql')]
+        raise NotImplementedError("FakeNvim can't evaluate {}".format(expr))
+
+    def _api_call_function(self, name, args):
+        if name == 'exists':
+            return int(args[0] in ('##WinScrolled', '##CmdlineChanged', ':redrawtabline'))
+        if name == 'stdpath':
+            return self.cache_dir
+        if name == 'input':
+            return self.inputs.pop(0)
+        raise NotImplementedError("FakeNvim does not implement {}()".format(name))
+
+    def _api_feedkeys(self, keys, options, escape_csi):
+        self.commands.append('feedkeys {!r}'.format(keys))
+
+    def _api_err_write(self, message):
+        self.errors.append(message)
+
+    def _api_get_var(self, name):
+        if name not in self._vars:
+            raise NvimError("Key not found: {}".format(name))
+        return self._vars[name]
+
+    def _api_set_var(self, name, value):
+        self._vars[name] = value
+
+    def _api_del_var(self, name):
+        if self._vars.pop(name, None) is None:
+            raise NvimError("Key not found: {}".format(name))
+
+    def _api_get_current_buf(self):
+        return (Buffer, self._current_buffer)
+
+    def _api_get_current_win(self):
+        return (Window, self._current_window)
+
+    def _api_get_current_tabpage(self):
+        return (Tabpage, self._current_tab)
+
+    def _api_get_current_line(self):
+        window = self._windows[self._current_window]
+        return self._buffers[window['buffer']]['lines'][window['cursor'][0] - 1]
+
+    def _api_list_bufs(self):
+        return [(Buffer, h) for h in sorted(self._buffers)]
+
+    def _api_list_tabpages(self):
+        return [(Tabpage, h) for h in self._tab_order]
+
+    def _api_create_buf(self, listed, scratch):
+        return (Buffer, self._new_buffer())
+
+    def _buf(self, handle):
+        if handle == 0:
+            handle = self._current_buffer
+        try:
+            return self._buffers[handle]
+        except KeyError:
+            raise NvimError("Invalid buffer id: {}".format(handle))
+
+    def _api_buf_is_valid(self, buf):
+        return buf in self._buffers
+
+    def _api_buf_get_name(self, buf):
+        return self._buf(buf)['name']
+
+    def _api_buf_set_name(self, buf, name):
+        self._buf(buf)['name'] = name
+
+    def _api_buf_get_option(self, buf, name):
+        return self._buf(buf)['options'].get(name, '')
+
+    def _api_buf_set_option(self, buf, name, value):
+        self._buf(buf)['options'][name] = value
+
+    def _api_buf_set_keymap(self, buf, mode, lhs, rhs, opts):
+        self._buf(buf)['keymaps'][(mode, lhs)] = rhs
+
+    def _api_buf_get_var(self, buf, name):
+        variables = self._buf(buf)['vars']
+        if name not in variables:
+            raise NvimError("Key not found: {}".format(name))
+        return variables[name]
+
+    def _api_buf_set_var(self, buf, name, value):
+        self._buf(buf)['vars'][name] = value
+
+    def _api_buf_del_var(self, buf, name):
+        self._buf(buf)['vars'].pop(name)
+
+    def _api_buf_line_count(self, buf):
+        return len(self._buf(buf)['lines'])
+
+    @staticmethod
+    def _line_range(lines, start, end, strict):
+        n = len(lines)
+        start = start + n + 1 if start < 0 else start
+        end = end + n + 1 if end < 0 else end
+        if strict and (start > n or end > n):
+            raise NvimError("Index out of bounds")
+        return min(start, n), min(end, n)
+
+    def _api_buf_get_lines(self, buf, start, end, strict):
+        lines = self._buf(buf)['lines']
+        start, end = self._line_range(lines, start, end, strict)
+        return lines[start:end]
+
+    def _api_buf_set_lines(self, buf, start, end, strict, replacement):
+        lines = self._buf(buf)['lines']
+        start, end = self._line_range(lines, start, end, strict)
+        lines[start:end] = [str(line) for line in replacement]
+        if not lines:
+            lines.append('')
+
+    def _win(self, handle):
+        if handle == 0:
+            handle = self._current_window
+        try:
+            return self._windows[handle]
+        except KeyError:
+            raise NvimError("Invalid window id: {}".format(handle))
+
+    def _api_win_is_valid(self, win):
+        return win in self._windows
+
+    def _api_win_get_buf(self, win):
+        return (Buffer, self._win(win)['buffer'])
+
+    def _api_win_get_cursor(self, win):
+        return list(self._win(win)['cursor'])
+
+    def _api_win_set_cursor(self, win, position):
+        self._win(win)['cursor'] = list(position)
+
+    def _api_win_get_height(self, win):
+        return self._win(win)['height']
+
+    def _api_win_get_width(self, win):
+        return self._win(win)['width']
+
+    def _api_win_get_number(self, win):
+        window = self._win(win)
+        return self._tabpages[window['tab']]['windows'].index(win) + 1
+
+    def _api_win_get_tabpage(self, win):
+        return (Tabpage, self._win(win)['tab'])
+
+    def _tab(self, handle):
+        if handle == 0:
+            handle = self._current_tab
+        try:
+            return self._tabpages[handle]
+        except KeyError:
+            raise NvimError("Invalid tabpage id: {}".format(handle))
+
+    def _api_tabpage_is_valid(self, tabpage):
+        return tabpage in self._tabpages
+
+    def _api_tabpage_list_wins(self, tabpage):
+        return [(Window, h) for h in self._tab(tabpage)['windows']]
+
+    def _api_tabpage_get_number(self, tabpage):
+        return self._tab_order.index(tabpage) + 1
+
+    def _api_tabpage_get_var(self, tabpage, name):
+        variables = self._tab(tabpage)['vars']
+        if name not in variables:
+            raise NvimError("Key not found: {}".format(name))
+        return variables[name]
+
+    def _api_tabpage_set_var(self, tabpage, name, value):
+        self._tab(tabpage)['vars'][name] = value
+
+    def _api_tabpage_del_var(self, tabpage, name):
+        if self._tab(tabpage)['vars'].pop(name, None) is None:
+            raise NvimError("Key not found: {}".format(name))
+
+    # Ex commands
+
+    def _run_command(self, command):
+        tab = self._tabpages[self._current_tab]
+        match = re.match(r'(\d*)wincmd ([wpc])$', command)
+        if match:
+            number, action = match.groups()
+            if action == 'p':
+                if tab['previous'] is not None:
+                    self._set_current_window(tab['previous'])
+                return
+            window = tab['windows'][int(number or 1) - 1]
+            if action == 'w':
+                self._set_current_window(window)
+            else:
+                self._close_window(window)
+            return
+        match = re.match(r'b(?:uffer)?! (\d+)$', command)
+        if match:
+            self._win(0)['buffer'] = int(match.group(1))
+            return
+        match = re.match(r'(botright|vertical topleft) (\d+) split$', command)
+        if match:
+            window = self._new_window(self._current_tab, self._current_buffer, below=match.group(1) == 'botright')
+            self._windows[window]['height' if match.group(1) == 'botright' else 'width'] = int(match.group(2))
+            return
+        match = re.match(r'bd! (\d+)$', command)
+        if match:
+            buffer = int(match.group(1))
+            for handle, window in list(self._windows.items()):
+                if window['buffer'] == buffer:
+                    self._close_window(handle)
+            self._buffers.pop(buffer, None)
+            return
+        if command == 'q':
+            self._close_window(self._current_window)
+            return
+        if command == 'normal gg0':
+            self._win(0)['cursor'] = [1, 0]
+            return
+        if command.startswith('set ft='):
+            self._buf(0)['options']['filetype'] = command[len('set ft='):]
+            return
+
+        name, _, rest = command.partition(' ')
+        if name.startswith('MySQL'):
+            self.run_plugin_command(name, rest)
+            return
+        self.commands.append(command)
+
+    # Calls into the plugin
+
+    def _handlers(self):
+        handlers = {}
+        for attr in dir(type(self.plugin)):
+            fn = getattr(self.plugin, attr)
+            method_name = getattr(fn, '_nvim_rpc_method_name', None)
+            if method_name is not None:
+                handlers[method_name] = fn
+        return handlers
+
+    def plugin_args(self, name, argstring='', range=None):
+        """Return the arguments that Neovim calls the plugin's command name with."""
+        fn = self._handlers()['command:' + name]
+        opts = fn._nvim_rpc_spec['opts']
+        args = []
+        nargs = opts.get('nargs')
+        if nargs is not None:
+            if nargs in ('*', '+'):
+                args.append(argstring.split())
+            else:
+                args.append([argstring] if argstring else [])
+        if 'range' in opts:
+            if range is None:
+                row = self._win(0)['cursor'][0]
+                range = (row, row)
+            args.append(list(range))
+        return args
+
+    def run_plugin_command(self, name, argstring='', range=None):
+        """Run one of the plugin's commands (synchronously, as when it is run from the plugin itself)."""
+        return self.dispatch('command:' + name, self.plugin_args(name, argstring, range))
+
+    def count_plugin_call(self, method_name, args):
+        self.stats.plugin_calls += 1
+        self.stats.bytes += len(self._encode([0, 0, method_name, args]))
+
+    def dispatch(self, method_name, args):
+        self.count_plugin_call(method_name, args)
+        result = self._handlers()[method_name](*args)
+        self.stats.bytes += len(self._encode([1, 0, None, result]))
+        return result
+
+
+class Harness(object):
+    """Runs the plugin against FakeNvim and server (a FakeServer).
+
+    options are set as the plugin's g:nvim_mysql# options. The spinner is
+    off unless asked for, so that request counts don't depend on timing.
+    """
+    def __init__(self, server, options=None):
+        self.server = server
+        self.cache_dir = tempfile.mkdtemp(prefix='nvim-mysql-harness-')
+        self.nvim = FakeNvim(self.cache_dir)
+        self.nvim._vars['nvim_mysql#use_spinner'] = 0
+        for name, value in (options or {}).items():
+            self.nvim._vars['nvim_mysql#' + name] = value
+        self.plugin = self.nvim.plugin = nvim_mysql.MySQL(self.nvim)
+        self.stages = []
+        self._errors = []
+        self._patch = unittest.mock.patch('pymysql.connect', server.connect)
+
+    def __enter__(self):
+        self._patch.start()
+        self.nvim._buffers[self.nvim._current_buffer]['options']['filetype'] = 'mysql'
+        return self
+
+    def __exit__(self, *exc_info):
+        for tab in self.plugin.tabs.values():
+            tab.close()
+        self._patch.stop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    # Running things
+
+    def _start(self, fn, args):
+        def main():
+            try:
+                return fn(*args)
+            except Exception as e:
+                self._errors.append(e)
+
+        gr = greenlet.greenlet(main)
+        result = gr.switch()
+        return gr, result
+
+    def pump(self, until=None, timeout=30, idle=0.02):
+        """Run async_call callbacks until until() is true (or, without until, until none arrive for idle seconds)."""
+        deadline = time.time() + timeout
+        while True:
+            self._raise_errors()
+            if until is not None and until():
+                return
+            try:
+                fn, args = self.nvim.calls.get(timeout=idle if until is None else 0.005)
+            except queue.Empty:
+                if until is None:
+                    return
+                if time.time() > deadline:
+                    raise TimeoutError("timed out waiting for the plugin")
+                continue
+            self._start(fn, args)
+
+    def _raise_errors(self):
+        if self._errors:
+            error, self._errors = self._errors[0], []
+            raise error
+
+    def start_command(self, line, range=None):
+        """Start running an Ex command defined by the plugin, as typed by the user.
+
+        Return the greenlet running its handler, which is dead once it's done.
+        """
+        name, _, argstring = line.partition(' ')
+        args = self.nvim.plugin_args(name, argstring, range)
+        self.nvim.count_plugin_call('command:' + name, args)
+        handler = self.nvim._handlers()['command:' + name]
+        gr, _ = self._start(handler, args)
+        return gr
+
+    def command(self, line, range=None, until=None, timeout=30):
+        """Run an Ex command defined by the plugin, as typed by the user.
+
+        Return once its handler is done, and until() is true (if given).
+        """
+        gr = self.start_command(line, range)
+        self.pump(lambda: gr.dead and (until is None or until()), timeout)
+
+    def call_function(self, name, *args):
+        """Call a (synchronous) function defined by the plugin, and return its result."""
+        result = self.nvim.dispatch('function:' + name, [list(args)])
+        self._raise_errors()
+        return result
+
+    # Editing, as the user would
+
+    def set_query(self, text, row=None, col=None):
+        """Put text in the current (query) buffer, and the cursor on row (1-based), col."""
+        lines = text.split('\n')
+        self.nvim._buf(0)['lines'] = lines
+        row = len(lines) if row is None else row
+        col = len(lines[row - 1]) if col is None else col
+        self.nvim._win(0)['cursor'] = [row, col]
+
+    def set_cursor(self, row, col=0):
+        self.nvim._win(0)['cursor'] = [row, col]
+
+    @property
+    def tab(self):
+        """The MySQLTab of the current tabpage."""
+        return self.plugin.tabs.get(Tabpage(self.nvim, self.nvim._current_tab))
+
+    def lines(self, buffer):
+        return list(self.nvim._buf(buffer.number)['lines'])
+
+    def tree_loaded(self):
+        tab = self.tab
+        return tab is not None and bool(tab.tree.lines)
+
+    # Measuring
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Record how long the block takes, and how many requests it makes."""
+        requests, nbytes, plugin_calls = self.nvim.stats.snapshot()
+        start = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - start
+        stats = self.nvim.stats
+        self.stages.append({
+            'stage': name,
+            'seconds': seconds,
+            'requests': stats.requests - requests,
+            'bytes': stats.bytes - nbytes,
+            'plugin_calls': stats.plugin_calls - plugin_calls,
+        })
+
+    def report(self):
+        lines = ['{:<16} {:>10} {:>9} {:>12} {:>7}'.format('stage', 'ms', 'requests', 'bytes', 'calls')]
+        for s in self.stages:
+            lines.append('{:<16} {:>10.1f} {:>9} {:>12,} {:>7}'.format(
+                s['stage'], s['seconds'] * 1000, s['requests'], s['bytes'], s['plugin_calls']))
+        return '\n'.join(lines)
@@ -176,6 +176,38 @@ GET_NAMESPACE_FOR_AUTOCOMPLETE_TEST_CASES = [
             modify !
         """, 'student'
     ),
+    (
+        # Several columns in the select list
+        """
+        select id, name
+        from student s
+        where s.!
+        """, 'student'
+    ),
+    (
+        # Qualified columns in the select list
+        """
+        select s.id, s.!
+        from student s
+        """, 'student'
+    ),
+    (
+        # Several tables in the from clause
+        """
+        select c.!, t.name
+        from student s, classroom c, teacher t
+        """, 'classroom'
+    ),
+    (
+        # Join after an on clause
+        """
+        select x, y
+        from student s
+        join classroom c on c.student_id = s.id
+        join teacher t on t.id = c.teacher_id
+        where t.!
+        """, 'teacher'
+    ),
 ]
 
 
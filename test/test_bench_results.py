@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'script', 'bench_results.py')
+
+
+def test_benchmarks_run():
+    proc = subprocess.run(
+        [sys.executable, SCRIPT, '--sizes', '20', '--repeat', '1'],
+        stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0
+    assert [line.split()[0] for line in proc.stdout.splitlines()] == [
+        'display_value/20', 'load/20', 'table/20', 'vertical/20', 'csv/20', 'raw_column/20']
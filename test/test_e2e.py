@@ -0,0 +1,194 @@
+import pytest
+
+from harness import FakeServer, Harness, generate_schema
+
+
+@pytest.fixture
+def harness():
+    with Harness(FakeServer(rows=50)) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        yield h
+
+
+def test_connect_shows_the_tree(harness):
+    assert harness.lines(harness.tab.tree_buffer) == ['analytics ▸', 'shop ▸']
+    assert harness.nvim._tabpages[harness.nvim._current_tab]['vars']['MySQLServer'] == 'localhost'
+
+
+def test_connections_autocommit(harness):
+    # Jobs run on pooled connections too, and their writes must be committed.
+    assert harness.tab.conn.autocommit_mode
+    with harness.tab.aux_pool.connection() as conn:
+        assert conn.autocommit_mode
+        assert conn.params['connect_timeout'] == 10
+
+
+def test_execute_and_switch_formats(harness):
+    harness.set_query('select * from orders')
+    with harness.stage('execute'):
+        harness.command('MySQLExecQueryUnderCursor')
+    lines = harness.lines(harness.tab.results_buffer)
+    assert [c.strip() for c in lines[1].split('|')[1:-1]] == [
+        '#id', 'reference', '#amount', '@placed', 'receipt', 'comment']
+    summary = next(i for i, line in enumerate(lines) if '50 row(s) in set, 6 col(s)' in line)
+    timings = lines[summary + 1]
+    for stage in ['first byte', 'fetch', 'warnings', 'format', 'write']:
+        assert stage + ' ' in timings
+    assert '; 50 row(s), ' in timings and timings.endswith(' KiB written')
+
+    with harness.stage('csv'):
+        harness.command('MySQLShowResults csv')
+    assert harness.lines(harness.tab.results_buffer)[0] == 'id,reference,amount,placed,receipt,comment'
+
+    # Round trips don't grow with the number of rows.
+    execute, csv = harness.stages
+    assert execute['requests'] < 60
+    assert csv['requests'] < 20
+
+
+def test_tree_toggle(harness):
+    harness.command('MySQLShowTree')
+    harness.set_cursor(2)
+    harness.command('MySQLTreeToggleDatabase')
+    assert harness.lines(harness.tab.tree_buffer) == ['analytics ▸', 'shop ▾', '  customers', '  items', '  orders']
+
+
+def test_completion(harness):
+    harness.set_query('select * from shop.orders o where o.')
+    start = harness.call_function('MySQLComplete', 1, '')
+    words = harness.call_function('MySQLComplete', 0, '')
+    assert start == len('select * from shop.orders o where o.')
+    assert [w['word'] for w in words] == ['id', 'reference', 'amount', 'placed', 'receipt', 'comment']
+
+
+def test_large_results_are_paged():
+    server = FakeServer(schema=generate_schema(1, 1), rows=20000)
+    with Harness(server) as h:
+        h.command('MySQLConnect mysql://localhost/db0', until=h.tree_loaded)
+        h.set_query('select * from t0')
+        h.command('MySQLExecQueryUnderCursor')
+        assert len(h.tab.results) and h.tab.results['count'] == 20000
+        assert len(h.lines(h.tab.results_buffer)) < 1000
+
+
+def test_paging_results_that_left_the_history():
+    server = FakeServer(schema=generate_schema(1, 1), rows=20000)
+    with Harness(server, {'results_history_size': 1, 'disk_results_threshold': 0}) as h:
+        h.command('MySQLConnect mysql://localhost/db0', until=h.tree_loaded)
+        h.set_query('select * from t0')
+        h.command('MySQLExecQueryUnderCursor')
+        shown = len(h.lines(h.tab.results_buffer))
+        # As when other results arrive while the user is in another tab.
+        h.tab.history.add({'results': {'type': 'write', 'count': 1, 'warnings': [], 'id': 99}})
+        h.call_function('MySQLLoadMoreResults', 40)
+        assert len(h.lines(h.tab.results_buffer)) == shown
+
+
+def test_tree_is_built_from_the_schema_prefetch():
+    server = FakeServer()
+    with Harness(server) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        h.pump(lambda: h.tab.schema_prefetch is None)
+        assert h.lines(h.tab.tree_buffer) == ['analytics ▸', 'shop ▸']
+        # The catalog is only read once, by the prefetch.
+        assert len([q for q in server.queries if 'TABLE_NAME from information_schema' in q]) == 1
+
+
+def test_reconnect_while_tree_is_fetched():
+    with Harness(FakeServer(latency=0.2, rows=10), {'schema_prefetch': 0}) as h:
+        h.command('MySQLConnect mysql://localhost/shop')
+        assert not h.tree_loaded()
+        h.command('MySQLConnect mysql://localhost/analytics')
+        h.pump(h.tree_loaded, timeout=5)
+        assert h.lines(h.tab.tree_buffer) == ['analytics ▸', 'shop ▸']
+
+
+def test_one_job_streams_at_a_time():
+    with Harness(FakeServer(rows=12000, latency=0.05)) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        query_window = h.nvim._current_window
+        h.set_query('select * from orders')
+        first = h.start_command('MySQLExecQueryUnderCursor')
+        h.set_query('select * from items')
+        second = h.start_command('MySQLExecQueryUnderCursor')
+
+        def one_table():
+            # Every row in the results buffer belongs to the same table, and
+            # showing results never leaves the cursor in the results window.
+            lines = [line for line in h.lines(h.tab.results_buffer) if line.startswith('|')]
+            assert len(set(line.count('|') for line in lines)) <= 1
+            assert h.nvim._current_window == query_window
+            return first.dead and second.dead
+
+        h.pump(one_table)
+        assert h.tab.streaming_job is None
+        assert h.tab.results['count'] == 12000
+
+
+def test_pooled_connections_with_changed_sessions_are_not_reused():
+    with Harness(FakeServer(rows=10, latency=0.1)) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        h.set_query('select * from orders')
+        first = h.start_command('MySQLExecQueryUnderCursor')
+        # The primary connection is busy, so this runs on a pooled one.
+        h.set_query('use analytics')
+        second = h.start_command('MySQLExecQueryUnderCursor')
+        h.pump(lambda: first.dead and second.dead)
+
+        assert h.tab.conn.db == 'shop'
+        with h.tab.aux_pool.connection() as conn:
+            assert conn.db == 'shop'
+
+
+def test_close_tab_during_parallel_run():
+    with Harness(FakeServer(rows=10, latency=0.1), {'parallel_reads': 1}) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        h.set_query('select * from orders\n\nupdate orders set id = 1\n\nselect * from items')
+        run = h.start_command('MySQLExecQueriesInRange', range=(1, 5))
+        tab = h.tab
+        tab.close()
+        # Stops after the first batch, without trying to use the closed tab.
+        h.pump(lambda: run.dead)
+        assert not [q for q in h.server.queries if 'items' in q]
+
+
+def test_close_tab_during_pooled_job():
+    with Harness(FakeServer(rows=10, latency=0.1)) as h:
+        h.command('MySQLConnect mysql://localhost/shop', until=h.tree_loaded)
+        h.set_query('select * from orders')
+        first = h.start_command('MySQLExecQueryUnderCursor')
+        h.set_query('select * from items')
+        second = h.start_command('MySQLExecQueryUnderCursor')
+        tab = h.tab
+        pooled = [job for job in tab.jobs.values() if not job.primary]
+        tab.close()
+        h.pump(lambda: first.dead and second.dead)
+        assert not tab.jobs
+        assert [job.conn.open for job in pooled] == [False]
+
+
+def test_query_log_and_stats(harness):
+    for id_ in [1, 2, 3]:
+        harness.set_query('select * from orders where id = {}'.format(id_))
+        harness.command('MySQLExecQueryUnderCursor')
+    harness.set_query('select * from items')
+    harness.command('MySQLExecQueryUnderCursor')
+
+    harness.command('MySQLQueryStats')
+    lines = harness.lines(harness.tab.results_buffer)
+    rows = [[c.strip() for c in line.split('|')[1:-1]] for line in lines if line.startswith('|')]
+    assert rows[0][:2] == ['#count', '#errors']
+    assert sorted((r[0], r[-1]) for r in rows[1:]) == [
+        ('1', 'select * from items'), ('3', 'select * from orders where id = ?')]
+
+
+def test_spinner_stops_while_killing(harness):
+    spinning = harness.plugin.spinner_active.is_set
+    harness.tab.update_status(executing=True)
+    assert spinning()
+    harness.tab.update_status(killing=True)
+    assert not spinning()
+    harness.tab.update_status(killing=False, executing=False, connecting=True)
+    assert spinning()
+    harness.tab.update_status(connecting=False)
+    assert not spinning()
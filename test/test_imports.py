@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'script', 'importtime.py')
+
+
+def test_heavy_dependencies_are_imported_lazily():
+    proc = subprocess.run([sys.executable, SCRIPT], stdout=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0, proc.stdout
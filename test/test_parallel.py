@@ -0,0 +1,79 @@
+import concurrent.futures
+import threading
+import time
+
+from nvim_mysql.parallel import run_parallel
+from nvim_mysql.pool import ConnectionPool
+
+
+class FakeCursor(object):
+    description = None
+    rowcount = 0
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        if query == 'show warnings':
+            return
+        with self.conn.lock:
+            self.conn.running[0] += 1
+            self.conn.max_running[0] = max(self.conn.max_running[0], self.conn.running[0])
+        # Later queries finish first.
+        time.sleep(0.05 / int(query.split()[-1]))
+        with self.conn.lock:
+            self.conn.running[0] -= 1
+        self.description = [('n', 3)]
+        self.rows = [(int(query.split()[-1]),)]
+
+    def fetchall(self):
+        return getattr(self, 'rows', [])
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection(object):
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+def test_results_come_back_in_order_with_bounded_concurrency():
+    pool = ConnectionPool(FakeConnection, max_idle=2)
+    queries = ['select {}'.format(i) for i in range(1, 9)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        outcomes = run_parallel(queries, pool, executor, disk_threshold=1 << 20)
+
+    assert [o['error'] for o in outcomes] == [None] * 8
+    assert [o['data'].display_row(0) for o in outcomes] == [[str(i)] for i in range(1, 9)]
+    assert 1 < FakeConnection.max_running[0] <= 3
+
+
+def test_connections_of_failed_queries_are_not_reused():
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, max_idle=2)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        # "select 0" fails (in FakeCursor), "select 1" doesn't.
+        outcomes = run_parallel(['select 0', 'select 1'], pool, executor, disk_threshold=1 << 20)
+
+    assert outcomes[0]['error'] and outcomes[1]['error'] is None
+    assert [c.closed for c in opened] == [True, False]
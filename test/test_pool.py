@@ -0,0 +1,56 @@
+from nvim_mysql.pool import ConnectionPool
+
+
+class FakeConnection(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.pings = 0
+        self.closed = False
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise IOError("gone away")
+
+    def close(self):
+        self.closed = True
+
+
+def test_idle_connections_are_pinged_before_reuse():
+    opened = []
+
+    def connect():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, max_idle=2, ping_after=0)
+    pool.release(pool.acquire())
+    assert len(opened) == 1
+
+    conn = pool.acquire()
+    assert conn is opened[0] and conn.pings == 1
+    conn.alive = False
+    pool.release(conn)
+
+    fresh = pool.acquire()
+    assert fresh is opened[1]
+    assert opened[0].closed
+
+
+def test_unhealthy_connections_are_not_reused():
+    pool = ConnectionPool(FakeConnection, max_idle=2)
+    try:
+        with pool.connection() as conn:
+            raise ValueError
+    except ValueError:
+        pass
+    assert conn.closed
+    assert pool.acquire() is not conn
+
+
+def test_released_after_close_are_closed():
+    pool = ConnectionPool(FakeConnection, max_idle=2)
+    conn = pool.acquire()
+    pool.close()
+    pool.release(conn)
+    assert conn.closed
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from nvim_mysql.querylog import append, digest, entry, normalize, read, stats
+
+
+@pytest.mark.parametrize('a, b', [
+    ("select * from t where id = 1", "SELECT *\n  FROM t\n WHERE id = 42;"),
+    ("select * from t where name = 'ann'", r'select * from t where name = "it\'s"'),
+    ("select * from t where id in (1)", "select * from t where id in (1, 2, 3, 4)"),
+    ("insert into t values (1, 'a')", "insert into t values (1, 'a'), (2, 'b'), (3, 'c')"),
+    ("/* report */ select 1.5e3", "select 0x1f -- hex\n"),
+])
+def test_same_digest(a, b):
+    assert normalize(a) == normalize(b)
+    assert digest(normalize(a)) == digest(normalize(b))
+
+
+@pytest.mark.parametrize('a, b', [
+    ("select * from t1", "select * from t2"),
+    ("select * from `t 1`", "select * from `t 2`"),
+    ("select a from t", "select b from t"),
+])
+def test_different_digest(a, b):
+    assert digest(normalize(a)) != digest(normalize(b))
+
+
+def test_append_and_read(tmpdir):
+    path = os.path.join(str(tmpdir), 'log', 'server.jsonl')
+    append(path, [entry(1.0, 1, "select 1", 0.25, 1, None)])
+    append(path, [entry(2.0, 2, "select 2", 0.75, 1, None), entry(3.0, 2, "select x", 0.1, None, "Error: ...")])
+
+    entries = list(read(path))
+    assert [e['normalized'] for e in entries] == ["select ?", "select ?", "select x"]
+    assert entries[2]['tab'] == 2 and entries[2]['error'] == "Error"
+    [summary, failed] = stats(entries)
+    assert (summary['count'], summary['p50'], summary['p95'], summary['max']) == (2, 0.25, 0.75, 0.75)
+    assert (failed['count'], failed['errors']) == (1, 1)
+
+
+def test_private(tmpdir):
+    path = os.path.join(str(tmpdir), 'log', 'server.jsonl')
+    append(path, [entry(
+        1.0, 1, "create user 'ann'@'%' identified by 'secret'", 0.1, 0,
+        "Error: OperationalError(1396, \"Operation CREATE USER failed for 'ann'@'%'\")")])
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
+    with open(path) as f:
+        text = f.read()
+    assert 'secret' not in text and 'ann' not in text
+    assert json.loads(text)['error'] == 'Error: OperationalError(1396)'
+
+
+def test_full_text(tmpdir):
+    e = entry(1.0, 1, "select * from t where id = 1", 0.1, 1, "Error: X(1, 'y')", full_text=True)
+    assert (e['query'], e['normalized'], e['error']) == (
+        "select * from t where id = 1", "select * from t where id = ?", "Error: X(1, 'y')")
+
+
+def test_rotation(tmpdir):
+    path = os.path.join(str(tmpdir), 'server.jsonl')
+    append(path, [entry(float(i), 1, "select {}".format(i), 0.1, 1, None) for i in range(10)], max_size=100)
+    append(path, [entry(10.0, 1, "select 10", 0.1, 1, None)], max_size=100)
+    assert os.path.exists(path + '.1')
+    assert [e['timestamp'] for e in read(path)] == [float(i) for i in range(11)]
+
+    # Anything older than the log that was moved aside is dropped.
+    append(path, [entry(11.0, 1, "select 11", 0.1, 1, None)], max_size=100)
+    assert [e['timestamp'] for e in read(path)] == [10.0, 11.0]
+
+
+def test_read_skips_bad_lines(tmpdir):
+    path = os.path.join(str(tmpdir), 'server.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps(entry(1.0, 1, "select 1", 0.1, 1, None)) + '\n{"timest')
+    assert len(list(read(path))) == 1
+    assert list(read(os.path.join(str(tmpdir), 'missing.jsonl'))) == []
@@ -0,0 +1,162 @@
+import datetime
+import decimal
+import os
+
+import pymysql.constants.FIELD_TYPE
+import pytest
+
+from nvim_mysql.results import (
+    FT, ResultSet, ResultsHistory, ResultsView, ResultsViewCache, display_value, format_results, results_size)
+
+
+HEADER = ['id', 'name', 'blob', 'amount', 'created']
+TYPES = [FT.LONG, FT.VAR_STRING, FT.BLOB, FT.NEWDECIMAL, FT.DATETIME]
+ROWS = [
+    (1, None, b'ab\ncd', decimal.Decimal('1.50'), datetime.datetime(2020, 1, 1)),
+    (22, 'x y\nz', b'\xff\xfe', '', None),
+]
+
+
+@pytest.fixture
+def results():
+    return {
+        'type': 'read',
+        'data': ResultSet.from_rows(HEADER, ROWS, TYPES),
+        'count': len(ROWS),
+        'warnings': [],
+    }
+
+
+def test_field_types_match_pymysql():
+    for name, value in vars(FT).items():
+        if name.isupper():
+            assert getattr(pymysql.constants.FIELD_TYPE, name) == value
+
+
+def test_display_strings_match_display_value():
+    rs = ResultSet.from_rows(HEADER, ROWS, TYPES)
+    for i, row in enumerate(ROWS):
+        assert rs.display_row(i) == [display_value(v) for v in row]
+
+
+def test_widths_are_updated_as_rows_arrive():
+    rs = ResultSet(HEADER, TYPES)
+    rs.append_rows(ROWS[:1])
+    assert rs.widths == [1, 4, 5, 4, 19]
+    rs.append_rows(ROWS[1:])
+    assert rs.widths == [2, 5, 6, 4, 19]
+
+
+def test_table(results):
+    assert format_results(results, 'table') == [
+        '+-----+-------+--------+---------+---------------------+',
+        '| #id | name  | blob   | #amount | @created            |',
+        '+-----+-------+--------+---------+---------------------+',
+        '| 1   | NULL  | ab cd  | 1.50    | 2020-01-01 00:00:00 |',
+        '| 22  | x y z | 0xfffe |         | NULL                |',
+        '+-----+-------+--------+---------+---------------------+',
+        '',
+        '2 row(s) in set, 5 col(s)',
+    ]
+
+
+def test_csv_keeps_line_breaks(results):
+    assert format_results(results, 'csv') == [
+        'id,name,blob,amount,created',
+        '1,,"ab',
+        'cd",1.50,2020-01-01 00:00:00',
+        '22,"x y',
+        'z",0xfffe,,',
+    ]
+
+
+def test_vertical(results):
+    assert format_results(results, 'vertical')[:7] == [
+        '***** row 1 *****',
+        '      #id: 1',
+        '     name: NULL',
+        '     blob: ab cd',
+        '  #amount: 1.50',
+        ' @created: 2020-01-01 00:00:00',
+        '',
+    ]
+
+
+def test_raw_column(results):
+    results['data'] = ResultSet.from_rows(['name'], [('a\nb',), (None,), ('',)])
+    assert format_results(results, 'raw_column') == ['a', 'b', 'NULL', '']
+
+
+def test_history_spills_and_reloads_results(results):
+    released = []
+    history = ResultsHistory(max_entries=5, max_size=results_size(results), on_release=released.append)
+    first = dict(results, id=1)
+    history.add({'results': first})
+    history.add({'results': dict(results, id=2)})
+
+    spilled = history.entries[0]
+    assert released == [spilled]
+    assert spilled['results'] is None
+    assert os.path.exists(spilled['spill_path'])
+
+    entry = history.back()
+    assert entry['results']['id'] == 1
+    assert format_results(entry['results']) == format_results(first)
+    assert history.entries[1]['results'] is None
+
+    spill_path = history.entries[1]['spill_path']
+    history.clear()
+    assert not os.path.exists(spill_path)
+
+
+def cached_view(results, format_):
+    view = ResultsView(format_results(results, format_))
+    view.take()
+    return view
+
+
+def test_view_cache_hit(results):
+    cache = ResultsViewCache(max_size=1024 * 1024)
+    view = cached_view(results, 'table')
+    cache.put((1, 'table'), view)
+    assert cache.get((1, 'table')) is view
+    assert cache.get((1, 'csv')) is None
+    assert cache.get((2, 'table')) is None
+
+
+def test_view_cache_evicts_least_recently_used(results):
+    size = cached_view(results, 'table').size
+    cache = ResultsViewCache(max_size=2 * size)
+    cache.put((1, 'table'), cached_view(results, 'table'))
+    cache.put((2, 'table'), cached_view(results, 'table'))
+    cache.get((1, 'table'))
+    cache.put((3, 'table'), cached_view(results, 'table'))
+    assert list(cache.views) == [(1, 'table'), (3, 'table')]
+
+    # A view that grows past the budget on its own is kept, but nothing else.
+    view = ResultsView(['x' * size] * 3)
+    cache.put((4, 'table'), view)
+    view.take()
+    cache.evict()
+    assert list(cache.views) == [(4, 'table')]
+
+
+def test_view_cache_discards_views_of_released_results(results):
+    cache = ResultsViewCache(max_size=1024 * 1024)
+    for key in [(1, 'table'), (1, 'csv'), (2, 'table')]:
+        cache.put(key, cached_view(results, key[1]))
+    cache.discard(1)
+    assert list(cache.views) == [(2, 'table')]
+    assert cache.get((1, 'csv')) is None
+
+
+@pytest.mark.parametrize('format_', ['table', 'csv', 'vertical', 'raw_column'])
+def test_disk_result_set_formats_like_in_memory(results, format_):
+    in_memory = format_results(results, format_)
+    data = results['data'] = results['data'].to_disk()
+    try:
+        assert data.on_disk
+        assert format_results(results, format_) == in_memory
+    finally:
+        data.close()
+    assert not os.path.exists(data.path)
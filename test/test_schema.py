@@ -0,0 +1,120 @@
+import os
+
+from nvim_mysql.schema import SchemaCache, prefetch, revalidate
+
+
+CATALOG = {
+    'SCHEMATA': [('school',), ('shop',)],
+    'TABLES': [('school', 'student'), ('school', 'teacher'), ('shop', 'item')],
+    'COLUMNS': [
+        ('school', 'student', 'id'),
+        ('school', 'student', 'name'),
+        ('school', 'teacher', 'id'),
+        ('shop', 'item', 'sku'),
+    ],
+}
+
+
+class FakeCursor(object):
+    def __init__(self, queries):
+        self.queries = queries
+
+    def execute(self, query, args=None):
+        self.queries.append(query)
+        self.table = query.split('information_schema.')[1].split()[0]
+        if args:
+            self.rows = [r for r in CATALOG[self.table] if r[0] in args[0]]
+        else:
+            self.rows = CATALOG[self.table]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self.queries)
+
+
+def no_cursor():
+    raise AssertionError("should have been served from the cache")
+
+
+def test_prefetch_fills_cache_in_batches():
+    conn = FakeConnection()
+    schema = SchemaCache(ttl=60)
+    prefetch(schema, conn, batch_size=1)
+
+    assert len(conn.queries) == 5
+    assert schema.databases(no_cursor) == ['school', 'shop']
+    assert schema.tables(no_cursor, 'school') == ['student', 'teacher']
+    assert schema.columns(no_cursor, 'school.student') == ['id', 'name']
+    assert schema.columns(no_cursor, 'shop.item') == ['sku']
+
+
+def test_unqualified_columns_use_default_database():
+    schema = SchemaCache(ttl=60)
+    prefetch(schema, FakeConnection())
+    schema.default_database = 'school'
+    assert schema.columns(no_cursor, 'teacher') == ['id']
+
+
+def test_prefetch_after_invalidation_is_discarded():
+    schema = SchemaCache(ttl=60)
+    conn = FakeConnection()
+    real_cursor = conn.cursor
+
+    def cursor():
+        schema.invalidate()
+        return real_cursor()
+
+    conn.cursor = cursor
+    prefetch(schema, conn)
+    assert schema.get(('databases',)) is None
+
+
+class MarkerConnection(FakeConnection):
+    marker = (3, '2020-01-01 00:00:00')
+
+    def cursor(self):
+        cursor = super(MarkerConnection, self).cursor()
+        if self.queries is not None:
+            cursor.fetchone = lambda: self.marker
+        return cursor
+
+
+def test_persisted_schema_is_revalidated_with_marker(tmp_path):
+    path = str(tmp_path / 'schema.json')
+    conn = MarkerConnection()
+    schema = SchemaCache(ttl=60)
+    revalidate(schema, conn, path)
+    assert len(conn.queries) == 4
+
+    # A new session loads the saved names; an unchanged marker means
+    # nothing else is fetched.
+    conn = MarkerConnection()
+    schema = SchemaCache(ttl=60)
+    assert schema.load(path)
+    assert schema.tables(no_cursor, 'shop') == ['item']
+    revalidate(schema, conn, path)
+    assert len(conn.queries) == 1
+
+    conn = MarkerConnection()
+    conn.marker = (4, '2020-02-01 00:00:00')
+    schema = SchemaCache(ttl=60)
+    schema.load(path)
+    revalidate(schema, conn, path)
+    assert len(conn.queries) == 4
+    assert schema.marker == ['4', '2020-02-01 00:00:00']
+
+
+def test_persisted_schema_is_private(tmp_path):
+    path = str(tmp_path / 'schema' / 'server.json')
+    schema = SchemaCache(ttl=60)
+    prefetch(schema, FakeConnection())
+    schema.save(path)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
@@ -0,0 +1,50 @@
+from nvim_mysql import Tree
+from nvim_mysql.schema import SchemaCache
+
+
+CATALOG = [('school', 'Student'), ('school', 'teacher'), ('shop', 'item'), ('shop', 'student_discount')]
+
+
+class FakeTab(object):
+    def __init__(self):
+        self.schema = SchemaCache(ttl=60)
+
+
+class FakeCursor(object):
+    queries = []
+
+    def execute(self, query):
+        self.queries.append(query)
+
+    def fetchall(self):
+        return CATALOG
+
+
+def test_tree_is_refreshed_from_cache_and_fetched_in_one_query():
+    tree = Tree(FakeTab())
+    assert tree.refresh_data()
+    assert tree.render() == []
+
+    tree.fetch(FakeCursor)
+    assert len(FakeCursor.queries) == 1
+    assert not tree.refresh_data()
+    assert tree.render() == [u'school ▸', u'shop ▸']
+
+    tree.open('shop')
+    assert not tree.refresh_data()
+    assert tree.render() == [u'school ▸', u'shop ▾', u'  item', u'  student_discount']
+
+
+def test_filter_narrows_incrementally():
+    tree = Tree(FakeTab())
+    tree.fetch(FakeCursor)
+    tree.refresh_data()
+
+    tree.set_filter('stu')
+    assert tree.render() == [u'school ▾', u'  Student', u'shop ▾', u'  student_discount']
+    tree.set_filter('STUDENT_')
+    assert tree.render() == [u'shop ▾', u'  student_discount']
+    tree.set_filter('e')
+    assert tree.render() == [u'school ▾', u'  Student', u'  teacher', u'shop ▾', u'  item', u'  student_discount']
+    tree.set_filter('')
+    assert tree.render() == [u'school ▸', u'shop ▸']
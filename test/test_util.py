@@ -0,0 +1,41 @@
+from nvim_mysql.util import get_parent_database_in_tree, get_queries_in_range, get_query_under_cursor
+
+
+class CountingBuffer(list):
+    """A buffer that counts how many lines are read from it (as over RPC)."""
+    def __init__(self, lines):
+        super(CountingBuffer, self).__init__(lines)
+        self.lines_read = 0
+
+    def __getitem__(self, index):
+        value = super(CountingBuffer, self).__getitem__(index)
+        self.lines_read += len(value) if isinstance(index, slice) else 1
+        return value
+
+
+def make_buffer(paragraphs):
+    lines = []
+    for _ in range(paragraphs):
+        lines.extend(['select *', 'from t', 'where x = 1;', ''])
+    return CountingBuffer(lines)
+
+
+def test_query_under_cursor_reads_a_bounded_number_of_lines():
+    for paragraphs in (10, 10000):
+        buf = make_buffer(paragraphs)
+        row = len(buf) // 2 + 1
+        assert get_query_under_cursor(buf, row, 0) == ('select *\nfrom t\nwhere x = 1;', 1)
+        assert buf.lines_read < 100
+
+
+def test_queries_in_range_reads_only_around_the_range():
+    buf = make_buffer(10000)
+    start = len(buf) // 2 + 1
+    assert get_queries_in_range(buf, start, start + 4) == ['select *\nfrom t\nwhere x = 1;'] * 2
+    assert buf.lines_read < 100
+
+
+def test_parent_database_in_tree_reads_a_bounded_number_of_lines():
+    buf = CountingBuffer([u'db ▸'] * 10000 + [u'big ▾'] + [u'  t'] * 10)
+    assert get_parent_database_in_tree(buf, len(buf) - 1) == ('big', True, 10000)
+    assert buf.lines_read < 100